@@ -1,162 +1,524 @@
-from flask import Flask, jsonify, request, g
-from datetime import datetime
+from flask import Blueprint, Flask, Response, jsonify, request, g, stream_with_context, make_response
+from flask.json.provider import DefaultJSONProvider
+from datetime import date, datetime
 from enum import Enum
-import sqlite3
-import yfinance as yf
+from contextlib import closing
+import json
 from flask_cors import CORS
+import functools
 import logging
-
-app = Flask(__name__)
-CORS(app, resources={r"/api/*": {"origins": ["http://localhost:3000", "http://127.0.0.1:3000"]}})
+import os
+import threading
+import time
+from db import connect, pool, to_epoch
+from market_data import get_provider, set_provider, quote_summary, MarketDataError, UnknownSymbolError
+from quote_cache import DEFAULT_FIELD_TTLS
+from response_cache import ResponseCache, etag
+from fundamentals import load_metadata, aggregate_stats
+from ledger import init_ledger, record_trade, portfolio_version, get_balance as ledger_balance
+from ingest import parse_csv, parse_json, ingest_trades
+from migrations import migrate
+from bars import get_bars, BarStoreError
+from streaming import PriceStreamer, POLL_INTERVAL
+from orders import MatchingEngine, OrderWatcher, create_order, cancel_order, WORKING
+from universe import SymbolUniverse, TickerValidator
+from fx import FXRates, pair_symbol, ACCOUNT_CURRENCY
+from trade import TradeType
+from metrics import (registry, span, start_request, server_timing, http_requests, http_duration, should_profile,
+                     start_profile, dump_profile, PROMETHEUS_MIMETYPE)
+from serialization import dumps, records, encode_rows, columnar, arrow_stream, JSON_MIMETYPE, ARROW_MIMETYPE
+from history import update_history
+
+# numpy, pandas, yfinance and the risk and Monte Carlo models are imported by
+# the handlers and backends that use them, so importing this module and
+# forking workers stays cheap. Nothing touches the database or starts a
+# thread at import time: create_app() builds the app, init_schema() brings
+# the database up to date once per process and background threads start with
+# the first request each process serves.
+#
+#     gunicorn --preload 'app:create_app()'
+#
+# runs create_app() and the schema init once in the master before forking.
+
+api = Blueprint('api', __name__)
+CORS_ORIGINS = ["http://localhost:3000", "http://127.0.0.1:3000"]
 logging.basicConfig(level=logging.INFO)
 
-start_amount = 100000
+# Services shared by every request in the process, created by init_services()
+market = None
+fx = None
+streamer = None
+engine = None
+universe = None
+validator = None
+response_cache = None
+order_watcher = None
+STREAM_KEEPALIVE = 15
+# /api/montecarlo runs on a request thread, so runs are capped at a few
+# seconds of work; larger ones belong in `python montecarlo.py --workers N`
+MONTE_CARLO_MAX_PATHS = 20000
+MONTE_CARLO_MAX_WORK = 100_000_000  # paths x steps x positions
+
+def init_services(provider=None):
+    """Create the market data provider, or install the given one, and the services that use it."""
+    global market, fx, streamer, engine, universe, validator, response_cache, order_watcher
+    if provider is not None:
+        set_provider(provider)
+    market = get_provider()
+    fx = FXRates(market)
+    streamer = PriceStreamer(market)
+    engine = MatchingEngine()
+    universe = SymbolUniverse()
+    validator = TickerValidator(universe, market)
+    response_cache = ResponseCache()
+    order_watcher = OrderWatcher(engine, market, connect, POLL_INTERVAL)
+
+_init_lock = threading.Lock()
+_schema_ready = False
+_background_pid = None
+
+def init_schema():
+    """
+    Bring the schema up to date and load the state the services start from.
+    Runs once per process; later calls return straight away.
+    """
+    global _schema_ready
+    with _init_lock:
+        if _schema_ready:
+            return
+        with closing(connect()) as conn:
+            migrate(conn)
+            init_ledger(conn)
+        # Listed symbols for validation and autocomplete
+        universe.load()
+        _schema_ready = True
+
+def start_background():
+    """
+    Start this process's background threads: the order watcher and the
+    re-reading of changed symbol listings. Threads do not survive a fork, so
+    each worker starts its own. Working orders are not loaded here or in
+    init_schema: the order watcher that holds the lease loads them, so only
+    one process matches them however many workers there are.
+    """
+    global _background_pid
+    if _background_pid == os.getpid():
+        return
+    with _init_lock:
+        if _background_pid == os.getpid():
+            return
+        order_watcher.wake()
+        universe.start()
+        _background_pid = os.getpid()
+
+def create_app(provider=None, init_db=True):
+    """
+    Build the Flask app. provider replaces the market data provider picked
+    from the environment; init_db=False leaves the schema alone, for a
+    database that init_schema() or `python migrations.py` already prepared.
+    """
+    if market is None or provider is not None:
+        init_services(provider)
+    if init_db:
+        init_schema()
+    app = Flask(__name__)
+    CORS(app, resources={r"/api/*": {"origins": CORS_ORIGINS}})
+    app.json = TimedJSONProvider(app)
+    app.register_blueprint(api)
+    return app
 
 class ActionType(Enum):
     BUY = "Buy"
     SELL = "Sell"
     SHORT = "Short"
 
-# Database connection
-def get_db_connection():
-    conn = sqlite3.connect('portfolio.db')
-    conn.row_factory = sqlite3.Row
-    return conn
-
-@app.before_request
-def open_connection():
-    g.db = get_db_connection()
-
-@app.teardown_request
-def close_connection(exception):
-    db = getattr(g, 'db', None)
-    if db is not None:
-        db.close()
-
-# Create tables
-with get_db_connection() as conn:
-    cursor = conn.cursor()
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS trades (
-        id INTEGER PRIMARY KEY,
-        asset TEXT,
-        quantity REAL,
-        time TEXT,
-        price REAL,
-        action TEXT
-    )
-    ''')
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS aggregated_trades (
-        asset TEXT PRIMARY KEY,
-        quantity REAL,
-        average_price REAL
-    )
-    ''')
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS portfolio_history (
-        date TEXT PRIMARY KEY,
-        quantity REAL,
-        average_price REAL
-    )
-    ''')
+# Database connection, borrowed from the per-thread pool the first time a
+# handler needs it
+def get_db():
+    if 'db' not in g:
+        g.db = pool.connection()
+    return g.db
+
+@api.teardown_app_request
+def release_connection(exception):
+    pool.release(g.pop('db', None))
+
+@api.before_app_request
+def ensure_background():
+    start_background()
+
+class TimedJSONProvider(DefaultJSONProvider):
+    # jsonify() bodies count as serialization time, like serialization.dumps
+    def dumps(self, obj, **kwargs):
+        with span('serialize'):
+            return super().dumps(obj, **kwargs)
+
+# Every request collects timing spans for provider calls, SQLite and JSON
+# encoding; they are returned in the Server-Timing header and aggregated on
+# /metrics. With PROFILE_REQUESTS set, requests sent with X-Profile are also
+# run under cProfile and the stats file is named in X-Profile-File.
+@api.before_app_request
+def start_instrumentation():
+    g.started = time.perf_counter()
+    g.spans = start_request()
+    if should_profile(request.headers):
+        g.profiler = start_profile()
+
+@api.after_app_request
+def finish_instrumentation(response):
+    elapsed = time.perf_counter() - g.pop('started', time.perf_counter())
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    http_requests.inc(request.method, route, str(response.status_code))
+    http_duration.observe(elapsed, route)
+    response.headers['Server-Timing'] = server_timing(g.pop('spans', {}), elapsed)
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        response.headers['X-Profile-File'] = dump_profile(profiler, f"{request.method}-{route}")
+    return response
+
+@api.teardown_app_request
+def stop_profiler(exception):
+    # after_request is skipped when a view's error propagates, and Python
+    # 3.12+ refuses to enable a second profiler while this one is running
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+
+@registry.collector
+def cache_metrics():
+    return [
+        ('market_data_cache_hits_total', 'counter', "Market data lookups served from the quote cache", market.hits),
+        ('market_data_cache_misses_total', 'counter', "Market data lookups that went upstream", market.misses),
+        ('fx_rate_fetches_total', 'counter', "Batched conversion rate fetches", fx.fetches),
+        ('working_orders', 'gauge', "Orders resting on this process's matching engine", len(engine)),
+        ('symbol_universe_size', 'gauge', "Symbols in the listing index", len(universe)),
+        ('ticker_validation_hits_total', 'counter', "Ticker checks answered without an upstream call", validator.hits),
+        ('ticker_validation_misses_total', 'counter', "Ticker checks that went upstream", validator.misses),
+        ('response_cache_hits_total', 'counter', "Portfolio reads served from the response cache", response_cache.hits),
+        ('response_cache_misses_total', 'counter', "Portfolio reads that ran their view", response_cache.misses),
+        ('response_cache_bytes', 'gauge', "Size of the cached response bodies", response_cache.size)
+    ]
+
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(registry.render(), mimetype=PROMETHEUS_MIMETYPE)
 
-    conn.commit()
+def parse_instrument(data):
+    """
+    Read the trade type and its pair or unit from a trade request. Currency
+    trades need base_currency and quote_currency and default their asset to
+    the pair symbol; stocks and commodities may name a quote_currency when
+    they are not priced in the account currency.
+    """
+    trade_type = TradeType(data.get('trade_type', TradeType.STOCK.value))
+    base_currency = (data.get('base_currency') or '').upper() or None
+    quote_currency = (data.get('quote_currency') or '').upper() or None
+    unit = data.get('unit') if trade_type == TradeType.COMMODITY else None
+    if trade_type == TradeType.CURRENCY:
+        if not (base_currency and quote_currency):
+            raise ValueError("currency trades need base_currency and quote_currency")
+        asset = data.get('asset') or pair_symbol(base_currency, quote_currency)
+    else:
+        base_currency = None
+        asset = data['asset']
+    return asset.upper(), trade_type, base_currency, quote_currency, unit
 
-@app.route('/api/maketrade', methods=['POST'])
+@api.route('/api/maketrade', methods=['POST'])
 def add_trade():
     try:
         data = request.json
-        asset = data['asset']
+        asset, trade_type, base_currency, quote_currency, unit = parse_instrument(data)
         quantity = float(data['quantity'])
         action = ActionType(data['action'])
-        stock = yf.Ticker(asset)
-        price = stock.info["currentPrice"]
-        time = datetime.now().isoformat()
-
-        cursor = g.db.cursor()
-        cursor.execute('''
-            INSERT INTO trades (asset, quantity, time, price, action)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (asset, quantity, time, price, action.value))
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f"Invalid trade: {e}"}), 400
 
-        cursor.execute('''
-            SELECT quantity, average_price FROM aggregated_trades WHERE asset = ?
-        ''', (asset,))
-        row = cursor.fetchone()
-
-        if row:
-            current_quantity, current_avg_price = row
-            if action == ActionType.BUY:
-                new_quantity = current_quantity + quantity
-                new_avg_price = ((current_avg_price * current_quantity) + (price * quantity)) / new_quantity
-            elif action == ActionType.SELL:
-                new_quantity = current_quantity - quantity
-                new_avg_price = current_avg_price
-
-            cursor.execute('''
-                UPDATE aggregated_trades
-                SET quantity = ?, average_price = ?
-                WHERE asset = ?
-            ''', (new_quantity, new_avg_price, asset))
+    try:
+        if trade_type == TradeType.STOCK:
+            price = market.field(asset, "currentPrice")
         else:
-            cursor.execute('''
-                INSERT INTO aggregated_trades (asset, quantity, average_price)
-                VALUES (?, ?, ?)
-            ''', (asset, quantity, price))
+            # FX pairs and futures have no currentPrice in their info; the
+            # batched quote carries their last price
+            quotes, errors = market.quotes([asset])
+            if asset not in quotes:
+                return jsonify({'error': f"No price for {asset}: {errors.get(asset)}"}), 400
+            price = quotes[asset]['Price']
+        fx_rate = fx.rate(quote_currency)
+        time = datetime.now().isoformat()
+
+        cursor = get_db().cursor()
+        record_trade(cursor, asset, quantity, time, price, action.value, trade_type.value,
+                     base_currency, quote_currency, unit, fx_rate)
 
-        g.db.commit()
+        get_db().commit()
         return jsonify({'message': 'Trade added successfully'}), 201
 
     except Exception as e:
         logging.error(f"Error adding trade: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
-@app.route('/api/tradehistory', methods=['GET'])
-def get_all_trades():
-    cursor = g.db.cursor()
-    cursor.execute('SELECT * FROM trades')
-    rows = cursor.fetchall()
-    trades = [
-        {
-            'id': row['id'],
-            'Asset': row['asset'],
-            'Quantity': row['quantity'],
-            'Time': row['time'],
-            'Price': row['price'],
-            'Action': row['action']
-        } for row in rows
-    ]
-    return jsonify(trades)
+ORDER_COLUMNS = 'id, asset, action, quantity, order_type, limit_price, stop_price, status, created_ts, fill_price, trade_id'
+ORDER_KEYS = ('id', 'Asset', 'Action', 'Quantity', 'Type', 'Limit Price', 'Stop Price', 'Status', 'Created',
+              'Fill Price', 'Trade Id')
+
+@api.route('/api/orders', methods=['POST'])
+def place_order():
+    """
+    Place a resting limit, stop or stop_limit order. Working orders are
+    matched against live prices in the background and fill into the ledger.
+    """
+    try:
+        data = request.json
+        limit_price = data.get('limit_price')
+        stop_price = data.get('stop_price')
+        cursor = get_db().cursor()
+        order = create_order(cursor, str(data.get('asset', '')).upper(), data.get('action'), float(data['quantity']),
+                             data.get('type'), float(limit_price) if limit_price is not None else None,
+                             float(stop_price) if stop_price is not None else None)
+        get_db().commit()
+    except (KeyError, TypeError, ValueError) as e:
+        get_db().rollback()
+        return jsonify({'error': f"Invalid order: {e}"}), 400
+
+    # The process holding the order-watcher lease picks the order up from
+    # the database; if that is this one, it does so now
+    order_watcher.wake()
+    return jsonify(order.to_dict()), 201
+
+@api.route('/api/orders', methods=['GET'])
+def list_orders():
+    status = request.args.get('status')
+    cursor = get_db().cursor()
+    cursor.row_factory = None
+    if status == 'working':
+        cursor.execute(f'SELECT {ORDER_COLUMNS} FROM orders WHERE status IN (?, ?) ORDER BY id', WORKING)
+    elif status:
+        cursor.execute(f'SELECT {ORDER_COLUMNS} FROM orders WHERE status = ? ORDER BY id', (status,))
+    else:
+        cursor.execute(f'SELECT {ORDER_COLUMNS} FROM orders ORDER BY id')
+    return Response(dumps(records(cursor.fetchall(), ORDER_KEYS)), mimetype=JSON_MIMETYPE)
+
+@api.route('/api/orders/<int:order_id>', methods=['DELETE'])
+def delete_order(order_id):
+    # The database decides: a fill or cancel that landed first, in any
+    # process, makes this a 409
+    cancelled = cancel_order(get_db().cursor(), order_id)
+    get_db().commit()
+    if not cancelled:
+        return jsonify({'error': 'Order is not working'}), 409
+    # This process's book may not hold the order; fills are guarded anyway
+    engine.cancel(order_id)
+    return jsonify({'message': 'Order cancelled'})
+
+@api.route('/api/trades/bulk', methods=['POST'])
+def add_trades_bulk():
+    # Accepts a JSON list of trades (or {"trades": [...]}) or a CSV body
+    try:
+        if request.is_json:
+            rows = parse_json(request.json)
+        else:
+            rows = parse_csv(request.get_data(as_text=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-@app.route('/api/aggregate', methods=['GET'])
+    try:
+        stats = ingest_trades(get_db(), rows)
+        logging.info(f"Imported {stats['rows']} trades at {stats['rows_per_sec']:.0f} rows/sec")
+        return jsonify({
+            'message': 'Trades added successfully',
+            'Rows': stats['rows'],
+            'Assets': stats['assets'],
+            'Seconds': stats['seconds'],
+            'RowsPerSec': stats['rows_per_sec']
+        }), 201
+
+    except Exception as e:
+        logging.error(f"Error importing trades: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+# The 52-week changes in /api/getaggstats come from quotes, so its cached
+# payload is also keyed on a window as long as they stay fresh in the quote cache
+AGGSTATS_MAX_AGE = DEFAULT_FIELD_TTLS['52WeekChange']
+
+def versioned(extra=None):
+    """
+    Cache a GET view's serialized response on the portfolio version and the
+    query string, plus extra() when given, and tag it with an ETag. A request
+    whose If-None-Match still matches gets a 304 without running the view;
+    the only database work is reading the version. Streamed responses are
+    tagged but not stored.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = (portfolio_version(get_db().cursor()), request.path, request.query_string,
+                   extra() if extra else None)
+            tag = etag(key)
+            if request.if_none_match.contains(tag):
+                response = Response(status=304)
+            else:
+                cached = response_cache.get(key)
+                if cached is not None:
+                    body, mimetype, headers = cached
+                    response = Response(body, mimetype=mimetype, headers=list(headers))
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    if not response.is_streamed:
+                        headers = [(name, value) for name, value in response.headers
+                                   if name not in ('Content-Type', 'Content-Length')]
+                        response_cache.set(key, response.get_data(), response.mimetype, headers)
+            response.set_etag(tag)
+            # Clients may keep the body but must revalidate it on every use
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
+
+HISTORY_PAGE_LIMIT = 1000
+HISTORY_BATCH_SIZE = 500
+
+# Trade rows are read as plain tuples in this column order and zipped with
+# the response keys, which is much cheaper than sqlite3.Row lookups
+TRADE_COLUMNS = 'id, asset, quantity, time, price, action, trade_type, base_currency, quote_currency, unit'
+TRADE_KEYS = ('id', 'Asset', 'Quantity', 'Time', 'Price', 'Action', 'Trade Type', 'Base Currency',
+              'Quote Currency', 'Unit')
+AGGREGATE_KEYS = ('Asset', 'Quantity', 'Average_Price', 'Trade Type', 'Quote Currency', 'Unit')
+RESPONSE_FORMATS = ('json', 'ndjson', 'columnar', 'arrow')
+
+def parse_time_param(value):
+    # Accept either epoch seconds or an ISO timestamp
+    try:
+        return float(value)
+    except ValueError:
+        return to_epoch(value)
+
+def trade_filters(args):
+    clauses, params = [], []
+    if args.get('asset'):
+        clauses.append('asset = ?')
+        params.append(args['asset'])
+    if args.get('action'):
+        clauses.append('action = ?')
+        params.append(ActionType(args['action']).value)
+    if args.get('start'):
+        clauses.append('ts >= ?')
+        params.append(parse_time_param(args['start']))
+    if args.get('end'):
+        clauses.append('ts < ?')
+        params.append(parse_time_param(args['end']))
+    if args.get('cursor'):
+        clauses.append('id > ?')
+        params.append(int(args['cursor']))
+    return clauses, params
+
+def stream_trades(cursor, fmt):
+    # Rows are pulled in small batches, so memory stays flat however long the
+    # history is, and each batch is encoded in one call
+    if fmt != 'ndjson':
+        yield b'['
+    first = True
+    while True:
+        rows = cursor.fetchmany(HISTORY_BATCH_SIZE)
+        if not rows:
+            break
+        if fmt == 'ndjson':
+            yield b''.join(dumps(trade) + b'\n' for trade in records(rows, TRADE_KEYS))
+        else:
+            yield (b'' if first else b',') + encode_rows(rows, TRADE_KEYS)
+            first = False
+    if fmt != 'ndjson':
+        yield b']'
+
+def columnar_response(rows, keys, fmt, next_cursor=None):
+    # One list per column, as JSON or as an Arrow IPC stream
+    columns = columnar(rows, keys)
+    if fmt == 'arrow':
+        try:
+            response = Response(arrow_stream(columns), mimetype=ARROW_MIMETYPE)
+        except ImportError:
+            return jsonify({"error": "format=arrow needs pyarrow installed on the server"}), 406
+    else:
+        response = Response(dumps(columns), mimetype=JSON_MIMETYPE)
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+    return response
+
+@api.route('/api/tradehistory', methods=['GET'])
+@versioned()
+def get_all_trades():
+    """
+    Without a limit the whole history is streamed, as a JSON array or as NDJSON
+    with format=ndjson. With limit, one page is returned together with the
+    cursor for the next one (keyset pagination on id). format=columnar or
+    format=arrow return one list per column instead, with the next cursor in
+    the X-Next-Cursor header. asset, action, start and end filter every mode.
+    """
+    try:
+        clauses, params = trade_filters(request.args)
+        limit = request.args.get('limit')
+        limit = int(limit) if limit is not None else None
+    except ValueError as e:
+        return jsonify({"error": f"Invalid filter: {str(e)}"}), 400
+    fmt = request.args.get('format', 'json')
+    if fmt not in RESPONSE_FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(RESPONSE_FORMATS)}"}), 400
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    cursor = get_db().cursor()
+    cursor.row_factory = None
+
+    if limit is not None:
+        limit = max(1, min(limit, HISTORY_PAGE_LIMIT))
+        cursor.execute(f'SELECT {TRADE_COLUMNS} FROM trades {where} ORDER BY id LIMIT ?', params + [limit + 1])
+        rows = cursor.fetchall()
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        if fmt in ('columnar', 'arrow'):
+            return columnar_response(rows[:limit], TRADE_KEYS, fmt, next_cursor)
+        return Response(dumps({"trades": records(rows[:limit], TRADE_KEYS), "next_cursor": next_cursor}),
+                        mimetype=JSON_MIMETYPE)
+
+    cursor.execute(f'SELECT {TRADE_COLUMNS} FROM trades {where} ORDER BY id', params)
+    if fmt in ('columnar', 'arrow'):
+        return columnar_response(cursor.fetchall(), TRADE_KEYS, fmt)
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else JSON_MIMETYPE
+    return Response(stream_with_context(stream_trades(cursor, fmt)), mimetype=mimetype)
+
+@api.route('/api/aggregate', methods=['GET'])
+@versioned()
 def get_aggregated_trades():
-    cursor = g.db.cursor()
-    cursor.execute('SELECT * FROM aggregated_trades')
+    fmt = request.args.get('format', 'json')
+    if fmt not in ('json', 'columnar', 'arrow'):
+        return jsonify({"error": "format must be one of json, columnar, arrow"}), 400
+    cursor = get_db().cursor()
+    cursor.row_factory = None
+    cursor.execute('''
+        SELECT a.asset, a.quantity, a.average_price, COALESCE(i.trade_type, 'Stock'), i.quote_currency, i.unit
+        FROM aggregated_trades a LEFT JOIN instruments i ON i.asset = a.asset
+    ''')
     rows = cursor.fetchall()
-    aggregated = [
-        {
-            'Asset': row['asset'],
-            'Quantity': row['quantity'],
-            'Average_Price': row['average_price']
-        } for row in rows
-    ]
-    return jsonify(aggregated)
+    if fmt != 'json':
+        return columnar_response(rows, AGGREGATE_KEYS, fmt)
+    return Response(dumps(records(rows, AGGREGATE_KEYS)), mimetype=JSON_MIMETYPE)
 
 def is_valid_ticker(symbol):
     """
-    Check if a stock ticker is valid by verifying it has historical data.
+    Check if a stock ticker is valid: listed in the symbol universe, or known
+    to have historical data from a recent, cached upstream check.
     """
+    return validator.is_valid(symbol)
+
+@api.route('/api/symbols', methods=['GET'])
+def search_symbols():
+    """Autocomplete for ?q=: symbols starting with q, then companies with a name word starting with it."""
     try:
-        stock = yf.Ticker(symbol)
-        history = stock.history(period="1d")  # Fetch 1 day of history
-        if history.empty:
-            return False
-        return True
-    except Exception:
-        return False
-    
-@app.route('/api/getdata', methods=['GET', 'POST'])
+        limit = max(1, min(int(request.args.get('limit', 10)), 100))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    return jsonify([{"Symbol": symbol, "Name": name} for symbol, name in universe.search(request.args.get('q', ''), limit)])
+
+@api.route('/api/getdata', methods=['GET', 'POST'])
 def get_data():
     # Get the request JSON body
     specs = request.json
@@ -167,18 +529,26 @@ def get_data():
 
     ticker_symbol = specs['Ticker']
 
-    # Check if the ticker is valid
-    if not is_valid_ticker(ticker_symbol):
+    # Serve bars from the local store, fetching only what is missing upstream
+    try:
+        bars = get_bars(get_db(), market, ticker_symbol, specs['Period'], specs['Interval'])
+    except BarStoreError as e:
+        return jsonify({"error": str(e)}), 400
+    except UnknownSymbolError:
         return jsonify({"error": f"Invalid ticker symbol: {ticker_symbol}"}), 400
+    except Exception as e:
+        logging.error(f"Error fetching history for {ticker_symbol}: {e}")
+        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
-    # Fetch historical data
-    stock = yf.Ticker(ticker_symbol)
-    history = stock.history(period=specs['Period'], interval=specs['Interval'])['Close']
-    history_dict = {str(date): price for date, price in history.items()}
+    # A ticker without any history is not a valid ticker
+    if not bars:
+        return jsonify({"error": f"Invalid ticker symbol: {ticker_symbol}"}), 400
+
+    history_dict = {bar['Date']: bar['Close'] for bar in bars}
 
     return jsonify(history_dict), 200
 
-@app.route('/api/getassetprice', methods=['GET', 'POST'])
+@api.route('/api/getassetprice', methods=['GET', 'POST'])
 def get_asset_price():
     try:
         # Ensure the request body is JSON
@@ -194,8 +564,7 @@ def get_asset_price():
         ticker = specs['Ticker']
         
         # Fetch stock data
-        stock = yf.Ticker(ticker)
-        price = stock.info["currentPrice"]
+        price = market.field(ticker, "currentPrice")
 
         return jsonify({"Price": price}), 200
     
@@ -203,7 +572,7 @@ def get_asset_price():
         # Log the error and return a generic message
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
-@app.route('/api/getchange', methods=['GET', 'POST'])
+@api.route('/api/getchange', methods=['GET', 'POST'])
 def get_change():
     try:
         # Ensure the request body is JSON
@@ -217,14 +586,11 @@ def get_change():
             return jsonify({"error": "Ticker symbol is required"}), 400
 
         ticker = specs['Ticker']
-        stock = yf.Ticker(ticker)
-        info = stock.info
-        current_price = info['currentPrice']  # Current market price
-        previous_close = info['regularMarketPreviousClose']  # Previous close price
+        current_price, previous_close, year_change = market.fields(
+            ticker, 'currentPrice', 'regularMarketPreviousClose', '52WeekChange')
 
         # Calculate daily percentage change
         daily_percent_change = ((current_price - previous_close) / previous_close)
-        year_change = info['52WeekChange']
 
         return jsonify({"Day": daily_percent_change, "Year" : year_change}), 200
     
@@ -232,48 +598,250 @@ def get_change():
         # Log the error and return a generic message
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
-@app.route('/api/getbalance', methods=['GET'])
+@api.route('/api/quotes', methods=['GET', 'POST'])
+def get_quotes():
+    # Tickers come either as a JSON list or a comma separated query parameter
+    if request.is_json:
+        tickers = (request.json or {}).get('Tickers', [])
+    else:
+        tickers = request.args.get('tickers', '').split(',')
+    tickers = [ticker.strip().upper() for ticker in tickers if ticker and ticker.strip()]
+
+    if not tickers:
+        return jsonify({"error": "At least one ticker symbol is required"}), 400
+
+    try:
+        quotes, errors = market.quotes(tickers)
+    except Exception as e:
+        logging.error(f"Error fetching quotes: {e}")
+        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
+
+    result = {}
+    for ticker in tickers:
+        if ticker in quotes:
+            result[ticker] = quote_summary(quotes[ticker])
+        else:
+            result[ticker] = {"error": errors.get(ticker, "No quote available")}
+
+    return jsonify(result), 200
+
+@api.route('/api/stream', methods=['GET'])
+def stream_prices():
+    """
+    Server-Sent Events stream of quotes for ?tickers=AAPL,MSFT. Each event
+    carries only the symbols whose quote changed since the last one.
+    """
+    tickers = [ticker.strip().upper() for ticker in request.args.get('tickers', '').split(',') if ticker.strip()]
+    if not tickers:
+        return jsonify({"error": "At least one ticker symbol is required"}), 400
+
+    subscription = streamer.subscribe(tickers)
+
+    def events():
+        try:
+            yield f"retry: {int(streamer.interval * 1000)}\n\n"
+            while True:
+                updates = subscription.get(timeout=STREAM_KEEPALIVE)
+                if updates:
+                    yield f"event: quotes\ndata: {json.dumps(updates)}\n\n"
+                else:
+                    yield ": keepalive\n\n"
+        finally:
+            # Runs when the client disconnects
+            streamer.unsubscribe(subscription)
+
+    response = Response(events(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@api.route('/api/getbalance', methods=['GET'])
+@versioned()
 def get_balance():
-    balance = start_amount
-    cursor = g.db.cursor()
-    cursor.execute("SELECT * FROM trades")
-    rows = cursor.fetchall()
-    balance += sum(row['quantity'] * row['price'] * (2* (row['action'] != "Buy") - 1) for row in rows)
+    balance = ledger_balance(get_db().cursor())
     return jsonify({"Balance" : balance})
 
-@app.route('/api/getaggstats', methods=['GET'])
-def get_agg_stats():
-    cursor = g.db.cursor()
-    cursor.execute('SELECT * FROM aggregated_trades')
+@api.route('/api/valuation', methods=['GET'])
+def get_valuation():
+    """
+    Mark every open position to market in its quote currency and in the
+    account currency. Prices come from one batched quote call and conversion
+    rates from one batched FX lookup, applied to all positions as arrays.
+    """
+    import numpy as np
+
+    cursor = get_db().cursor()
+    cursor.execute('''
+        SELECT a.asset, a.quantity, a.average_price, COALESCE(i.trade_type, 'Stock'), i.quote_currency
+        FROM aggregated_trades a LEFT JOIN instruments i ON i.asset = a.asset
+        WHERE a.quantity != 0 ORDER BY a.asset
+    ''')
     rows = cursor.fetchall()
-    industries = {}
-    sectors = {}
-    total = 0
-    for row in rows:
-        stock = yf.Ticker(row['asset'])
-        sec = stock.info['sector']
-        change = stock.info['52WeekChange']
-        total += row['quantity'] * row['average_price']
-        if sec not in sectors:
-            sectors[sec] = {}
-        sectors[sec]["value"] = sectors[sec].get("value", 0) + (row['quantity'] * row['average_price'])
-        sectors[sec]["change"] = sectors[sec].get("change", 0) + (row['quantity'] * row['average_price'] * change)
-        ind = stock.info['industry']
-        if sec not in industries:
-            industries[sec] = {}
-        industries[sec][ind] = industries[sec].get(ind, 0) + (row['quantity'] * row['average_price'])
-
-    for key in sectors:
-        sectors[key]["change"] /= sectors[key]["value"]
-        sectors[key]["value"] /= total
-    
-    for key in industries:
-        for x in industries[key]:
-            industries[key][x] /= total            
+    assets = [row[0] for row in rows]
+    quantities = np.array([row[1] for row in rows], dtype=np.float64)
+    average_prices = np.array([row[2] for row in rows], dtype=np.float64)
+    currencies = [row[4] or ACCOUNT_CURRENCY for row in rows]
+
+    quotes, errors = market.quotes(assets)
+    if errors:
+        logging.warning(f"No price for {', '.join(sorted(errors))}; valuing at average price")
+    prices = np.array([quotes[asset]['Price'] if asset in quotes else avg for asset, avg in zip(assets, average_prices)],
+                      dtype=np.float64)
+    try:
+        local_values = quantities * prices
+        values = fx.convert(local_values, currencies)
+        costs = fx.convert(quantities * average_prices, currencies)
+    except MarketDataError as e:
+        return jsonify({"error": str(e)}), 502
+
+    cash = ledger_balance(cursor)
+    positions = [{
+        "Asset": asset,
+        "Trade Type": row[3],
+        "Currency": currency,
+        "Quantity": row[1],
+        "Price": float(price),
+        "Value": float(local_value),
+        "Account Value": float(value),
+        "Unrealized PnL": float(value - cost)
+    } for asset, row, currency, price, local_value, value, cost
+        in zip(assets, rows, currencies, prices, local_values, values, costs)]
+    return jsonify({
+        "Currency": ACCOUNT_CURRENCY,
+        "Cash": cash,
+        "Positions Value": float(values.sum()),
+        "Total Value": cash + float(values.sum()),
+        "Positions": positions
+    })
+
+_history_lock = threading.Lock()
+_history_key = None
+
+def catch_up_history():
+    """
+    Bring the value history up to yesterday from the stored closes; `python
+    history.py` also syncs the closes from the market data provider. Runs
+    only when the portfolio version or the date changed since the last run
+    in this process, so most requests pay for one small read.
+    """
+    global _history_key
+    key = (portfolio_version(get_db().cursor()), date.today())
+    if key == _history_key:
+        return
+    with _history_lock:
+        if key == _history_key:
+            return
+        try:
+            update_history(get_db())
+            _history_key = key
+        except Exception as e:
+            get_db().rollback()
+            logging.error(f"Error updating portfolio history: {e}")
+
+@api.route('/api/portfoliohistory', methods=['GET'])
+def get_portfolio_history():
+    try:
+        start = datetime.fromisoformat(request.args['start']).date().isoformat() if 'start' in request.args else ''
+        end = datetime.fromisoformat(request.args['end']).date().isoformat() if 'end' in request.args else '9999-12-31'
+    except ValueError:
+        return jsonify({"error": "start and end must be ISO dates"}), 400
 
+    catch_up_history()
+    cursor = get_db().cursor()
+    cursor.execute('''
+        SELECT date, cash, cost_basis, market_value, total_value, trade_count FROM portfolio_history
+        WHERE date >= ? AND date <= ? ORDER BY date
+    ''', (start, end))
+    history = [{
+        "Date": row[0],
+        "Cash": row[1],
+        "Cost Basis": row[2],
+        "Market Value": row[3],
+        "Total Value": row[4],
+        "Trade Count": row[5]
+    } for row in cursor.fetchall()]
+
+    if request.args.get('holdings') in ('1', 'true'):
+        by_date = {snapshot["Date"]: snapshot for snapshot in history}
+        for snapshot in history:
+            snapshot["Holdings"] = []
+        cursor.execute('''
+            SELECT date, asset, quantity, average_price, close, market_value FROM portfolio_holdings
+            WHERE date >= ? AND date <= ? ORDER BY date, asset
+        ''', (start, end))
+        for row in cursor.fetchall():
+            by_date[row[0]]["Holdings"].append({
+                "Asset": row[1],
+                "Quantity": row[2],
+                "Average Price": row[3],
+                "Close": row[4],
+                "Market Value": row[5]
+            })
+    return jsonify(history)
+
+@api.route('/api/risk', methods=['GET'])
+def get_risk():
+    try:
+        as_of = datetime.fromisoformat(request.args['asof']).date() if 'asof' in request.args else None
+        confidence = float(request.args.get('confidence', 0.95))
+        window = int(request.args.get('window', 21))
+    except ValueError:
+        return jsonify({"error": "asof must be an ISO date, confidence a number and window an integer"}), 400
+    if not 0 < confidence < 1 or window < 2:
+        return jsonify({"error": "confidence must be between 0 and 1 and window at least 2"}), 400
+
+    from risk import portfolio_risk, DEFAULT_BENCHMARK
+    benchmark = request.args.get('benchmark', DEFAULT_BENCHMARK).upper()
+    return jsonify(portfolio_risk(get_db(), market, as_of, benchmark, confidence, window))
+
+@api.route('/api/montecarlo', methods=['GET'])
+def get_monte_carlo():
+    try:
+        paths = int(request.args.get('paths', 10000))
+        steps = int(request.args.get('steps', 252))
+        seed = int(request.args.get('seed', 0))
+        confidence = float(request.args.get('confidence', 0.95))
+    except ValueError:
+        return jsonify({"error": "paths, steps and seed must be integers and confidence a number"}), 400
+    from montecarlo import simulate, load_book, METHODS
+    method = request.args.get('method', 'cholesky')
+    if method not in METHODS or not 0 < paths <= MONTE_CARLO_MAX_PATHS or not 0 < steps <= 2520 or not 0 < confidence < 1:
+        return jsonify({"error": f"method must be one of {', '.join(METHODS)}, paths between 1 and "
+                                 f"{MONTE_CARLO_MAX_PATHS}, steps between 1 and 2520 and confidence between 0 and 1"}), 400
+
+    symbols, returns, exposures = load_book(get_db(), provider=market)
+    if not symbols:
+        return jsonify({"error": "No open positions to simulate"}), 400
+    if paths * steps * len(symbols) > MONTE_CARLO_MAX_WORK:
+        return jsonify({"error": f"paths x steps x positions is limited to {MONTE_CARLO_MAX_WORK:,}; "
+                                 "run larger simulations with montecarlo.py"}), 400
+    try:
+        result = simulate(returns, exposures, paths, steps, method, seed, confidence)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    result['symbols'] = symbols
+    return jsonify(result)
+
+@api.route('/api/getaggstats', methods=['GET'])
+@versioned(lambda: int(time.time() // AGGSTATS_MAX_AGE))
+def get_agg_stats():
+    cursor = get_db().cursor()
+    cursor.execute('SELECT asset, quantity, average_price FROM aggregated_trades')
+    positions = [tuple(row) for row in cursor.fetchall()]
+    symbols = [asset for asset, _, _ in positions]
+
+    # Sector/industry come from the persistent metadata table, the 52-week
+    # changes from one batched quote call
+    metadata = load_metadata(get_db(), symbols, market)
+    quotes, errors = market.quotes(symbols)
+    for symbol, error in errors.items():
+        logging.warning(f"No 52-week change for {symbol}: {error}")
+    changes = {symbol: quote['Year'] for symbol, quote in quotes.items()}
+
+    industries, sectors = aggregate_stats(positions, metadata, changes)
     return jsonify({"industries": industries, "sectors": sectors})
 
-@app.route('/api/getstockinfo', methods=['GET', 'POST'])
+@api.route('/api/getstockinfo', methods=['GET', 'POST'])
 def get_stock_info():
     # Get the request JSON body
     specs = request.json
@@ -289,13 +857,12 @@ def get_stock_info():
         return jsonify({"error": f"Invalid ticker symbol: {ticker_symbol}"}), 400
 
     # Fetch historical data
-    stock = yf.Ticker(ticker_symbol)
-    recs = stock.get_recommendations().to_dict()
-    info = stock.info
+    recs = market.recommendations(ticker_symbol)
+    info = market.info(ticker_symbol)
 
     return jsonify({"info" : info, "recommendations" : recs})
 
-@app.before_request
+@api.before_app_request
 def handle_preflight():
     if request.method == "OPTIONS":
         response = Flask.response_class()
@@ -304,9 +871,9 @@ def handle_preflight():
         response.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization"
         return response
 
-@app.route('/')
+@api.route('/')
 def home():
     return "<h1>Welcome to the Flask App</h1><p>Available endpoints:</p><ul><li><a href='/api/tradehistory'>/api/tradehistory</a></li><li><a href='/api/aggregate'>/api/aggregate</a></li></ul>"
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -0,0 +1,343 @@
+"""
+ASGI entry point. Every route is served by the Flask app, so payloads and
+errors are the same in both modes. The routes that wait on market data run it
+on a large upstream thread pool rather than the general WSGI pool, so slow
+quotes do not starve the other routes. /api/getaggstats is served natively on
+the event loop: its sector lookups and quote call go upstream concurrently
+and its SQLite work runs on a small dedicated executor.
+
+    uvicorn asgi:app --port 5000
+"""
+import asyncio
+import contextvars
+import functools
+import io
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.exceptions import InternalServerError
+from werkzeug.http import parse_etags
+
+import app as webapp
+from app import CORS_ORIGINS, AGGSTATS_MAX_AGE
+from db import pool
+from ledger import portfolio_version
+from fundamentals import read_metadata, fetch_metadata, store_metadata, aggregate_stats
+from metrics import start_request, server_timing, http_requests, http_duration
+from response_cache import etag
+
+DB_WORKERS = int(os.environ.get('ASGI_DB_WORKERS', 4))
+UPSTREAM_WORKERS = int(os.environ.get('ASGI_UPSTREAM_WORKERS', 64))
+WSGI_WORKERS = int(os.environ.get('ASGI_WSGI_WORKERS', 16))
+
+flask_app = webapp.create_app()
+market, response_cache = webapp.market, webapp.response_cache
+
+# Chunks of a streamed Flask response buffered ahead of a slow client
+WSGI_QUEUE_SIZE = 8
+
+db_executor = ThreadPoolExecutor(DB_WORKERS, thread_name_prefix='sqlite')
+upstream_executor = ThreadPoolExecutor(UPSTREAM_WORKERS, thread_name_prefix='upstream')
+wsgi_executor = ThreadPoolExecutor(WSGI_WORKERS, thread_name_prefix='wsgi')
+
+
+def _run_in(executor, fn, *args):
+    # Run in a copy of the caller's context so spans land on the right request
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(executor, functools.partial(contextvars.copy_context().run, fn, *args))
+
+
+def _with_connection(fn, *args):
+    conn = pool.connection()
+    try:
+        return fn(conn, *args)
+    finally:
+        pool.release(conn)
+
+
+async def db(fn, *args):
+    """Await fn(conn, *args) on the SQLite executor with that thread's pooled connection."""
+    return await _run_in(db_executor, _with_connection, fn, *args)
+
+
+async def upstream(fn, *args):
+    """Await a blocking market data call on the upstream pool."""
+    return await _run_in(upstream_executor, fn, *args)
+
+
+class Request:
+    __slots__ = ('method', 'path', 'query_string', 'headers')
+
+    def __init__(self, scope):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.query_string = scope.get('query_string', b'')
+        self.headers = {key.decode('latin-1').lower(): value.decode('latin-1') for key, value in scope['headers']}
+
+
+def json_response(obj, status=200):
+    # Encoded by jsonify's provider, so the bodies match the Flask app byte for byte
+    response = flask_app.json.response(obj)
+    return status, response.get_data(), response.mimetype
+
+
+def _positions(conn):
+    cursor = conn.cursor()
+    cursor.execute('SELECT asset, quantity, average_price FROM aggregated_trades')
+    return [tuple(row) for row in cursor.fetchall()]
+
+
+def _version(conn):
+    return portfolio_version(conn.cursor())
+
+
+async def versioned(request, extra, view):
+    """
+    The Flask app's @versioned for a native handler, sharing its response
+    cache: the same key, ETag and 304 handling.
+    """
+    key = (await db(_version), request.path, request.query_string, extra)
+    tag = etag(key)
+    headers = [('ETag', f'"{tag}"'), ('Cache-Control', 'no-cache')]
+    if parse_etags(request.headers.get('if-none-match')).contains(tag):
+        return 304, b'', None, headers
+    cached = response_cache.get(key)
+    if cached is not None:
+        body, mimetype, cached_headers = cached
+        return 200, body, mimetype, list(cached_headers) + headers
+    status, body, mimetype = await view(request)
+    if status != 200:
+        return status, body, mimetype
+    response_cache.set(key, body, mimetype)
+    return status, body, mimetype, headers
+
+
+async def get_agg_stats(request):
+    return await versioned(request, int(time.time() // AGGSTATS_MAX_AGE), _agg_stats)
+
+
+async def _agg_stats(request):
+    positions = await db(_positions)
+    symbols = list(dict.fromkeys(asset for asset, _, _ in positions))
+    now = time.time()
+    metadata = await db(read_metadata, symbols, now)
+
+    # Missing sector lookups and the 52-week changes all go upstream at once
+    missing = [symbol for symbol in symbols if symbol not in metadata]
+    fetched, (quotes, errors) = await asyncio.gather(
+        asyncio.gather(*(upstream(fetch_metadata, market, symbol) for symbol in missing)),
+        upstream(market.quotes, symbols))
+    if fetched:
+        metadata.update(await db(store_metadata, fetched, now))
+    for symbol, error in errors.items():
+        logging.warning(f"No 52-week change for {symbol}: {error}")
+    changes = {symbol: quote['Year'] for symbol, quote in quotes.items()}
+
+    industries, sectors = await asyncio.to_thread(aggregate_stats, positions, metadata, changes)
+    return json_response({"industries": industries, "sectors": sectors})
+
+
+# Served on the event loop; everything else goes to the Flask app
+ROUTES = {
+    '/api/getaggstats': get_agg_stats,
+}
+
+# Flask routes that block on market data, run on the upstream pool
+UPSTREAM_ROUTES = {'/api/getassetprice', '/api/getchange', '/api/quotes', '/api/getstockinfo'}
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+def _cors_headers(request):
+    # What flask-cors adds for the same origins
+    origin = request.headers.get('origin')
+    if origin in CORS_ORIGINS:
+        return [(b'access-control-allow-origin', origin.encode()), (b'vary', b'Origin')]
+    return []
+
+
+async def _native(handler, request, send):
+    started = time.perf_counter()
+    spans = start_request()
+    try:
+        status, body, mimetype, *extra = await handler(request)
+    except Exception as e:
+        logging.error(f"Error handling {request.path}: {e}")
+        # The page Flask serves for an unhandled exception
+        error = InternalServerError().get_response()
+        (status, body, mimetype), extra = (500, error.get_data(), error.mimetype), ()
+    elapsed = time.perf_counter() - started
+    http_requests.inc(request.method, request.path, str(status))
+    http_duration.observe(elapsed, request.path)
+    headers = [(b'content-length', str(len(body)).encode()),
+               (b'server-timing', server_timing(spans, elapsed).encode())] + _cors_headers(request)
+    if mimetype is not None:
+        headers.append((b'content-type', mimetype.encode()))
+    for name, value in (extra[0] if extra else ()):
+        headers.append((name.lower().encode('latin-1'), value.encode('latin-1')))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def _environ(scope, body):
+    host, port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': host,
+        'SERVER_PORT': str(port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for key, value in scope['headers']:
+        name = key.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            name = f'HTTP_{name}'
+            environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+async def _wsgi(scope, receive, send, body, executor=wsgi_executor):
+    """
+    Run the Flask app for one request on the WSGI pool. The call, the body
+    iteration and close() all happen on the same thread, as Flask expects for
+    streamed responses; chunks are handed to the event loop through a bounded
+    queue, and a client disconnect stops the iteration at the next chunk.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(WSGI_QUEUE_SIZE)
+    disconnected = threading.Event()
+    done = object()
+
+    def put(item):
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def run():
+        try:
+            def start_response(status, headers, exc_info=None):
+                put((int(status.split(' ', 1)[0]),
+                     [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]))
+                return lambda data: put(bytes(data))
+
+            iterable = flask_app(_environ(scope, body), start_response)
+            try:
+                for chunk in iterable:
+                    if disconnected.is_set():
+                        break
+                    if chunk:
+                        put(bytes(chunk))
+            finally:
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+        except BaseException as e:
+            put(e)
+        else:
+            put(done)
+
+    async def watch():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected.set()
+
+    worker = loop.run_in_executor(executor, run)
+    watcher = asyncio.ensure_future(watch())
+    try:
+        started = False
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                if not started:
+                    logging.error(f"Error handling {scope['path']}: {item}")
+                    await send({'type': 'http.response.start', 'status': 500,
+                                'headers': [(b'content-type', b'text/plain')]})
+                    await send({'type': 'http.response.body', 'body': b'Internal Server Error'})
+                return
+            if isinstance(item, tuple):
+                started = True
+                await send({'type': 'http.response.start', 'status': item[0], 'headers': item[1]})
+            else:
+                await send({'type': 'http.response.body', 'body': item, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        disconnected.set()
+        watcher.cancel()
+        # Let the worker finish its last put so it is not left blocked
+        while not worker.done():
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                await asyncio.sleep(0.01)
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                webapp.start_background()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for executor in (db_executor, upstream_executor, wsgi_executor):
+                    executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+
+    body = await _read_body(receive)
+    if body is None:
+        return
+    handler = ROUTES.get(scope['path'])
+    if handler is not None and scope['method'] == 'GET':
+        await _native(handler, Request(scope), send)
+    elif scope['path'] in UPSTREAM_ROUTES:
+        await _wsgi(scope, receive, send, body, upstream_executor)
+    else:
+        await _wsgi(scope, receive, send, body)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Serve the app over ASGI with uvicorn")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args(argv)
+    try:
+        import uvicorn
+    except ImportError:
+        print("asgi.py needs an ASGI server: pip install uvicorn", file=sys.stderr)
+        return 1
+    uvicorn.run(app, host=args.host, port=args.port)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,204 @@
+import numpy as np
+
+from portfolio import Portfolio, ActionType, ACTION_CODES
+
+BUY = ACTION_CODES[ActionType.BUY]
+SELL = ACTION_CODES[ActionType.SELL]
+
+
+class PriceSource:
+    """
+    Supplies historical closes to the backtester instead of live lookups.
+    load() returns (timestamps, closes) where closes is a (bars x symbols)
+    array aligned with the requested symbols, NaN where a symbol has no bar.
+    """
+
+    def load(self, symbols, start=None, end=None):
+        raise NotImplementedError
+
+
+class ArrayPriceSource(PriceSource):
+    """Price source over in-memory arrays, e.g. synthetic or preloaded data."""
+
+    def __init__(self, timestamps, closes, symbols):
+        self.timestamps = np.asarray(timestamps, dtype=np.float64)
+        self.closes = np.asarray(closes, dtype=np.float64)
+        self.index = {symbol: i for i, symbol in enumerate(symbols)}
+
+    def load(self, symbols, start=None, end=None):
+        mask = np.ones(len(self.timestamps), dtype=bool)
+        if start is not None:
+            mask &= self.timestamps >= start
+        if end is not None:
+            mask &= self.timestamps < end
+        columns = [self.index[symbol] for symbol in symbols]
+        return self.timestamps[mask], self.closes[mask][:, columns]
+
+
+class BarStorePriceSource(PriceSource):
+    """Price source reading the local bar store (see bars.py) from portfolio.db."""
+
+    def __init__(self, conn, interval='1d'):
+        self.conn = conn
+        self.interval = interval
+
+    def load(self, symbols, start=None, end=None):
+        placeholders = ','.join('?' * len(symbols))
+        cursor = self.conn.cursor()
+        cursor.execute(f'''
+            SELECT symbol, ts, close FROM bars
+            WHERE interval = ? AND symbol IN ({placeholders}) AND ts >= ? AND ts < ?
+            ORDER BY ts
+        ''', [self.interval, *symbols,
+              start if start is not None else float('-inf'),
+              end if end is not None else float('inf')])
+        rows = cursor.fetchall()
+        if not rows:
+            return np.empty(0), np.empty((0, len(symbols)))
+
+        column = {symbol: i for i, symbol in enumerate(symbols)}
+        row_symbols, row_ts, row_close = zip(*rows)
+        timestamps, bar_index = np.unique(np.array(row_ts, dtype=np.float64), return_inverse=True)
+        closes = np.full((len(timestamps), len(symbols)), np.nan)
+        closes[bar_index, [column[symbol] for symbol in row_symbols]] = row_close
+        return timestamps, closes
+
+
+class Strategy:
+    """
+    A strategy maps prices to target positions (in units) for every symbol.
+    targets() sees the whole closes matrix and must only use rows <= t to set
+    row t; computing all rows at once keeps signal evaluation vectorized.
+    """
+
+    def targets(self, closes):
+        raise NotImplementedError
+
+
+class MovingAverageCross(Strategy):
+    """Long size units while the fast average is above the slow one, short otherwise."""
+
+    def __init__(self, fast=20, slow=50, size=100, allow_short=True):
+        self.fast = fast
+        self.slow = slow
+        self.size = size
+        self.allow_short = allow_short
+
+    @staticmethod
+    def _window_sums(values, window):
+        sums = np.cumsum(values, axis=0, dtype=np.float64)
+        sums[window:] -= sums[:-window].copy()
+        return sums
+
+    @classmethod
+    def _rolling_mean(cls, closes, window):
+        # A window with a missing bar has no mean, rather than one that
+        # counts the gap as a zero close
+        present = ~np.isnan(closes)
+        sums = cls._window_sums(np.where(present, closes, 0.0), window)
+        counts = cls._window_sums(present, window)
+        means = np.full(closes.shape, np.nan)
+        full = counts == window
+        means[full] = sums[full] / window
+        return means
+
+    def targets(self, closes):
+        fast = self._rolling_mean(closes, self.fast)
+        slow = self._rolling_mean(closes, self.slow)
+        direction = np.sign(fast - slow)
+        if not self.allow_short:
+            direction = np.maximum(direction, 0)
+        return np.nan_to_num(direction) * self.size
+
+
+class BacktestResult:
+    def __init__(self, symbols, timestamps, equity, cash, realized_pnl, unrealized_pnl, fills, portfolio):
+        self.symbols = symbols
+        self.timestamps = timestamps
+        self.equity = equity
+        self.cash = cash
+        self.realized_pnl = realized_pnl
+        self.unrealized_pnl = unrealized_pnl
+        self.fills = fills
+        self.portfolio = portfolio
+
+    def equity_frame(self):
+        import pandas as pd
+        return pd.DataFrame({
+            'Time': pd.to_datetime(self.timestamps, unit='s'),
+            'Equity': self.equity,
+            'Cash': self.cash,
+            'Realized PnL': self.realized_pnl,
+            'Unrealized PnL': self.unrealized_pnl
+        })
+
+    def fills_frame(self):
+        import pandas as pd
+        return pd.DataFrame({
+            'Time': pd.to_datetime(self.fills['time'], unit='s'),
+            'Asset': np.array(self.symbols, dtype=object)[self.fills['symbol']],
+            'Quantity': self.fills['quantity'],
+            'Price': self.fills['price'],
+            'Action': [ActionType.BUY.value if code == BUY else ActionType.SELL.value for code in self.fills['action']]
+        })
+
+
+def run_backtest(strategy, price_source, symbols, start=None, end=None, initial_cash=100000.0, min_trade=1e-9):
+    """
+    Replay a strategy bar by bar.
+
+    Each bar the strategy's target row is compared with the current positions;
+    the differences are filled at that bar's close through Portfolio.add_trades,
+    so realized PnL follows the same long/short/flip accounting as live trades.
+    Equity, cash and realized/unrealized PnL are recorded after every bar.
+    """
+    timestamps, closes = price_source.load(symbols, start, end)
+    targets = np.asarray(strategy.targets(closes), dtype=np.float64)
+    bars, count = closes.shape
+
+    portfolio = Portfolio(capacity=max(1024, count))
+    slots = portfolio.register(symbols)
+    tradable = np.isfinite(closes)
+    last_price = np.full(count, np.nan)
+
+    cash = initial_cash
+    equity = np.empty(bars)
+    cash_curve = np.empty(bars)
+    realized_curve = np.empty(bars)
+    unrealized_curve = np.empty(bars)
+    fill_time, fill_symbol, fill_quantity, fill_price, fill_action = [], [], [], [], []
+
+    for t in range(bars):
+        prices = closes[t]
+        last_price = np.where(tradable[t], prices, last_price)
+        orders = np.where(tradable[t], targets[t] - portfolio.quantities, 0.0)
+        active = np.nonzero(np.abs(orders) > min_trade)[0]
+
+        if len(active):
+            quantity = np.abs(orders[active])
+            action = np.where(orders[active] > 0, BUY, SELL).astype(np.int8)
+            portfolio.add_trades(slots[active], timestamps[t], quantity, action, prices[active])
+            cash -= float(np.dot(orders[active], prices[active]))
+            fill_time.append(np.full(len(active), timestamps[t]))
+            fill_symbol.append(active)
+            fill_quantity.append(quantity)
+            fill_price.append(prices[active])
+            fill_action.append(action)
+
+        portfolio.update_agg_trades(last_price)
+        cash_curve[t] = cash
+        equity[t] = cash + float(np.dot(portfolio.quantities, np.where(np.isnan(last_price), 0.0, last_price)))
+        realized_curve[t] = portfolio.realized_pnl
+        unrealized_curve[t] = portfolio.unrealized_pnl
+
+    def _concat(parts, dtype):
+        return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+    fills = {
+        'time': _concat(fill_time, np.float64),
+        'symbol': _concat(fill_symbol, np.int64),
+        'quantity': _concat(fill_quantity, np.float64),
+        'price': _concat(fill_price, np.float64),
+        'action': _concat(fill_action, np.int8)
+    }
+    return BacktestResult(list(symbols), timestamps, equity, cash_curve, realized_curve, unrealized_curve, fills, portfolio)
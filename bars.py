@@ -0,0 +1,173 @@
+import time
+from datetime import date, datetime, timedelta
+
+from quote_cache import SingleFlight
+
+# Intervals kept locally, with how far back the upstream serves them and how
+# long a sync stays fresh. Every other interval is resampled from one of these.
+BASE_INTERVALS = {
+    '1m': {'lookback': 7, 'fresh': 60},
+    '5m': {'lookback': 59, 'fresh': 300},
+    '1h': {'lookback': 729, 'fresh': 1800},
+    '1d': {'lookback': None, 'fresh': 3600},
+}
+
+# Requested interval -> (stored interval, bucket). An int bucket is a width in
+# seconds, a str bucket is a calendar grouping of daily bars.
+INTERVALS = {
+    '1m': ('1m', None),
+    '2m': ('1m', 120),
+    '5m': ('5m', None),
+    '15m': ('5m', 900),
+    '30m': ('5m', 1800),
+    '60m': ('1h', None),
+    '1h': ('1h', None),
+    '90m': ('5m', 5400),
+    '1d': ('1d', None),
+    '5d': ('1d', '5d'),
+    '1wk': ('1d', 'week'),
+    '1mo': ('1d', 'month'),
+    '3mo': ('1d', 'quarter'),
+}
+
+PERIOD_DAYS = {
+    '1mo': 31,
+    '3mo': 92,
+    '6mo': 183,
+    '1y': 366,
+    '2y': 731,
+    '5y': 1827,
+    '10y': 3653,
+}
+
+_flight = SingleFlight()
+
+
+class BarStoreError(ValueError):
+    """Raised for a period or interval the bar store cannot serve."""
+
+
+def _row_to_bar(row):
+    return {
+        'Date': row[0],
+        'Timestamp': row[1],
+        'Open': row[2],
+        'High': row[3],
+        'Low': row[4],
+        'Close': row[5],
+        'Volume': row[6]
+    }
+
+
+def sync(conn, provider, symbol, interval, now=None):
+    """
+    Bring the stored bars for (symbol, interval) up to date, fetching only what
+    came after the last stored bar. The last bar is refetched too, since it may
+    still have been forming when it was stored.
+    """
+    now = now or time.time()
+    config = BASE_INTERVALS[interval]
+    cursor = conn.cursor()
+    cursor.execute('SELECT last_ts, synced_at FROM bar_sync WHERE symbol = ? AND interval = ?', (symbol, interval))
+    row = cursor.fetchone()
+    if row is not None and now - row[1] < config['fresh']:
+        return
+
+    earliest = now - config['lookback'] * 86400 if config['lookback'] else None
+    if row is not None and row[0] is not None:
+        start = row[0] if earliest is None else max(row[0], earliest)
+        bars = provider.history(symbol, None, interval, start=start)
+    elif earliest is not None:
+        bars = provider.history(symbol, None, interval, start=earliest)
+    else:
+        bars = provider.history(symbol, 'max', interval)
+
+    bars = [bar for bar in bars if bar['Close'] == bar['Close']]  # drop NaN rows
+    cursor.executemany('''
+        INSERT OR REPLACE INTO bars (symbol, interval, ts, date, open, high, low, close, volume)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(symbol, interval, bar['Timestamp'], bar['Date'], bar['Open'], bar['High'], bar['Low'],
+           bar['Close'], bar['Volume']) for bar in bars])
+    last_ts = max([bar['Timestamp'] for bar in bars], default=row[0] if row else None)
+    cursor.execute('''
+        INSERT OR REPLACE INTO bar_sync (symbol, interval, last_ts, synced_at) VALUES (?, ?, ?, ?)
+    ''', (symbol, interval, last_ts, now))
+    conn.commit()
+
+
+def _period_start(cursor, symbol, interval, period, now):
+    if period == 'max':
+        return None
+    if period in ('1d', '5d'):
+        # The last N trading days on record, not calendar days, so weekends
+        # and holidays still return data
+        cursor.execute('''
+            SELECT DISTINCT substr(date, 1, 10) AS day FROM bars
+            WHERE symbol = ? AND interval = ? ORDER BY day DESC LIMIT ?
+        ''', (symbol, interval, int(period[0])))
+        days = [row[0] for row in cursor.fetchall()]
+        if not days:
+            return None
+        cursor.execute('''
+            SELECT MIN(ts) FROM bars WHERE symbol = ? AND interval = ? AND substr(date, 1, 10) = ?
+        ''', (symbol, interval, days[-1]))
+        return cursor.fetchone()[0]
+    if period == 'ytd':
+        return datetime(datetime.fromtimestamp(now).year, 1, 1).timestamp()
+    if period in PERIOD_DAYS:
+        return now - PERIOD_DAYS[period] * 86400
+    raise BarStoreError(f"Unsupported period: {period}")
+
+
+def _calendar_key(bar, bucket, index):
+    day = date.fromisoformat(bar['Date'][:10])
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.year, day.month
+    if bucket == 'quarter':
+        return day.year, (day.month - 1) // 3
+    return index // 5  # '5d'
+
+
+def resample(bars, bucket):
+    """Aggregate finer bars into coarser ones, labelled by the first bar of each bucket."""
+    if bucket is None:
+        return bars
+    resampled = []
+    current_key = None
+    for index, bar in enumerate(bars):
+        if isinstance(bucket, int):
+            key = int(bar['Timestamp'] // bucket)
+        else:
+            key = _calendar_key(bar, bucket, index)
+        if key != current_key:
+            current_key = key
+            resampled.append(dict(bar))
+            continue
+        merged = resampled[-1]
+        merged['High'] = max(merged['High'], bar['High'])
+        merged['Low'] = min(merged['Low'], bar['Low'])
+        merged['Close'] = bar['Close']
+        merged['Volume'] += bar['Volume']
+    return resampled
+
+
+def get_bars(conn, provider, symbol, period, interval, now=None):
+    """
+    Return bars for any supported period/interval, syncing the underlying
+    stored interval first and resampling locally when needed.
+    """
+    if interval not in INTERVALS:
+        raise BarStoreError(f"Unsupported interval: {interval}")
+    now = now or time.time()
+    base, bucket = INTERVALS[interval]
+    _flight.do((symbol, base), lambda: sync(conn, provider, symbol, base, now))
+
+    cursor = conn.cursor()
+    start = _period_start(cursor, symbol, base, period, now)
+    cursor.execute('''
+        SELECT date, ts, open, high, low, close, volume FROM bars
+        WHERE symbol = ? AND interval = ? AND ts >= ? ORDER BY ts
+    ''', (symbol, base, start if start is not None else float('-inf')))
+    return resample([_row_to_bar(row) for row in cursor.fetchall()], bucket)
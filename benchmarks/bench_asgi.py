@@ -0,0 +1,120 @@
+"""
+Load test the WSGI and ASGI apps against a simulated slow upstream.
+
+    python benchmarks/bench_asgi.py --latency 0.2 --requests 400 --concurrency 100
+
+Both apps run in-process on a scratch database with a fixture provider that
+sleeps on every call and a quote cache that never serves a hit, so every
+request waits on the upstream. Both modes get the same number of threads
+(--concurrency unless --workers is given): WSGI worker threads, as under a
+threaded server, and the ASGI app's upstream pool with that many requests in
+flight. Quote routes run the Flask views in both modes and block a thread per
+call, so with equal threads the difference is the ASGI bridge's overhead;
+give --workers a smaller number to compare against a fixed-size WSGI server.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+SYMBOLS = 1000
+
+
+def fixture():
+    return {f"SYM{i}": {"info": {"currentPrice": 100.0 + i, "regularMarketPreviousClose": 99.0 + i,
+                                 "52WeekChange": 0.1}} for i in range(SYMBOLS)}
+
+
+def summarize(label, latencies, elapsed):
+    latencies = sorted(latencies)
+    p50 = latencies[len(latencies) // 2]
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"  {label:<34} {len(latencies) / elapsed:8.1f} req/s  p50 {p50 * 1000:7.1f} ms  p95 {p95 * 1000:7.1f} ms")
+
+
+def run_wsgi(flask_app, requests, workers):
+    client = flask_app.test_client()
+
+    def one(i):
+        start = time.perf_counter()
+        response = client.post('/api/getchange', json={'Ticker': f"SYM{i % SYMBOLS}"})
+        assert response.status_code == 200, response.data
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        latencies = list(pool.map(one, range(requests)))
+    return latencies, time.perf_counter() - start
+
+
+async def call(app, path, body):
+    scope = {'type': 'http', 'method': 'POST', 'path': path, 'query_string': b'', 'http_version': '1.1',
+             'headers': [(b'content-type', b'application/json')], 'server': ('localhost', 5000)}
+    messages = [{'type': 'http.request', 'body': json.dumps(body).encode()}]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await asyncio.Event().wait()
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    return sent[0]['status']
+
+
+async def run_asgi(app, requests, concurrency):
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with gate:
+            start = time.perf_counter()
+            status = await call(app, '/api/getchange', {'Ticker': f"SYM{i % SYMBOLS}"})
+            assert status == 200, status
+            return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(one(i) for i in range(requests)))
+    return latencies, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.2, help="seconds slept on every upstream call")
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=100,
+                        help="requests in flight against the ASGI app and its upstream threads")
+    parser.add_argument('--workers', type=int, help="WSGI worker threads (default --concurrency)")
+    args = parser.parse_args(argv)
+    args.workers = args.workers or args.concurrency
+
+    scratch = tempfile.mkdtemp()
+    os.environ['PORTFOLIO_DB'] = os.path.join(scratch, 'portfolio.db')
+    os.environ['ASGI_UPSTREAM_WORKERS'] = str(args.concurrency)
+
+    from market_data import FixtureProvider, set_provider
+    from metrics import InstrumentedProvider
+    from quote_cache import CachedProvider, DEFAULT_FIELD_TTLS
+    set_provider(CachedProvider(InstrumentedProvider(FixtureProvider(fixture(), latency=args.latency)),
+                                field_ttls={name: 0 for name in DEFAULT_FIELD_TTLS}, default_ttl=0))
+    import asgi
+    flask_app = asgi.flask_app
+
+    print(f"{args.requests} upstream-bound requests, {args.latency * 1000:.0f} ms upstream latency")
+    summarize(f"WSGI, {args.workers} worker threads", *run_wsgi(flask_app, args.requests, args.workers))
+    if args.workers != args.concurrency:
+        print(f"  note: {args.workers} WSGI threads against {args.concurrency} ASGI upstream threads, "
+              "so this compares thread counts as much as servers")
+    summarize(f"ASGI, {args.concurrency} upstream threads", *asyncio.run(run_asgi(asgi.app, args.requests, args.concurrency)))
+
+
+if __name__ == '__main__':
+    main()
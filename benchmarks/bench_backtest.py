@@ -0,0 +1,50 @@
+"""
+Benchmark the backtest engine on synthetic daily bars.
+
+    python benchmarks/bench_backtest.py --years 10 --symbols 500
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from backtest import ArrayPriceSource, MovingAverageCross, run_backtest
+
+
+def random_walk(bars, symbols, seed=0):
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.0003, 0.02, (bars, symbols))
+    closes = 100 * np.exp(np.cumsum(returns, axis=0))
+    timestamps = 1262304000 + np.arange(bars) * 86400.0
+    return timestamps, closes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--symbols', type=int, default=500)
+    parser.add_argument('--fast', type=int, default=20)
+    parser.add_argument('--slow', type=int, default=50)
+    args = parser.parse_args(argv)
+
+    bars = args.years * 252
+    symbols = [f"SYM{i}" for i in range(args.symbols)]
+    timestamps, closes = random_walk(bars, args.symbols)
+    source = ArrayPriceSource(timestamps, closes, symbols)
+
+    start = time.perf_counter()
+    result = run_backtest(MovingAverageCross(args.fast, args.slow), source, symbols)
+    elapsed = time.perf_counter() - start
+
+    fills = len(result.fills['quantity'])
+    print(f"{bars:,} bars x {args.symbols} symbols in {elapsed:.2f}s "
+          f"({bars * args.symbols / elapsed:,.0f} symbol-bars/s, {fills:,} fills)")
+    print(f"final equity {result.equity[-1]:,.2f}, realized {result.realized_pnl[-1]:,.2f}, "
+          f"unrealized {result.unrealized_pnl[-1]:,.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Compare opening a connection per request with the per-thread pool.
+
+    python benchmarks/bench_db.py --requests 20000 --threads 4
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import db
+
+
+def per_request(path):
+    # What every handler used to do: connect, read, close
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.execute('SELECT * FROM aggregated_trades').fetchall()
+    conn.close()
+
+
+def pooled(pool):
+    conn = pool.connection()
+    conn.execute('SELECT * FROM aggregated_trades').fetchall()
+    pool.release(conn)
+
+
+def run(label, fn, requests, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda _: fn(), range(requests)))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<22} {requests / elapsed:>10,.0f} requests/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', default=os.path.join(os.path.dirname(__file__), '..', 'portfolio.db'))
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args(argv)
+
+    # Work on a copy so the benchmark never touches the real database
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'portfolio.db')
+        shutil.copy(args.db, path)
+        run("connect per request", lambda: per_request(path), args.requests, args.threads)
+        pool = db.ConnectionPool(path)
+        run("pooled + WAL", lambda: pooled(pool), args.requests, args.threads)
+        pool.close_all()
+
+
+if __name__ == '__main__':
+    main()
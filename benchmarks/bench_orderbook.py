@@ -0,0 +1,86 @@
+"""
+Benchmark the order book and matching engine with 100k resting orders.
+
+    python benchmarks/bench_orderbook.py --resting 100000 --events 200000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from orders import MatchingEngine, Order
+
+
+def random_order(rng, order_id, symbol, price):
+    action = 'Buy' if rng.random() < 0.5 else 'Sell'
+    order_type = ('limit', 'stop', 'stop_limit')[rng.integers(3)]
+    # Resting orders sit away from the market: buy limits below, sell limits above,
+    # and stops on the other side
+    offset = round(float(rng.uniform(0.5, 20.0)), 2)
+    below, above = round(price - offset, 2), round(price + offset, 2)
+    if order_type == 'limit':
+        return Order(order_id, symbol, action, 1.0, 'limit', limit_price=below if action == 'Buy' else above)
+    stop = above if action == 'Buy' else below
+    return Order(order_id, symbol, action, 1.0, order_type, limit_price=stop if order_type == 'stop_limit' else None,
+                 stop_price=stop)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--resting', type=int, default=100000)
+    parser.add_argument('--events', type=int, default=200000)
+    parser.add_argument('--symbols', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    symbols = [f"SYM{i}" for i in range(args.symbols)]
+    prices = {symbol: 100.0 for symbol in symbols}
+    engine = MatchingEngine()
+
+    start = time.perf_counter()
+    for order_id in range(1, args.resting + 1):
+        symbol = symbols[order_id % len(symbols)]
+        engine.submit(random_order(rng, order_id, symbol, prices[symbol]))
+    elapsed = time.perf_counter() - start
+    print(f"{args.resting:,} resting orders submitted in {elapsed:.2f}s ({args.resting / elapsed:,.0f} orders/s)")
+
+    # Mixed stream: half ticks, a quarter new orders, a quarter cancels, with
+    # new orders replacing filled ones so the book stays near its size
+    next_id = args.resting + 1
+    fills = ticks = 0
+    kinds = rng.random(args.events)
+    start = time.perf_counter()
+    for kind in kinds:
+        symbol = symbols[rng.integers(len(symbols))]
+        if kind < 0.5:
+            prices[symbol] = round(prices[symbol] * (1 + rng.normal(0, 0.002)), 2)
+            fills += sum(1 for event in engine.on_tick(symbol, prices[symbol]) if event[0] == 'fill')
+            ticks += 1
+        elif kind < 0.75 or not len(engine):
+            engine.submit(random_order(rng, next_id, symbol, prices[symbol]))
+            next_id += 1
+        else:
+            engine.cancel(int(rng.integers(1, next_id)))
+    elapsed = time.perf_counter() - start
+    print(f"{args.events:,} events ({ticks:,} ticks, {fills:,} fills) in {elapsed:.2f}s "
+          f"({args.events / elapsed:,.0f} events/s, {len(engine):,} orders still resting)")
+
+    # For scale: what one tick costs when every open order is scanned
+    orders = list(engine.orders.values())
+    start = time.perf_counter()
+    scans = 20
+    for _ in range(scans):
+        symbol = symbols[0]
+        price = prices[symbol]
+        [order for order in orders if order.asset == symbol and (
+            (order.limit_price is not None and (price <= order.limit_price if order.is_buy else price >= order.limit_price))
+            or (order.stop_price is not None and (price >= order.stop_price if order.is_buy else price <= order.stop_price)))]
+    elapsed = time.perf_counter() - start
+    print(f"full scan of {len(orders):,} orders: {scans / elapsed:,.0f} ticks/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Benchmark the columnar Portfolio engine on simulated trades.
+
+    python benchmarks/bench_portfolio.py --trades 1000000 --assets 500
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from portfolio import Portfolio, ActionType
+
+
+def simulate(trades, assets, seed=0):
+    rng = np.random.default_rng(seed)
+    symbols = [f"SYM{i}" for i in range(assets)]
+    asset_ids = rng.integers(0, assets, trades)
+    quantities = rng.integers(1, 100, trades).astype(float)
+    prices = rng.uniform(10, 500, trades)
+    actions = rng.choice([ActionType.BUY, ActionType.SELL, ActionType.SHORT], trades, p=[0.5, 0.35, 0.15])
+    return symbols, asset_ids, quantities, prices, actions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--trades', type=int, default=1_000_000)
+    parser.add_argument('--assets', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=100, help="unrealized PnL updates to time")
+    args = parser.parse_args(argv)
+
+    symbols, asset_ids, quantities, prices, actions = simulate(args.trades, args.assets)
+    asset_ids, quantities, prices = asset_ids.tolist(), quantities.tolist(), prices.tolist()
+
+    portfolio = Portfolio()
+    start = time.perf_counter()
+    for i in range(args.trades):
+        portfolio.add_trade(symbols[asset_ids[i]], i, quantities[i], actions[i], price=prices[i])
+    elapsed = time.perf_counter() - start
+    print(f"add_trade:         {args.trades:,} trades in {elapsed:.2f}s ({args.trades / elapsed:,.0f} trades/s)")
+
+    market_prices = np.random.default_rng(1).uniform(10, 500, len(portfolio.assets))
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        portfolio.update_agg_trades(market_prices)
+    elapsed = (time.perf_counter() - start) / args.repeat
+    print(f"update_agg_trades: {len(portfolio.assets)} positions in {elapsed * 1e6:.1f}us per update")
+
+    price_dict = dict(zip(portfolio.assets, market_prices.tolist()))
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        portfolio.update_agg_trades(price_dict)
+    elapsed = (time.perf_counter() - start) / args.repeat
+    print(f"  (dict prices)    {len(portfolio.assets)} positions in {elapsed * 1e6:.1f}us per update")
+
+    print(f"realized PnL {portfolio.realized_pnl:,.2f}, unrealized PnL {portfolio.unrealized_pnl:,.2f}")
+
+
+if __name__ == '__main__':
+    main()
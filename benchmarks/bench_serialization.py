@@ -0,0 +1,139 @@
+"""
+Benchmark trade record memory and trade history serialization.
+
+    python benchmarks/bench_serialization.py --trades 100000
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from serialization import arrow_stream, columnar, dumps, encode_rows, orjson
+from trade import ActionType, Trade, TradeType
+
+KEYS = ('id', 'Asset', 'Quantity', 'Time', 'Price', 'Action')
+
+# Column layout for batches of stored trades: one fixed-size record per trade
+# instead of one object per trade. asset indexes a separate list of symbols
+# and action indexes ACTIONS, so each record is 37 bytes.
+TRADE_DTYPE = [
+    ('id', 'i8'),
+    ('asset', 'i4'),
+    ('ts', 'f8'),
+    ('quantity', 'f8'),
+    ('price', 'f8'),
+    ('action', 'i1'),
+]
+ACTIONS = [action.value for action in ActionType]
+
+
+def trades_array(rows):
+    """
+    Pack (id, asset, ts, quantity, price, action) rows into a TRADE_DTYPE
+    array. Returns the array and the list of symbols its asset column indexes.
+    """
+    codes = {action: code for code, action in enumerate(ACTIONS)}
+    assets = {}
+    records = np.fromiter(((row[0], assets.setdefault(row[1], len(assets)), row[2], row[3], row[4], codes[row[5]])
+                           for row in rows), dtype=TRADE_DTYPE)
+    return records, list(assets)
+
+
+class DictTrade:
+    # The previous representation: a plain class with a per-instance __dict__
+    def __init__(self, asset, time, quantity, price, trade_type, action, short_date=None,
+                 base_currency=None, quote_currency=None, unit=None):
+        self.asset = asset
+        self.time = time
+        self.quantity = quantity
+        self.price = price
+        self.trade_type = trade_type
+        self.action = action
+        self.short_date = short_date
+        self.base_currency = base_currency
+        self.quote_currency = quote_currency
+        self.unit = unit
+
+
+def make_rows(n, seed=0):
+    rng = np.random.default_rng(seed)
+    assets = [f"SYM{i}" for i in range(500)]
+    actions = [action.value for action in ActionType]
+    start = 1704067200.0
+    return [(i + 1, assets[rng.integers(500)], float(rng.integers(1, 100)),
+             datetime.fromtimestamp(start + i).isoformat(), float(round(rng.uniform(10, 500), 2)),
+             actions[rng.integers(2)], start + i) for i in range(n)]
+
+
+def measure(label, build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    kept = build()
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<28} {size / 2 ** 20:8.1f} MB  {elapsed:6.2f}s")
+    return kept
+
+
+def timed(label, n, fn):
+    start = time.perf_counter()
+    body = fn()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<28} {n / elapsed:12,.0f} trades/s  {len(body) / 2 ** 20:6.1f} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--trades', type=int, default=100000)
+    args = parser.parse_args(argv)
+    n = args.trades
+    rows = make_rows(n)
+
+    print(f"memory for {n:,} trades")
+    measure('dict-backed Trade', lambda: [DictTrade(r[1], r[3], r[2], r[4], TradeType.STOCK, ActionType(r[5])) for r in rows])
+    measure('__slots__ Trade', lambda: [Trade(r[1], r[3], r[2], r[4], TradeType.STOCK, ActionType(r[5])) for r in rows])
+    measure('TRADE_DTYPE array', lambda: trades_array((r[0], r[1], r[6], r[2], r[4], r[5]) for r in rows))
+
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE trades (id INTEGER PRIMARY KEY, asset TEXT, quantity REAL, time TEXT, price REAL, action TEXT, ts REAL)')
+    conn.executemany('INSERT INTO trades VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+    query = 'SELECT id, asset, quantity, time, price, action FROM trades ORDER BY id'
+
+    def row_dicts():
+        conn.row_factory = sqlite3.Row
+        cursor = conn.execute(query)
+        conn.row_factory = None
+        parts = [json.dumps({'id': r['id'], 'Asset': r['asset'], 'Quantity': r['quantity'], 'Time': r['time'],
+                             'Price': r['price'], 'Action': r['action']}) for r in cursor]
+        return '[' + ','.join(parts) + ']'
+
+    def batched():
+        cursor = conn.execute(query)
+        parts = []
+        while True:
+            batch = cursor.fetchmany(500)
+            if not batch:
+                break
+            parts.append(encode_rows(batch, KEYS))
+        return b'[' + b','.join(parts) + b']'
+
+    print(f"encoding {n:,} trades from SQLite (orjson {'on' if orjson else 'off'})")
+    timed('sqlite3.Row + json.dumps', n, row_dicts)
+    timed('tuples + batched encode', n, batched)
+    timed('columnar JSON', n, lambda: dumps(columnar(conn.execute(query).fetchall(), KEYS)))
+    try:
+        timed('columnar Arrow IPC', n, lambda: arrow_stream(columnar(conn.execute(query).fetchall(), KEYS)))
+    except ImportError:
+        print("  columnar Arrow IPC           skipped (pyarrow not installed)")
+
+
+if __name__ == '__main__':
+    main()
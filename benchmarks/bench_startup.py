@@ -0,0 +1,80 @@
+"""
+Measure cold start: importing the app, building it and serving the first request.
+
+    python benchmarks/bench_startup.py --runs 10
+
+Every run is a fresh interpreter on a scratch copy of the database (or an
+empty one) with the fixture provider, so nothing is shared between runs but
+the OS file cache. Reports the median of each stage and which heavy modules
+the import pulled in; those should only load once a request needs them.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+HEAVY_MODULES = ('numpy', 'pandas', 'yfinance', 'pyarrow')
+
+RUN = '''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+flask_app = app.create_app()
+created = time.perf_counter()
+loaded = [name for name in {heavy!r} if name in sys.modules]
+client = flask_app.test_client()
+response = client.get({path!r})
+first = time.perf_counter()
+response = client.get({path!r})
+second = time.perf_counter()
+print(json.dumps({{"import": imported - start, "create_app": created - imported, "first request": first - created,
+                  "second request": second - first, "status": response.status_code, "loaded": loaded}}))
+'''
+
+
+def run_once(path, database):
+    env = dict(os.environ, MARKET_DATA_PROVIDER='fixture', PORTFOLIO_DB=database, SYMBOL_REFRESH_INTERVAL='0')
+    code = RUN.format(heavy=HEAVY_MODULES, path=path)
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True,
+                            check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--path', default='/api/getbalance', help="route requested first")
+    parser.add_argument('--db', help="database to copy for every run; an empty one is created when omitted")
+    args = parser.parse_args(argv)
+
+    scratch = tempfile.mkdtemp()
+    database = os.path.join(scratch, 'portfolio.db')
+    results = []
+    try:
+        for _ in range(args.runs):
+            if os.path.exists(database):
+                os.remove(database)
+            if args.db:
+                shutil.copyfile(args.db, database)
+            results.append(run_once(args.path, database))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    print(f"{args.runs} cold starts, first request GET {args.path} (status {results[-1]['status']})")
+    for stage in ('import', 'create_app', 'first request', 'second request'):
+        times = [result[stage] for result in results]
+        print(f"  {stage:<16} median {statistics.median(times) * 1000:8.1f} ms  max {max(times) * 1000:8.1f} ms")
+    total = statistics.median(sum(result[stage] for stage in ('import', 'create_app', 'first request'))
+                              for result in results)
+    print(f"  {'ready to serve':<16} median {total * 1000:8.1f} ms")
+    print(f"  loaded at startup: {', '.join(results[-1]['loaded']) or 'none of ' + ', '.join(HEAVY_MODULES)}")
+
+
+if __name__ == '__main__':
+    main()
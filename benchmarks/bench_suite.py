@@ -0,0 +1,275 @@
+"""
+Run the benchmark suite on a synthetic market and save the results as JSON.
+
+    python benchmarks/bench_suite.py --sizes 10000,100000,1000000
+    python benchmarks/bench_suite.py --quick --compare benchmarks/results/abc1234.json
+    python benchmarks/bench_suite.py --compare old.json new.json
+
+Everything runs offline on scratch databases with the synthetic provider
+(market_data.SyntheticProvider) and trades generated from --seed, so two runs
+differ only by the code and the machine. The app is driven through the Flask
+test client with a warm quote cache, so endpoint timings measure the app and
+not the provider; the response cache is cleared before every timed call
+except in the cached cases. The trade history grows to each size in turn.
+
+Results go to benchmarks/results/<commit>.json unless --output is given.
+--compare prints the change in median against an earlier results file, or
+between two files without running anything.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+ACTIONS = (('Buy', 0.6), ('Sell', 0.3), ('Short', 0.1))
+
+
+def make_trades(provider, n, assets, rng):
+    """(asset, quantity, time, price, action) rows in time order, priced off the synthetic closes."""
+    symbols = [f"SYM{i}" for i in range(assets)]
+    bars = {symbol: provider.series(symbol)[0] for symbol in symbols}
+    days = len(bars[symbols[0]])
+    names, weights = zip(*ACTIONS)
+    rows = []
+    for day in sorted(rng.randrange(days) for _ in range(n)):
+        symbol = symbols[rng.randrange(assets)]
+        bar = bars[symbol][day]
+        rows.append((symbol, float(rng.randint(1, 100)),
+                     f"{bar['Date'][:10]}T{rng.randrange(14, 21):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}",
+                     round(rng.uniform(bar['Low'], bar['High']), 4), rng.choices(names, weights)[0]))
+    return rows
+
+
+def measure(results, name, fn, repeats, items=None, setup=None, warmup=0):
+    """Time fn() repeats times, after setup() each time, and record the summary under name."""
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+    times = []
+    for _ in range(repeats):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    median = statistics.median(times)
+    result = {
+        'median': median,
+        'min': min(times),
+        'mean': statistics.fmean(times),
+        'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+        'repeats': repeats
+    }
+    if items:
+        result['items'] = items
+        result['per_sec'] = items / median if median > 0 else None
+    results[name] = result
+    rate = f"  {result['per_sec']:>12,.0f} items/s" if items else ''
+    print(f"  {name:<36} median {format_seconds(median):>10}  min {format_seconds(min(times)):>10}{rate}", flush=True)
+
+
+def format_seconds(seconds):
+    if seconds >= 1:
+        return f"{seconds:.2f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds * 1e6:.1f} us"
+
+
+def fetch(client, path, expect=200):
+    """GET path and read the whole body, streamed or not, without buffering it."""
+    response = client.get(path, buffered=False)
+    assert response.status_code == expect, (path, response.status_code)
+    size = sum(len(chunk) for chunk in response.response)
+    response.close()
+    return size
+
+
+def commit_id():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f"{commit}-dirty" if dirty else commit
+
+
+def compare(base, current, threshold):
+    """Print the change in median of every case both runs have."""
+    print(f"{base['commit']} -> {current['commit']}")
+    for name, result in current['results'].items():
+        old = base['results'].get(name)
+        if old is None:
+            print(f"  {name:<36} {'':>10}    {format_seconds(result['median']):>10}  new")
+            continue
+        change = result['median'] / old['median'] - 1 if old['median'] else 0.0
+        flag = 'slower' if change > threshold else 'faster' if change < -threshold else ''
+        print(f"  {name:<36} {format_seconds(old['median']):>10} -> {format_seconds(result['median']):>10}  "
+              f"{change * 100:+6.1f}%  {flag}")
+
+
+def run_suite(args, scratch):
+    os.environ['PORTFOLIO_DB'] = os.path.join(scratch, 'portfolio.db')
+    os.environ['MARKET_DATA_SEED'] = str(args.seed)
+    os.environ.setdefault('SYMBOL_REFRESH_INTERVAL', '0')
+    import logging
+    logging.disable(logging.WARNING)
+
+    import numpy as np
+    import app as webapp
+    from db import connect
+    from ingest import ingest_trades
+    from ledger import init_ledger
+    from market_data import create_provider
+    from migrations import migrate
+    from portfolio import Portfolio, ActionType
+
+    provider = create_provider('synthetic')
+    synthetic = provider.backend.backend
+    flask_app = webapp.create_app(provider=provider)
+    client = flask_app.test_client()
+    clear = webapp.response_cache.clear
+    results = {}
+
+    print("single trades")
+    symbols = [f"SYM{i}" for i in range(args.assets)]
+    trades = iter(range(10 ** 9))
+
+    def single_trade():
+        i = next(trades)
+        response = client.post('/api/maketrade', json={'asset': symbols[i % args.assets], 'quantity': 1,
+                                                        'action': 'Buy'})
+        assert response.status_code == 201, response.data
+    measure(results, 'trade.single', single_trade, args.trade_repeats, warmup=args.assets)
+
+    for size in args.sizes:
+        print(f"{size:,} trades")
+        rows = make_trades(synthetic, size, args.assets, random.Random(f"{args.seed}:{size}"))
+
+        # Bulk ingest into an empty database of its own
+        path = os.path.join(scratch, f'ingest-{size}.db')
+
+        def remove():
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+        def fresh_database():
+            remove()
+            conn = connect(path)
+            migrate(conn)
+            init_ledger(conn)
+            conn.close()
+
+        def ingest():
+            conn = connect(path)
+            ingest_trades(conn, rows)
+            conn.close()
+        measure(results, f'ingest.bulk[{size}]', ingest, args.repeats if size < 1_000_000 else 1, items=size,
+                setup=fresh_database)
+        remove()
+
+        # The app's database grows to this size, counting the single trades
+        conn = connect(os.environ['PORTFOLIO_DB'])
+        loaded = conn.execute('SELECT COUNT(*) FROM trades').fetchone()[0]
+        ingest_trades(conn, rows[:max(0, size - loaded)])
+        conn.close()
+        history_repeats = args.repeats if size < 1_000_000 else max(1, args.repeats // 2)
+        measure(results, f'history.stream[{size}]', lambda: fetch(client, '/api/tradehistory'), history_repeats,
+                items=size, setup=clear)
+        measure(results, f'history.columnar[{size}]', lambda: fetch(client, '/api/tradehistory?format=columnar'),
+                history_repeats, items=size, setup=clear)
+        measure(results, f'history.page[{size}]',
+                lambda: fetch(client, f'/api/tradehistory?limit=1000&cursor={size // 2}'), args.endpoint_repeats,
+                items=1000, setup=clear)
+        for route in ('aggregate', 'getbalance', 'valuation', 'getaggstats'):
+            measure(results, f'{route}[{size}]', lambda: fetch(client, f'/api/{route}'), args.endpoint_repeats,
+                    setup=clear, warmup=1)
+        measure(results, f'aggregate.cached[{size}]', lambda: fetch(client, '/api/aggregate'), args.endpoint_repeats,
+                warmup=1)
+
+        # The in-memory Portfolio engine on the same trades
+        def replay():
+            portfolio = Portfolio(capacity=size)
+            for i, (asset, quantity, _, price, action) in enumerate(rows):
+                portfolio.add_trade(asset, i, quantity, ActionType(action), price=price)
+            return portfolio
+        measure(results, f'portfolio.add_trade[{size}]', replay, 1 if size >= 1_000_000 else args.repeats, items=size)
+        portfolio = replay()
+        prices = np.array([synthetic.series(asset)[1]['currentPrice'] for asset in portfolio.assets])
+        price_dict = dict(zip(portfolio.assets, prices.tolist()))
+        measure(results, f'portfolio.update_pnl[{size}]', lambda: portfolio.update_agg_trades(prices),
+                args.endpoint_repeats)
+        measure(results, f'portfolio.update_pnl.dict[{size}]', lambda: portfolio.update_agg_trades(price_dict),
+                args.endpoint_repeats)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000', help="trade history sizes, comma separated")
+    parser.add_argument('--assets', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeats', type=int, default=5, help="timed runs of the heavy cases")
+    parser.add_argument('--endpoint-repeats', type=int, default=50, help="timed calls of each endpoint")
+    parser.add_argument('--trade-repeats', type=int, default=200, help="single trades to time")
+    parser.add_argument('--quick', action='store_true', help="10k trades and fewer repeats")
+    parser.add_argument('--output', help="results file (default benchmarks/results/<commit>.json)")
+    parser.add_argument('--compare', nargs='+', metavar='RESULTS',
+                        help="an earlier results file to compare against, or two files to compare without running")
+    parser.add_argument('--threshold', type=float, default=0.1, help="relative change reported as slower or faster")
+    args = parser.parse_args(argv)
+
+    if args.compare and len(args.compare) == 2:
+        with open(args.compare[0]) as f, open(args.compare[1]) as g:
+            compare(json.load(f), json.load(g), args.threshold)
+        return
+    if args.quick:
+        args.sizes, args.repeats, args.endpoint_repeats, args.trade_repeats = '10000', 3, 20, 50
+    args.sizes = sorted(int(size) for size in args.sizes.split(','))
+
+    scratch = tempfile.mkdtemp()
+    try:
+        results = run_suite(args, scratch)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    run = {
+        'commit': commit_id(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'params': {'sizes': args.sizes, 'assets': args.assets, 'seed': args.seed, 'repeats': args.repeats,
+                   'endpoint_repeats': args.endpoint_repeats, 'trade_repeats': args.trade_repeats},
+        'results': results
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{run['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(run, f, indent=2)
+    print(f"results written to {output}")
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            compare(json.load(f), run, args.threshold)
+
+
+if __name__ == '__main__':
+    main()
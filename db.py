@@ -0,0 +1,170 @@
+import os
+import sqlite3
+import itertools
+import threading
+import time
+import weakref
+from datetime import datetime
+
+from metrics import record
+
+DB_PATH = os.environ.get('PORTFOLIO_DB', 'portfolio.db')
+
+# Pragmas applied to every connection, overridable from the environment.
+# WAL lets readers proceed while a trade is being written.
+PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -20000)),  # negative = KiB, so ~20MB
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),
+    'temp_store': os.environ.get('SQLITE_TEMP_STORE', 'MEMORY'),
+}
+
+
+def to_epoch(time):
+    """Epoch seconds for an ISO time string; naive times are taken as local time."""
+    return datetime.fromisoformat(time).timestamp()
+
+
+class TimedCursor(sqlite3.Cursor):
+    # Statement execution and bulk fetches are recorded as db.execute and
+    # db.fetch spans; single-row fetches and iteration are not timed
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record('db.execute', time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record('db.execute', time.perf_counter() - start)
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            record('db.fetch', time.perf_counter() - start)
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            record('db.fetch', time.perf_counter() - start)
+
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # The shortcut methods bypass cursor(), so route them through it
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connect(path=None):
+    """Open a new connection with sqlite3.Row rows and the configured pragmas."""
+    conn = sqlite3.connect(path or DB_PATH, check_same_thread=False, factory=TimedConnection)
+    conn.row_factory = sqlite3.Row
+    for name, value in PRAGMAS.items():
+        conn.execute(f'PRAGMA {name} = {value}')
+    return conn
+
+
+def acquire_lease(conn, name, owner, ttl, now=None):
+    """
+    Take or renew the named lease for owner until now + ttl and return
+    whether owner holds it. A lease held by another owner is only taken once
+    it has expired.
+    """
+    now = time.time() if now is None else now
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        cursor = conn.cursor()
+        cursor.execute('INSERT OR IGNORE INTO leases (name, owner, expires) VALUES (?, ?, ?)', (name, owner, now + ttl))
+        if cursor.rowcount == 0:
+            cursor.execute('''
+                UPDATE leases SET owner = ?, expires = ? WHERE name = ? AND (owner = ? OR expires < ?)
+            ''', (owner, now + ttl, name, owner, now))
+        held = cursor.rowcount > 0
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return held
+
+
+def release_lease(conn, name, owner):
+    conn.execute('DELETE FROM leases WHERE name = ? AND owner = ?', (name, owner))
+    conn.commit()
+
+
+class ConnectionPool:
+    """
+    Hands out one reusable connection per thread.
+
+    Connections are opened on first use and kept for the life of the thread,
+    so a request only pays for sqlite3.connect once per worker thread, and
+    closed when the thread ends, so servers that start a thread per request
+    do not leak one connection per request. The
+    pool notices when it is used in a forked child (e.g. gunicorn --preload)
+    and drops the parent's connections instead of sharing them.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = {}
+        self._keys = itertools.count()
+        self._pid = os.getpid()
+
+    def _check_fork(self):
+        if os.getpid() != self._pid:
+            with self._lock:
+                self._local = threading.local()
+                self._connections = {}
+                self._pid = os.getpid()
+
+    def connection(self):
+        self._check_fork()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = connect(self.path)
+            self._local.conn = conn
+            with self._lock:
+                key = next(self._keys)
+                self._connections[key] = conn
+            weakref.finalize(threading.current_thread(), self._thread_ended, self._pid, key)
+        return conn
+
+    def _thread_ended(self, pid, key):
+        with self._lock:
+            # A forked child never closes the parent's connections
+            conn = self._connections.pop(key, None) if pid == self._pid == os.getpid() else None
+        if conn is not None:
+            conn.close()
+
+    def release(self, conn):
+        # Leave the connection clean for the next request on this thread
+        if conn is not None and conn.in_transaction:
+            conn.rollback()
+
+    def close_all(self):
+        with self._lock:
+            for conn in self._connections.values():
+                conn.close()
+            self._connections = {}
+            self._local = threading.local()
+
+
+pool = ConnectionPool()
@@ -0,0 +1,106 @@
+import contextvars
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Sector and industry almost never change, so they are kept in portfolio.db
+# and only refetched once they are older than this
+METADATA_MAX_AGE = 30 * 24 * 3600
+MAX_WORKERS = int(os.environ.get('FUNDAMENTALS_WORKERS', 8))
+UNKNOWN = 'Unknown'
+
+
+def fetch_metadata(provider, symbol):
+    # Returns (symbol, sector, industry), with None for both when the lookup fails
+    try:
+        sector, industry = provider.fields(symbol, 'sector', 'industry')
+        return symbol, sector, industry
+    except Exception as e:
+        logging.warning(f"Could not fetch sector/industry for {symbol}: {e}")
+        return symbol, None, None
+
+
+def read_metadata(conn, symbols, now):
+    """Return {symbol: (sector, industry)} for the symbols with a fresh stored entry."""
+    if not symbols:
+        return {}
+    cursor = conn.cursor()
+    placeholders = ','.join('?' * len(symbols))
+    cursor.execute(f'''
+        SELECT asset, sector, industry, updated_at FROM asset_metadata WHERE asset IN ({placeholders})
+    ''', symbols)
+    return {asset: (sector, industry) for asset, sector, industry, updated_at in cursor.fetchall()
+            if now - updated_at < METADATA_MAX_AGE}
+
+
+def store_metadata(conn, fetched, now):
+    """
+    Persist the (symbol, sector, industry) tuples that were found and return
+    them as {symbol: (sector, industry)}, with Unknown for failed lookups.
+    """
+    found = [(symbol, sector, industry, now) for symbol, sector, industry in fetched if sector is not None]
+    conn.cursor().executemany('''
+        INSERT OR REPLACE INTO asset_metadata (asset, sector, industry, updated_at)
+        VALUES (?, ?, ?, ?)
+    ''', found)
+    conn.commit()
+    return {symbol: (sector or UNKNOWN, industry or UNKNOWN) for symbol, sector, industry in fetched}
+
+
+def load_metadata(conn, symbols, provider, max_workers=MAX_WORKERS):
+    """
+    Return {symbol: (sector, industry)}, reading portfolio.db first and fetching
+    missing or stale entries concurrently on a bounded thread pool.
+    """
+    symbols = list(dict.fromkeys(symbols))
+    now = time.time()
+    metadata = read_metadata(conn, symbols, now)
+
+    missing = [symbol for symbol in symbols if symbol not in metadata]
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(missing))) as pool:
+            # Each task runs in a copy of the caller's context so its provider
+            # spans are counted against the request that asked for them
+            futures = [pool.submit(contextvars.copy_context().run, fetch_metadata, provider, symbol)
+                       for symbol in missing]
+            fetched = [future.result() for future in futures]
+        metadata.update(store_metadata(conn, fetched, now))
+
+    return metadata
+
+
+def aggregate_stats(positions, metadata, changes):
+    """
+    Weight each position by its cost basis and roll it up by sector and industry.
+
+    positions is a list of (asset, quantity, average_price); changes maps an
+    asset to its 52-week change. Returns the (industries, sectors) dicts served
+    by /api/getaggstats.
+    """
+    if not positions:
+        return {}, {}
+
+    import pandas as pd
+    frame = pd.DataFrame(positions, columns=['asset', 'quantity', 'average_price'])
+    frame['sector'] = frame['asset'].map(lambda asset: metadata.get(asset, (UNKNOWN, UNKNOWN))[0])
+    frame['industry'] = frame['asset'].map(lambda asset: metadata.get(asset, (UNKNOWN, UNKNOWN))[1])
+    frame['change'] = frame['asset'].map(changes).fillna(0.0)
+    frame['value'] = frame['quantity'] * frame['average_price']
+    frame['weighted_change'] = frame['value'] * frame['change']
+    # Longs and shorts can net to zero; those weights and changes are 0
+    # rather than infinite, which would not encode as JSON
+    total = frame['value'].sum() or float('nan')
+
+    by_sector = frame.groupby('sector')[['value', 'weighted_change']].sum()
+    sectors = pd.DataFrame({
+        'value': by_sector['value'] / total,
+        'change': by_sector['weighted_change'] / by_sector['value'].where(by_sector['value'] != 0)
+    }).fillna(0.0).to_dict('index')
+
+    by_industry = (frame.groupby(['sector', 'industry'])['value'].sum() / total).fillna(0.0)
+    industries = {}
+    for (sector, industry), weight in by_industry.items():
+        industries.setdefault(sector, {})[industry] = weight
+
+    return industries, sectors
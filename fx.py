@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+
+from market_data import MarketDataError
+from quote_cache import SingleFlight
+
+# Everything is valued in the account currency; prices of other instruments
+# are converted at the latest rate of their quote currency
+ACCOUNT_CURRENCY = os.environ.get('ACCOUNT_CURRENCY', 'USD')
+FX_RATE_TTL = float(os.environ.get('FX_RATE_TTL', 300))
+
+
+def pair_symbol(base, quote):
+    """Market data symbol of the base/quote currency pair, e.g. EURUSD=X."""
+    return f"{base}{quote}=X"
+
+
+class FXRates:
+    """
+    Conversion rates from any currency into one target currency.
+
+    Rates are cached for ttl seconds. Every rate missing from the cache is
+    fetched with a single batched quotes call, and concurrent requests for the
+    same missing currencies share that call.
+    """
+
+    def __init__(self, provider, target=ACCOUNT_CURRENCY, ttl=FX_RATE_TTL, clock=time.monotonic):
+        self.provider = provider
+        self.target = target
+        self.ttl = ttl
+        self.clock = clock
+        self.fetches = 0
+        self._rates = {}
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+
+    def _fetch(self, currencies):
+        symbols = {pair_symbol(currency, self.target): currency for currency in currencies}
+        quotes, errors = self.provider.quotes(list(symbols))
+        self.fetches += 1
+        now = self.clock()
+        with self._lock:
+            for symbol, quote in quotes.items():
+                self._rates[symbols[symbol]] = (quote['Price'], now)
+        return {symbols[symbol]: quote['Price'] for symbol, quote in quotes.items()}, errors
+
+    def rates(self, currencies):
+        """Return {currency: rate into target} for every currency; None means the target."""
+        now = self.clock()
+        rates, missing = {}, []
+        with self._lock:
+            for currency in dict.fromkeys(currencies):
+                code = currency or self.target
+                cached = self._rates.get(code)
+                if code == self.target:
+                    rates[currency] = 1.0
+                elif cached is not None and now - cached[1] < self.ttl:
+                    rates[currency] = cached[0]
+                else:
+                    missing.append(code)
+
+        if missing:
+            key = tuple(sorted(set(missing)))
+            fetched, errors = self._flight.do(key, lambda: self._fetch(key))
+            unavailable = sorted(set(missing) - set(fetched))
+            if unavailable:
+                raise MarketDataError(f"No {self.target} conversion rate for {', '.join(unavailable)}: "
+                                      f"{'; '.join(errors.values()) or 'not quoted'}")
+            for currency in currencies:
+                if currency in fetched:
+                    rates[currency] = fetched[currency]
+        return rates
+
+    def rate(self, currency):
+        return self.rates([currency])[currency]
+
+    def convert(self, amounts, currencies):
+        """
+        Convert an array of amounts, each in the matching currency, into the
+        target currency with one rate lookup per distinct currency.
+        """
+        import numpy as np
+        amounts = np.asarray(amounts, dtype=np.float64)
+        codes = np.array([currency or self.target for currency in currencies], dtype=object)
+        if len(codes) == 0:
+            return amounts.copy()
+        distinct, index = np.unique(codes, return_inverse=True)
+        rates = self.rates(list(distinct))
+        return amounts * np.array([rates[code] for code in distinct])[index]
+
+
+def quote_pairs(cursor, assets):
+    """{asset: currency pair symbol} for the given assets quoted in a currency other than the account's."""
+    cursor.execute('SELECT asset, quote_currency FROM instruments WHERE quote_currency IS NOT NULL AND quote_currency != ?',
+                   (ACCOUNT_CURRENCY,))
+    assets = set(assets)
+    return {asset: pair_symbol(currency, ACCOUNT_CURRENCY) for asset, currency in cursor.fetchall() if asset in assets}
+
+
+def trade_rates(cursor, assets, before=float('inf')):
+    """{asset: conversion rate of its latest trade before the epoch time before}."""
+    assets = list(assets)
+    if not assets:
+        return {}
+    cursor.execute(f'''
+        SELECT asset, fx_rate FROM trades WHERE asset IN ({','.join('?' * len(assets))}) AND ts < ? ORDER BY ts, id
+    ''', [*assets, before])
+    return dict(cursor.fetchall())
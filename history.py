@@ -0,0 +1,196 @@
+import argparse
+import sys
+import time
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+
+from db import connect
+from fx import quote_pairs, trade_rates
+from ledger import apply_position, cash_delta, start_amount
+
+# Daily portfolio snapshots in portfolio_history/portfolio_holdings, built
+# from the trades ledger and the stored daily closes in the bar store. Each
+# run picks up from the last stored day, so only new days are computed.
+
+
+def _day_start(day):
+    return datetime(day.year, day.month, day.day).timestamp()
+
+
+def _day(ts):
+    return datetime.fromtimestamp(ts).date()
+
+
+def _load_state(cursor):
+    """Return (last_date, cash, trade_count, positions) from the latest snapshot, or None."""
+    cursor.execute('SELECT date, cash, trade_count FROM portfolio_history ORDER BY date DESC LIMIT 1')
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    last_date, cash, trade_count = row
+    cursor.execute('SELECT asset, quantity, average_price FROM portfolio_holdings WHERE date = ?', (last_date,))
+    positions = {asset: (quantity, avg_price) for asset, quantity, avg_price in cursor.fetchall()}
+    return date.fromisoformat(last_date), cash, trade_count, positions
+
+
+def _is_current(cursor, last_date, trade_count):
+    # Trades imported with timestamps inside the materialized range rewrite
+    # the past; they show up as a different count of trades up to last_date
+    cursor.execute('SELECT COUNT(*) FROM trades WHERE ts < ?', (_day_start(last_date + timedelta(days=1)),))
+    return cursor.fetchone()[0] == trade_count
+
+
+def _load_closes(cursor, symbols, first, last):
+    """
+    Return {symbol: (days, closes)} with every daily close from first to last
+    plus the latest one before first, so each day can be priced as of its date.
+    """
+    closes = {}
+    for symbol in symbols:
+        cursor.execute('''
+            SELECT substr(date, 1, 10), close FROM bars
+            WHERE symbol = ? AND interval = '1d' AND date < ? ORDER BY ts DESC LIMIT 1
+        ''', (symbol, first.isoformat()))
+        rows = cursor.fetchall()
+        cursor.execute('''
+            SELECT substr(date, 1, 10), close FROM bars
+            WHERE symbol = ? AND interval = '1d' AND date >= ? AND date < ? ORDER BY ts
+        ''', (symbol, first.isoformat(), (last + timedelta(days=1)).isoformat()))
+        rows += cursor.fetchall()
+        closes[symbol] = ([row[0] for row in rows], [row[1] for row in rows])
+    return closes
+
+
+def _close_as_of(closes, symbol, day):
+    days, values = closes.get(symbol, ((), ()))
+    i = bisect_right(days, day)
+    return values[i - 1] if i else None
+
+
+def update_history(conn, provider=None, until=None, rebuild=False):
+    """
+    Append a snapshot for every new day up to until (default: yesterday, the
+    last complete day) and return how many days were added.
+
+    Days are the days with trades plus the trading days in the bar store.
+    Holdings are marked to the latest stored close on or before each day,
+    falling back to their average price, and converted into the account
+    currency. If the ledger no longer matches the
+    stored snapshots (backdated trades), the history is rebuilt from scratch.
+    With a provider, the daily bars of the symbols involved are synced first.
+    """
+    until = until or date.today() - timedelta(days=1)
+    cursor = conn.cursor()
+
+    state = None if rebuild else _load_state(cursor)
+    if state is not None and not _is_current(cursor, state[0], state[2]):
+        state = None
+    if state is None:
+        cursor.execute('DELETE FROM portfolio_history')
+        cursor.execute('DELETE FROM portfolio_holdings')
+        cursor.execute('SELECT MIN(ts) FROM trades')
+        first_ts = cursor.fetchone()[0]
+        if first_ts is None:
+            conn.commit()
+            return 0
+        first = _day(first_ts)
+        cash, trade_count, positions = start_amount, 0, {}
+    else:
+        last_date, cash, trade_count, positions = state
+        first = last_date + timedelta(days=1)
+    if first > until:
+        conn.commit()
+        return 0
+
+    cursor.execute('''
+        SELECT asset, quantity, ts, price, action, fx_rate FROM trades
+        WHERE ts >= ? AND ts < ? ORDER BY ts, id
+    ''', (_day_start(first), _day_start(until + timedelta(days=1))))
+    trades = cursor.fetchall()
+    symbols = sorted(set(positions) | {trade[0] for trade in trades})
+
+    # Instruments quoted in another currency are converted at the stored
+    # daily close of their currency pair, or their last trade's rate
+    pairs = quote_pairs(cursor, symbols)
+    rates = trade_rates(cursor, pairs, _day_start(first))
+    symbols = sorted(set(symbols) | set(pairs.values()))
+
+    if provider is not None:
+        from bars import sync
+        now = time.time()
+        for symbol in symbols:
+            sync(conn, provider, symbol, '1d', now)
+
+    closes = _load_closes(cursor, symbols, first, until)
+    first_day, last_day = first.isoformat(), until.isoformat()
+    days = {_day(trade[2]).isoformat() for trade in trades}
+    days.update(day for symbol_days, _ in closes.values() for day in symbol_days if first_day <= day <= last_day)
+
+    snapshots = []
+    holdings = []
+    i = 0
+    for day in sorted(days):
+        while i < len(trades) and _day(trades[i][2]).isoformat() == day:
+            asset, quantity, _, price, action, fx_rate = trades[i]
+            cash += cash_delta(quantity, price, action, fx_rate)
+            rates[asset] = fx_rate
+            positions[asset] = apply_position(positions.get(asset), quantity, price, action)
+            trade_count += 1
+            i += 1
+
+        # Positions evolve exactly as in the ledger; closed ones are kept but
+        # not stored as holdings, and _load_state reading them back as absent
+        # is equivalent because apply_position treats None as (0, 0)
+        cost_basis = market_value = 0.0
+        for asset, (quantity, avg_price) in positions.items():
+            if quantity == 0:
+                continue
+            close = _close_as_of(closes, asset, day)
+            value = quantity * (close if close is not None else avg_price)
+            basis = quantity * avg_price
+            if asset in pairs:
+                rate = _close_as_of(closes, pairs[asset], day)
+                value *= rate if rate is not None else rates.get(asset, 1.0)
+                basis *= rates.get(asset, 1.0)
+            cost_basis += basis
+            market_value += value
+            holdings.append((day, asset, quantity, avg_price, close, value))
+        snapshots.append((day, cash, cost_basis, market_value, cash + market_value, trade_count))
+
+    cursor.executemany('''
+        INSERT OR REPLACE INTO portfolio_history (date, cash, cost_basis, market_value, total_value, trade_count)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', snapshots)
+    cursor.executemany('''
+        INSERT OR REPLACE INTO portfolio_holdings (date, asset, quantity, average_price, close, market_value)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', holdings)
+    conn.commit()
+    return len(snapshots)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Materialize daily portfolio value snapshots into portfolio.db")
+    parser.add_argument('--db', default='portfolio.db')
+    parser.add_argument('--until', type=date.fromisoformat, help="last day to snapshot (default: yesterday)")
+    parser.add_argument('--rebuild', action='store_true', help="drop the stored snapshots and recompute them all")
+    parser.add_argument('--offline', action='store_true', help="use only closes already in the bar store")
+    args = parser.parse_args(argv)
+
+    from migrations import migrate
+    conn = connect(args.db)
+    try:
+        migrate(conn)
+        provider = None
+        if not args.offline:
+            from market_data import get_provider
+            provider = get_provider()
+        added = update_history(conn, provider, args.until, args.rebuild)
+        print(f"Added {added} daily snapshots")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
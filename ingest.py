@@ -0,0 +1,174 @@
+import argparse
+import csv
+import io
+import json
+import sys
+import time as timer
+from datetime import datetime
+
+from db import connect, to_epoch
+from ledger import apply_position, cash_delta, init_ledger
+from migrations import migrate
+from trade import ActionType
+
+CHUNK_SIZE = 10000
+
+# Accepted spellings of each column in CSV headers / JSON keys
+FIELD_ALIASES = {
+    'asset': ('asset', 'symbol', 'ticker'),
+    'quantity': ('quantity', 'qty', 'shares'),
+    'price': ('price', 'fill_price'),
+    'action': ('action', 'side'),
+    'time': ('time', 'timestamp', 'date'),
+}
+ACTIONS = {action.value.lower(): action.value for action in ActionType}
+
+
+def _get(record, field):
+    for alias in FIELD_ALIASES[field]:
+        for key in (alias, alias.capitalize(), alias.upper()):
+            if record.get(key) not in (None, ''):
+                return record[key]
+    return None
+
+
+def normalize(records):
+    """
+    Turn raw dicts into (asset, quantity, time, price, action) rows, raising
+    ValueError with the offending row number on bad input.
+    """
+    rows = []
+    now = datetime.now().isoformat()
+    for number, record in enumerate(records, start=1):
+        try:
+            asset = _get(record, 'asset')
+            if asset is None:
+                raise ValueError("missing asset")
+            asset = str(asset).strip().upper()
+            quantity = float(_get(record, 'quantity'))
+            price = float(_get(record, 'price'))
+            action = ACTIONS[str(_get(record, 'action')).strip().lower()]
+            time = _get(record, 'time')
+            time = datetime.fromisoformat(str(time)).isoformat() if time is not None else now
+        except (TypeError, ValueError, KeyError) as e:
+            raise ValueError(f"Invalid trade on row {number}: {record} ({e})")
+        if quantity <= 0 or price <= 0:
+            raise ValueError(f"Invalid trade on row {number}: {record}")
+        rows.append((asset, quantity, time, price, action))
+    return rows
+
+
+def parse_csv(text):
+    return normalize(csv.DictReader(io.StringIO(text)))
+
+
+def parse_json(data):
+    # Accept either a bare list of trades or {"trades": [...]}
+    if isinstance(data, dict):
+        data = data.get('trades', [])
+    if not isinstance(data, list):
+        raise ValueError("Expected a list of trades")
+    return normalize(data)
+
+
+def read_positions(cursor, assets, batch_size=500):
+    """{asset: (quantity, average_price)} for the given assets that have a position."""
+    assets = list(assets)
+    positions = {}
+    for offset in range(0, len(assets), batch_size):
+        batch = assets[offset:offset + batch_size]
+        cursor.execute(f'''
+            SELECT asset, quantity, average_price FROM aggregated_trades
+            WHERE asset IN ({', '.join('?' * len(batch))})
+        ''', batch)
+        positions.update((asset, (quantity, avg_price)) for asset, quantity, avg_price in cursor.fetchall())
+    return positions
+
+
+def ingest_trades(conn, rows, chunk_size=CHUNK_SIZE):
+    """
+    Insert normalized trades in chunked transactions.
+
+    Each chunk is inserted with executemany. The positions it touches are read
+    inside its write transaction, so trades made through the app during a long
+    import are never overwritten. Positions and the cash balance are folded in
+    memory and written once per touched asset per chunk, in the same
+    transaction as the chunk's trades. Returns throughput stats.
+    """
+    start = timer.perf_counter()
+    cursor = conn.cursor()
+    assets = {asset for asset, _, _, _, _ in rows}
+
+    for offset in range(0, len(rows), chunk_size):
+        chunk = rows[offset:offset + chunk_size]
+        # IMMEDIATE takes the write lock before the positions are read
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            positions = read_positions(cursor, {asset for asset, _, _, _, _ in chunk})
+            cash = 0.0
+            for asset, quantity, _, price, action in chunk:
+                positions[asset] = apply_position(positions.get(asset), quantity, price, action)
+                cash += cash_delta(quantity, price, action)
+
+            cursor.executemany('''
+                INSERT INTO trades (asset, quantity, time, ts, price, action)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', [(asset, quantity, time, to_epoch(time), price, action)
+                  for asset, quantity, time, price, action in chunk])
+            cursor.executemany('''
+                INSERT OR REPLACE INTO aggregated_trades (asset, quantity, average_price)
+                VALUES (?, ?, ?)
+            ''', [(asset, *position) for asset, position in positions.items()])
+            cursor.execute('''
+                UPDATE account SET balance = balance + ?, trade_count = trade_count + ?, version = version + 1
+                WHERE id = 1
+            ''', (cash, len(chunk)))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    elapsed = timer.perf_counter() - start
+    return {
+        'rows': len(rows),
+        'assets': len(assets),
+        'seconds': elapsed,
+        'rows_per_sec': len(rows) / elapsed if elapsed > 0 else 0.0
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import a CSV or JSON batch of trades into portfolio.db")
+    parser.add_argument('path', help="CSV or JSON file, or - for CSV on stdin")
+    parser.add_argument('--db', default='portfolio.db')
+    parser.add_argument('--format', choices=['csv', 'json'])
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ('json' if args.path.endswith('.json') else 'csv')
+    if args.path == '-':
+        text = sys.stdin.read()
+    else:
+        with open(args.path, newline='') as f:
+            text = f.read()
+
+    try:
+        rows = parse_json(json.loads(text)) if fmt == 'json' else parse_csv(text)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    conn = connect(args.db)
+    try:
+        migrate(conn)
+        init_ledger(conn)
+        stats = ingest_trades(conn, rows, args.chunk_size)
+    finally:
+        conn.close()
+    print(f"Imported {stats['rows']:,} trades across {stats['assets']} assets in {stats['seconds']:.2f}s "
+          f"({stats['rows_per_sec']:,.0f} rows/sec)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,12 @@
-import sqlite3
 from datetime import datetime
+from db import connect
+from ledger import reset
+from migrations import migrate
+from ingest import ingest_trades
 
 # Database connection
 def get_db_connection():
-    conn = sqlite3.connect('portfolio.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    return connect()
 
 # Portfolio Data
 portfolio = [
@@ -44,52 +45,19 @@ def initialize_portfolio():
     cursor = conn.cursor()
 
     try:
+        migrate(conn)
+
         # Clear the tables before adding new data
         cursor.execute('DELETE FROM trades')
-        cursor.execute('DELETE FROM aggregated_trades')
+        reset(cursor)
         conn.commit()
         print("Tables cleared.")
 
-        for entry in portfolio:
-            asset = entry["stock"]
-            quantity = entry["shares"]
-            price = entry["price"]
-            action = "Buy"  # All entries are "Buy" actions
-            time = datetime.now().isoformat()
-
-            # Insert into trades table
-            cursor.execute('''
-                INSERT INTO trades (asset, quantity, time, price, action)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (asset, quantity, time, price, action))
-
-            # Check if asset exists in aggregated_trades table
-            cursor.execute('''
-                SELECT quantity, average_price FROM aggregated_trades WHERE asset = ?
-            ''', (asset,))
-            row = cursor.fetchone()
+        # All entries are "Buy" actions, imported in one batch
+        time = datetime.now().isoformat()
+        rows = [(entry["stock"], entry["shares"], time, entry["price"], "Buy") for entry in portfolio]
+        ingest_trades(conn, rows)
 
-            if row:
-                current_quantity, current_avg_price = row
-                # Update quantity and calculate new average price
-                new_quantity = current_quantity + quantity
-                new_avg_price = ((current_avg_price * current_quantity) + (price * quantity)) / new_quantity
-
-                # Update aggregated_trades
-                cursor.execute('''
-                    UPDATE aggregated_trades
-                    SET quantity = ?, average_price = ?
-                    WHERE asset = ?
-                ''', (new_quantity, new_avg_price, asset))
-            else:
-                # Insert new record into aggregated_trades
-                cursor.execute('''
-                    INSERT INTO aggregated_trades (asset, quantity, average_price)
-                    VALUES (?, ?, ?)
-                ''', (asset, quantity, price))
-
-        # Commit the changes
-        conn.commit()
         print("Portfolio has been successfully initialized.")
     except Exception as e:
         print(f"Error initializing portfolio: {e}")
@@ -0,0 +1,193 @@
+import argparse
+import math
+import sys
+
+from db import connect, to_epoch
+
+start_amount = 100000
+
+# Trades that hand cash back to the account; everything else spends it
+CASH_IN_ACTIONS = ("Sell", "Short")
+
+
+def cash_delta(quantity, price, action, fx_rate=1.0):
+    # fx_rate converts a price in the trade's quote currency into account cash
+    return quantity * price * fx_rate * (1 if action in CASH_IN_ACTIONS else -1)
+
+
+def apply_position(position, quantity, price, action):
+    """
+    Return the new (quantity, average_price) of a position after a trade.
+    position is the current (quantity, average_price) or None if the asset
+    has never been traded. Shorts carry a negative quantity; the branches
+    match Portfolio.add_trade.
+    """
+    current_quantity, current_avg_price = position if position is not None else (0.0, 0.0)
+
+    if action == "Buy":
+        new_quantity = current_quantity + quantity
+        if current_quantity < 0:  # Covering a short position
+            # Flipping to a long position starts a new average
+            new_avg_price = price if new_quantity > 0 else current_avg_price
+        elif new_quantity != 0:  # Adding to a long position
+            new_avg_price = ((current_avg_price * current_quantity) + (price * quantity)) / new_quantity
+        else:
+            new_avg_price = current_avg_price
+    elif action == "Sell" and current_quantity > 0:  # Reducing a long position
+        new_quantity = current_quantity - quantity
+        # Flipping to a short position starts a new average
+        new_avg_price = price if new_quantity < 0 else current_avg_price
+    else:  # Adding to or opening a short position
+        new_quantity = current_quantity - quantity
+        size = abs(current_quantity) + quantity
+        new_avg_price = ((current_avg_price * abs(current_quantity)) + (price * quantity)) / size if size else current_avg_price
+    return new_quantity, new_avg_price
+
+
+def record_trade(cursor, asset, quantity, time, price, action, trade_type='Stock', base_currency=None,
+                 quote_currency=None, unit=None, fx_rate=1.0):
+    """
+    Insert a trade and update the position and cash balance it affects.
+    Runs on the caller's cursor so everything lands in one transaction.
+    Returns the new trade's id.
+    """
+    cursor.execute('''
+        INSERT INTO trades (asset, quantity, time, ts, price, action, trade_type, base_currency, quote_currency, unit, fx_rate)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (asset, quantity, time, to_epoch(time), price, action, trade_type, base_currency, quote_currency, unit, fx_rate))
+    trade_id = cursor.lastrowid
+    if trade_type != 'Stock' or quote_currency is not None:
+        cursor.execute('''
+            INSERT OR REPLACE INTO instruments (asset, trade_type, base_currency, quote_currency, unit)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (asset, trade_type, base_currency, quote_currency, unit))
+
+    cursor.execute('''
+        SELECT quantity, average_price FROM aggregated_trades WHERE asset = ?
+    ''', (asset,))
+    row = cursor.fetchone()
+    new_quantity, new_avg_price = apply_position(tuple(row) if row else None, quantity, price, action)
+    cursor.execute('''
+        INSERT OR REPLACE INTO aggregated_trades (asset, quantity, average_price)
+        VALUES (?, ?, ?)
+    ''', (asset, new_quantity, new_avg_price))
+
+    cursor.execute('''
+        UPDATE account SET balance = balance + ?, trade_count = trade_count + 1, version = version + 1 WHERE id = 1
+    ''', (cash_delta(quantity, price, action, fx_rate),))
+    return trade_id
+
+
+def portfolio_version(cursor):
+    """
+    A number that goes up with every committed change to the trades,
+    positions or cash balance. Responses derived from them can be cached on it.
+    """
+    cursor.execute('SELECT version FROM account WHERE id = 1')
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def get_balance(cursor):
+    cursor.execute('SELECT balance FROM account WHERE id = 1')
+    row = cursor.fetchone()
+    return row[0] if row else start_amount
+
+
+def replay(cursor):
+    """Recompute (balance, trade_count, positions) from the full trades table."""
+    balance = start_amount
+    trade_count = 0
+    positions = {}
+    cursor.execute('SELECT asset, quantity, price, action, fx_rate FROM trades ORDER BY id')
+    for asset, quantity, price, action, fx_rate in cursor:
+        balance += cash_delta(quantity, price, action, fx_rate)
+        positions[asset] = apply_position(positions.get(asset), quantity, price, action)
+        trade_count += 1
+    return balance, trade_count, positions
+
+
+def reset(cursor):
+    cursor.execute('DELETE FROM aggregated_trades')
+    # An upsert rather than a replace, so the version keeps counting up
+    cursor.execute('''
+        INSERT INTO account (id, balance, trade_count) VALUES (1, ?, 0)
+        ON CONFLICT (id) DO UPDATE SET balance = excluded.balance, trade_count = 0, version = version + 1
+    ''', (start_amount,))
+
+
+def rebuild(conn):
+    """Rewrite the account row and aggregated_trades from a replay of trades."""
+    cursor = conn.cursor()
+    balance, trade_count, positions = replay(cursor)
+    reset(cursor)
+    cursor.executemany('''
+        INSERT INTO aggregated_trades (asset, quantity, average_price) VALUES (?, ?, ?)
+    ''', [(asset, quantity, avg_price) for asset, (quantity, avg_price) in positions.items()])
+    cursor.execute('UPDATE account SET balance = ?, trade_count = ? WHERE id = 1', (balance, trade_count))
+    conn.commit()
+
+
+def verify(conn, tolerance=1e-6):
+    """Compare the materialized state against a replay and return a list of drift messages."""
+    cursor = conn.cursor()
+    balance, trade_count, positions = replay(cursor)
+    problems = []
+
+    cursor.execute('SELECT balance, trade_count FROM account WHERE id = 1')
+    row = cursor.fetchone()
+    if row is None:
+        problems.append("account row is missing")
+    else:
+        if not math.isclose(row[0], balance, rel_tol=1e-9, abs_tol=tolerance):
+            problems.append(f"balance is {row[0]}, replay gives {balance}")
+        if row[1] != trade_count:
+            problems.append(f"trade count is {row[1]}, replay gives {trade_count}")
+
+    cursor.execute('SELECT asset, quantity, average_price FROM aggregated_trades')
+    stored = {asset: (quantity, avg_price) for asset, quantity, avg_price in cursor.fetchall()}
+    for asset in sorted(set(stored) | set(positions)):
+        if asset not in stored:
+            problems.append(f"{asset}: missing from aggregated_trades")
+        elif asset not in positions:
+            problems.append(f"{asset}: in aggregated_trades but never traded")
+        elif not all(math.isclose(a, b, rel_tol=1e-9, abs_tol=tolerance) for a, b in zip(stored[asset], positions[asset])):
+            problems.append(f"{asset}: stored {stored[asset]}, replay gives {positions[asset]}")
+    return problems
+
+
+def init_ledger(conn):
+    # The account table is newer than most databases, so seed it from a replay
+    cursor = conn.cursor()
+    cursor.execute('SELECT 1 FROM account WHERE id = 1')
+    if cursor.fetchone() is None:
+        rebuild(conn)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check or rebuild the cash balance and positions against the trade history")
+    parser.add_argument('command', choices=['verify', 'rebuild'])
+    parser.add_argument('--db', default='portfolio.db')
+    args = parser.parse_args(argv)
+
+    from migrations import migrate
+
+    conn = connect(args.db)
+    try:
+        migrate(conn)
+        if args.command == 'rebuild':
+            rebuild(conn)
+            print("Ledger rebuilt from trades.")
+            return 0
+
+        problems = verify(conn)
+        for problem in problems:
+            print(problem)
+        print("Ledger is consistent." if not problems else f"Found {len(problems)} discrepancies.")
+        return 1 if problems else 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,342 @@
+import json
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import date, datetime, timedelta, timezone
+
+
+class MarketDataError(Exception):
+    """Raised when a provider cannot return data for a symbol."""
+
+
+class UnknownSymbolError(MarketDataError):
+    """Raised when a provider knows that a symbol does not exist."""
+
+
+class MarketDataProvider(ABC):
+    """
+    Interface implemented by every market-data backend.
+
+    info() returns the yfinance-style info dict for a symbol, history() returns
+    a list of bar dicts with 'Date', 'Timestamp' (epoch seconds), 'Open', 'High',
+    'Low', 'Close' and 'Volume' keys, covering either the period or everything
+    from start (epoch seconds) on, and recommendations() returns analyst
+    recommendations as a dict.
+    """
+
+    @abstractmethod
+    def info(self, symbol):
+        ...
+
+    @abstractmethod
+    def history(self, symbol, period, interval, start=None):
+        ...
+
+    @abstractmethod
+    def recommendations(self, symbol):
+        ...
+
+    def quotes(self, symbols):
+        """
+        Return (quotes, errors) for many symbols at once. Each quote has 'Price',
+        'PreviousClose' and 'Year' (52-week change); errors maps a symbol to the
+        reason it could not be quoted. Backends with a bulk API override this.
+        """
+        quotes, errors = {}, {}
+        for symbol in symbols:
+            try:
+                price, previous_close, year_change = self.fields(
+                    symbol, 'currentPrice', 'regularMarketPreviousClose', '52WeekChange')
+                quotes[symbol] = {'Price': price, 'PreviousClose': previous_close, 'Year': year_change}
+            except Exception as e:
+                errors[symbol] = str(e) or type(e).__name__
+        return quotes, errors
+
+    def field(self, symbol, name):
+        return self.info(symbol)[name]
+
+    def fields(self, symbol, *names):
+        info = self.info(symbol)
+        return [info[name] for name in names]
+
+
+class YFinanceProvider(MarketDataProvider):
+    """Live backend that talks to Yahoo Finance through yfinance."""
+
+    def __init__(self):
+        self._module = None
+
+    @property
+    def _yf(self):
+        # Imported on first use, so the fixture backend works without yfinance
+        # installed and creating the provider does not load yfinance and pandas
+        if self._module is None:
+            import yfinance
+            self._module = yfinance
+        return self._module
+
+    def info(self, symbol):
+        return self._yf.Ticker(symbol).info
+
+    def history(self, symbol, period, interval, start=None):
+        if start is not None:
+            frame = self._yf.Ticker(symbol).history(start=datetime.fromtimestamp(start, timezone.utc), interval=interval)
+        else:
+            frame = self._yf.Ticker(symbol).history(period=period, interval=interval)
+        return [
+            {
+                'Date': str(date),
+                'Timestamp': date.timestamp(),
+                'Open': row['Open'],
+                'High': row['High'],
+                'Low': row['Low'],
+                'Close': row['Close'],
+                'Volume': row['Volume']
+            } for date, row in frame.iterrows()
+        ]
+
+    def recommendations(self, symbol):
+        return self._yf.Ticker(symbol).get_recommendations().to_dict()
+
+    def quotes(self, symbols):
+        # One bulk download of a year of daily closes covers the last price,
+        # the previous close and the 52-week change for every symbol
+        symbols = list(symbols)
+        quotes, errors = {}, {}
+        if not symbols:
+            return quotes, errors
+        frame = self._yf.download(symbols, period='1y', interval='1d', group_by='ticker',
+                                  auto_adjust=False, progress=False, threads=True)
+        for symbol in symbols:
+            try:
+                if symbol in frame.columns.get_level_values(0):
+                    closes = frame[symbol]['Close'].dropna()
+                elif len(symbols) == 1 and 'Close' in frame.columns:
+                    closes = frame['Close'].dropna()
+                else:
+                    raise MarketDataError(f"No price data for {symbol}")
+                if closes.empty:
+                    raise MarketDataError(f"No price data for {symbol}")
+                price = float(closes.iloc[-1])
+                previous_close = float(closes.iloc[-2]) if len(closes) > 1 else price
+                quotes[symbol] = {
+                    'Price': price,
+                    'PreviousClose': previous_close,
+                    'Year': price / float(closes.iloc[0]) - 1
+                }
+            except Exception as e:
+                errors[symbol] = str(e) or type(e).__name__
+        return quotes, errors
+
+
+class FixtureProvider(MarketDataProvider):
+    """
+    Offline backend serving canned data, used for tests and local development.
+
+    The fixture maps each symbol to {"info": {...}, "history": {interval: [bar, ...]},
+    "recommendations": {...}}. An optional latency (seconds) is slept on every
+    call to simulate a slow upstream.
+    """
+
+    def __init__(self, data=None, path=None, latency=0.0):
+        if data is None:
+            with open(path) as f:
+                data = json.load(f)
+        self.data = data
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _symbol(self, symbol):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if symbol not in self.data:
+            raise UnknownSymbolError(f"No fixture data for {symbol}")
+        return self.data[symbol]
+
+    def info(self, symbol):
+        return dict(self._symbol(symbol).get('info', {}))
+
+    def history(self, symbol, period, interval, start=None):
+        bars = self._symbol(symbol).get('history', {}).get(interval, [])
+        bars = [dict(bar, Timestamp=bar.get('Timestamp', datetime.fromisoformat(bar['Date']).timestamp())) for bar in bars]
+        if start is not None:
+            bars = [bar for bar in bars if bar['Timestamp'] >= start]
+        return bars
+
+    def recommendations(self, symbol):
+        return self._symbol(symbol).get('recommendations', {})
+
+
+class SyntheticProvider(MarketDataProvider):
+    """
+    Offline backend that makes up data for any symbol, for benchmarks and load
+    tests. Each symbol gets a daily random walk of trading-day closes ending on
+    end (default today), seeded from the seed and the symbol, plus a sector,
+    an industry and analyst counts. The same seed always produces the same
+    prices; only their dates move with end. Symbols
+    ending in =X are currency pairs and trade around 1. Every interval is
+    served from the daily bars.
+    """
+
+    SECTORS = {
+        'Technology': ('Software', 'Semiconductors', 'Consumer Electronics'),
+        'Financial Services': ('Banks', 'Asset Management', 'Insurance'),
+        'Healthcare': ('Biotechnology', 'Medical Devices', 'Drug Manufacturers'),
+        'Energy': ('Oil & Gas', 'Uranium', 'Utilities'),
+        'Consumer Cyclical': ('Auto Manufacturers', 'Specialty Retail', 'Restaurants'),
+        'Industrials': ('Aerospace & Defense', 'Railroads', 'Machinery'),
+    }
+    PERIOD_DAYS = {'1d': 1, '5d': 5, '1mo': 31, '3mo': 92, '6mo': 183, '1y': 366, '2y': 731, '5y': 1827}
+
+    def __init__(self, seed=0, days=504, end=None, latency=0.0):
+        self.seed = seed
+        self.days = days
+        self.end = end or date.today()
+        self.latency = latency
+        self.calls = 0
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _call(self, symbol):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self.series(symbol)
+
+    def series(self, symbol):
+        """(bars, info) for a symbol, generated on first use and kept."""
+        cached = self._series.get(symbol)
+        if cached is not None:
+            return cached
+        rng = random.Random(f"{self.seed}:{symbol}")
+        fx_pair = symbol.endswith('=X')
+        close = rng.uniform(0.5, 2.0) if fx_pair else rng.uniform(10, 500)
+        drift, volatility = (0.0, 0.005) if fx_pair else (rng.uniform(-0.0005, 0.001), rng.uniform(0.01, 0.03))
+
+        days = []
+        day = self.end
+        while len(days) < self.days:
+            if day.weekday() < 5:
+                days.append(day)
+            day -= timedelta(days=1)
+        bars = []
+        for day in reversed(days):
+            open_ = close
+            close = open_ * (1 + rng.gauss(drift, volatility))
+            stamp = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+            bars.append({
+                'Date': stamp.isoformat(),
+                'Timestamp': stamp.timestamp(),
+                'Open': open_,
+                'High': max(open_, close) * (1 + rng.uniform(0, volatility)),
+                'Low': min(open_, close) * (1 - rng.uniform(0, volatility)),
+                'Close': close,
+                'Volume': rng.randrange(100000, 10000000)
+            })
+
+        sector = rng.choice(sorted(self.SECTORS))
+        year_ago = bars[max(0, len(bars) - 253)]['Close']
+        info = {
+            'symbol': symbol,
+            'shortName': f"{symbol} Synthetic",
+            'longName': f"{symbol} Synthetic Holdings",
+            'currency': 'USD',
+            'sector': sector,
+            'industry': rng.choice(self.SECTORS[sector]),
+            'currentPrice': bars[-1]['Close'],
+            'regularMarketPreviousClose': bars[-2]['Close'],
+            '52WeekChange': bars[-1]['Close'] / year_ago - 1,
+            'marketCap': int(bars[-1]['Close'] * rng.randrange(10 ** 7, 10 ** 10))
+        }
+        recommendations = {name: {0: rng.randrange(0, 20)}
+                           for name in ('strongBuy', 'buy', 'hold', 'sell', 'strongSell')}
+        recommendations['period'] = {0: '0m'}
+        with self._lock:
+            return self._series.setdefault(symbol, (bars, info, recommendations))
+
+    def info(self, symbol):
+        return dict(self._call(symbol)[1])
+
+    def history(self, symbol, period, interval, start=None):
+        bars = self._call(symbol)[0]
+        if start is None and period in self.PERIOD_DAYS:
+            start = bars[-1]['Timestamp'] - self.PERIOD_DAYS[period] * 86400
+        return [dict(bar) for bar in bars if start is None or bar['Timestamp'] >= start]
+
+    def recommendations(self, symbol):
+        return self._call(symbol)[2]
+
+    def quotes(self, symbols):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        quotes = {}
+        for symbol in symbols:
+            info = self.series(symbol)[1]
+            quotes[symbol] = {'Price': info['currentPrice'], 'PreviousClose': info['regularMarketPreviousClose'],
+                              'Year': info['52WeekChange']}
+        return quotes, {}
+
+
+def quote_summary(quote):
+    """The per-symbol payload served by /api/quotes and the price stream."""
+    previous_close = quote['PreviousClose']
+    return {
+        "Price": quote['Price'],
+        "PreviousClose": previous_close,
+        "Day": (quote['Price'] - previous_close) / previous_close if previous_close else None,
+        "Year": quote['Year']
+    }
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def create_provider(name=None):
+    """
+    Build the configured backend wrapped in the quote cache.
+
+    The backend is picked by MARKET_DATA_PROVIDER ("yfinance", "fixture" or
+    "synthetic"); the fixture backend reads MARKET_DATA_FIXTURE and the
+    synthetic one is seeded from MARKET_DATA_SEED.
+    """
+    from metrics import InstrumentedProvider
+    from quote_cache import CachedProvider
+
+    name = name or os.environ.get('MARKET_DATA_PROVIDER', 'yfinance')
+    if name == 'yfinance':
+        backend = YFinanceProvider()
+    elif name == 'fixture':
+        path = os.environ.get('MARKET_DATA_FIXTURE', os.path.join(os.path.dirname(__file__), 'fixtures', 'market_data.json'))
+        backend = FixtureProvider(path=path, latency=float(os.environ.get('MARKET_DATA_LATENCY', 0)))
+    elif name == 'synthetic':
+        backend = SyntheticProvider(seed=int(os.environ.get('MARKET_DATA_SEED', 0)),
+                                    latency=float(os.environ.get('MARKET_DATA_LATENCY', 0)))
+    else:
+        raise ValueError(f"Unknown market data provider: {name}")
+    return CachedProvider(InstrumentedProvider(backend))
+
+
+def get_provider():
+    """Return the process-wide cached provider, creating it on first use."""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = create_provider()
+    return _provider
+
+
+def set_provider(provider):
+    """Replace the process-wide provider, e.g. with a fixture backend in tests."""
+    global _provider
+    with _provider_lock:
+        _provider = provider
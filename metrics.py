@@ -0,0 +1,239 @@
+import contextvars
+import cProfile
+import os
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from market_data import MarketDataProvider
+
+# Process-wide counters and histograms rendered in the Prometheus text format
+# by /metrics, plus per-request timing spans. Spans are summed per name for
+# the current request, so a response can say how much of its time went to the
+# market data provider, SQLite and JSON encoding.
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Profiling is opt-in: with PROFILE_REQUESTS set, a request carrying the
+# X-Profile header (or a random PROFILE_SAMPLE_RATE fraction of requests) is
+# run under cProfile and its stats are written to PROFILE_DIR
+PROFILE_REQUESTS = os.environ.get('PROFILE_REQUESTS', '').lower() in ('1', 'true', 'yes')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_HEADER = 'X-Profile'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(self.labelnames, labels)} {value}')
+        return lines
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label set, as Prometheus expects."""
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += n
+                    le = f'le="{bound}"'
+                    lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, (le,))} {cumulative}')
+                lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {total}')
+                lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+class Registry:
+    """
+    Holds the metrics and renders them. Collectors are callables returning
+    (name, type, help, value) tuples read at scrape time, for counts kept
+    elsewhere such as the quote cache's hits and misses.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help, labelnames=()):
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            for name, kind, help, value in collect():
+                lines.extend((f'# HELP {name} {help}', f'# TYPE {name} {kind}', f'{name} {value}'))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+http_requests = registry.counter('http_requests_total', "HTTP requests handled", ('method', 'route', 'status'))
+http_duration = registry.histogram('http_request_duration_seconds', "Time to produce a response", ('route',))
+span_duration = registry.histogram('span_duration_seconds', "Time spent in instrumented spans", ('span',))
+upstream_calls = registry.counter('market_data_upstream_calls_total', "Calls made to the market data backend",
+                                  ('method',))
+upstream_errors = registry.counter('market_data_upstream_errors_total', "Market data backend calls that raised",
+                                   ('method',))
+profiles_written = registry.counter('profiles_written_total', "Request profiles written to disk")
+
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_request_spans = contextvars.ContextVar('request_spans', default=None)
+
+
+def record(name, seconds):
+    """Add one timed span to the histograms and to the current request, if any."""
+    span_duration.observe(seconds, name)
+    spans = _request_spans.get()
+    if spans is not None:
+        total = spans.get(name)
+        spans[name] = (total[0] + seconds, total[1] + 1) if total else (seconds, 1)
+
+
+@contextmanager
+def span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def start_request():
+    """Collect the spans of everything that runs in the current context from now on into a fresh dict."""
+    spans = {}
+    _request_spans.set(spans)
+    return spans
+
+
+def server_timing(spans, total=None):
+    """The spans as a Server-Timing header value, in milliseconds."""
+    parts = [f'{name};dur={seconds * 1000:.2f};desc="{count}x"' for name, (seconds, count) in sorted(spans.items())]
+    if total is not None:
+        parts.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(parts)
+
+
+class InstrumentedProvider(MarketDataProvider):
+    """
+    Wraps a market data backend so every call that reaches it is counted and
+    timed as a provider.<method> span. Sits under the quote cache, so it sees
+    upstream traffic only.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def _call(self, method, *args):
+        upstream_calls.inc(method)
+        start = time.perf_counter()
+        try:
+            return getattr(self.backend, method)(*args)
+        except Exception:
+            upstream_errors.inc(method)
+            raise
+        finally:
+            record(f'provider.{method}', time.perf_counter() - start)
+
+    def info(self, symbol):
+        return self._call('info', symbol)
+
+    def history(self, symbol, period, interval, start=None):
+        return self._call('history', symbol, period, interval, start)
+
+    def recommendations(self, symbol):
+        return self._call('recommendations', symbol)
+
+    def quotes(self, symbols):
+        return self._call('quotes', symbols)
+
+    def __getattr__(self, name):
+        # Backend specifics such as the fixture's call count
+        return getattr(self.backend, name)
+
+
+def should_profile(headers):
+    if not PROFILE_REQUESTS:
+        return False
+    return bool(headers.get(PROFILE_HEADER)) or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE)
+
+
+def start_profile():
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def dump_profile(profiler, label, directory=None):
+    """Stop the profiler and write its stats to <directory>/<time>-<label>.prof; returns the path."""
+    profiler.disable()
+    directory = directory or PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    label = re.sub(r'[^A-Za-z0-9_.-]+', '_', label).strip('_') or 'root'
+    path = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 10 ** 9:09d}-{label}.prof")
+    profiler.dump_stats(path)
+    profiles_written.inc()
+    return path
@@ -0,0 +1,320 @@
+import argparse
+import sys
+
+from db import connect, to_epoch
+
+# The schema version lives in SQLite's user_version header field. Each
+# migration runs in its own transaction together with the version bump, so a
+# database is never left half-migrated.
+
+BATCH_SIZE = 10000
+
+
+def create_base_schema(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS trades (
+        id INTEGER PRIMARY KEY,
+        asset TEXT,
+        quantity REAL,
+        time TEXT,
+        price REAL,
+        action TEXT
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS aggregated_trades (
+        asset TEXT PRIMARY KEY,
+        quantity REAL,
+        average_price REAL
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS account (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        balance REAL NOT NULL,
+        trade_count INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS asset_metadata (
+        asset TEXT PRIMARY KEY,
+        sector TEXT,
+        industry TEXT,
+        updated_at REAL
+    )
+    ''')
+
+
+def add_trade_timestamps(cursor):
+    # Rebuild trades with a numeric epoch column next to the ISO text and a
+    # constraint on action, copying rows over in batches
+    cursor.execute('''
+    CREATE TABLE trades_new (
+        id INTEGER PRIMARY KEY,
+        asset TEXT NOT NULL,
+        quantity REAL NOT NULL,
+        time TEXT NOT NULL,
+        ts REAL NOT NULL,
+        price REAL NOT NULL,
+        action TEXT NOT NULL CHECK (action IN ('Buy', 'Sell', 'Short'))
+    )
+    ''')
+    actions = {'buy': 'Buy', 'sell': 'Sell', 'short': 'Short'}
+    source = cursor.connection.cursor()
+    source.execute('SELECT id, asset, quantity, time, price, action FROM trades ORDER BY id')
+    while True:
+        batch = source.fetchmany(BATCH_SIZE)
+        if not batch:
+            break
+        rows = []
+        for trade_id, asset, quantity, time, price, action in batch:
+            if str(action).lower() not in actions:
+                raise ValueError(f"Trade {trade_id} has unknown action {action!r}")
+            rows.append((trade_id, asset, quantity, time, to_epoch(time), price, actions[str(action).lower()]))
+        cursor.executemany('''
+            INSERT INTO trades_new (id, asset, quantity, time, ts, price, action)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+    cursor.execute('DROP TABLE trades')
+    cursor.execute('ALTER TABLE trades_new RENAME TO trades')
+
+
+def add_trade_indexes(cursor):
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_trades_asset_ts ON trades (asset, ts)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_trades_ts ON trades (ts)')
+
+
+def create_portfolio_history(cursor):
+    # Schema only: migration 6 replaces this table, and history.py fills it
+    cursor.execute('DROP TABLE IF EXISTS portfolio_history')
+    cursor.execute('''
+    CREATE TABLE portfolio_history (
+        date TEXT PRIMARY KEY,
+        cash REAL NOT NULL,
+        cost_basis REAL NOT NULL,
+        trade_count INTEGER NOT NULL
+    )
+    ''')
+
+
+def create_bar_store(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS bars (
+        symbol TEXT NOT NULL,
+        interval TEXT NOT NULL,
+        ts REAL NOT NULL,
+        date TEXT NOT NULL,
+        open REAL,
+        high REAL,
+        low REAL,
+        close REAL,
+        volume REAL,
+        PRIMARY KEY (symbol, interval, ts)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS bar_sync (
+        symbol TEXT NOT NULL,
+        interval TEXT NOT NULL,
+        last_ts REAL,
+        synced_at REAL NOT NULL,
+        PRIMARY KEY (symbol, interval)
+    )
+    ''')
+
+
+def add_portfolio_valuation(cursor):
+    # Snapshots now carry mark-to-market values and per-asset holdings; the
+    # table from migration 4 is replaced and history.py fills the new ones
+    cursor.execute('DROP TABLE IF EXISTS portfolio_history')
+    cursor.execute('''
+    CREATE TABLE portfolio_history (
+        date TEXT PRIMARY KEY,
+        cash REAL NOT NULL,
+        cost_basis REAL NOT NULL,
+        market_value REAL NOT NULL,
+        total_value REAL NOT NULL,
+        trade_count INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE portfolio_holdings (
+        date TEXT NOT NULL,
+        asset TEXT NOT NULL,
+        quantity REAL NOT NULL,
+        average_price REAL NOT NULL,
+        close REAL,
+        market_value REAL NOT NULL,
+        PRIMARY KEY (date, asset)
+    ) WITHOUT ROWID
+    ''')
+
+
+def create_orders(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS orders (
+        id INTEGER PRIMARY KEY,
+        asset TEXT NOT NULL,
+        action TEXT NOT NULL CHECK (action IN ('Buy', 'Sell', 'Short')),
+        quantity REAL NOT NULL CHECK (quantity > 0),
+        order_type TEXT NOT NULL CHECK (order_type IN ('limit', 'stop', 'stop_limit')),
+        limit_price REAL,
+        stop_price REAL,
+        status TEXT NOT NULL DEFAULT 'open' CHECK (status IN ('open', 'triggered', 'filled', 'cancelled')),
+        created_ts REAL NOT NULL,
+        updated_ts REAL NOT NULL,
+        fill_price REAL,
+        trade_id INTEGER REFERENCES trades (id)
+    )
+    ''')
+    # Only working orders are loaded back into the book on startup
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_orders_working ON orders (asset) WHERE status IN ('open', 'triggered')
+    ''')
+
+
+def add_trade_types(cursor):
+    # Currency and commodity trades carry their pair or unit, and the rate
+    # that converted their quote currency into account cash at trade time
+    cursor.execute('''
+        ALTER TABLE trades ADD COLUMN trade_type TEXT NOT NULL DEFAULT 'Stock'
+        CHECK (trade_type IN ('Stock', 'Currency', 'Commodity'))
+    ''')
+    cursor.execute('ALTER TABLE trades ADD COLUMN base_currency TEXT')
+    cursor.execute('ALTER TABLE trades ADD COLUMN quote_currency TEXT')
+    cursor.execute('ALTER TABLE trades ADD COLUMN unit TEXT')
+    cursor.execute('ALTER TABLE trades ADD COLUMN fx_rate REAL NOT NULL DEFAULT 1.0')
+    # One row per non-default instrument; assets without one are stocks
+    # quoted in the account currency
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS instruments (
+        asset TEXT PRIMARY KEY,
+        trade_type TEXT NOT NULL,
+        base_currency TEXT,
+        quote_currency TEXT,
+        unit TEXT
+    )
+    ''')
+
+
+def add_portfolio_version(cursor):
+    # Bumped by every write to the trades, positions or cash, and never
+    # reset, so it can key caches of anything derived from them
+    cursor.execute('ALTER TABLE account ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+    cursor.execute('UPDATE account SET version = trade_count')
+
+
+def _position_v10(position, quantity, price, action):
+    # Frozen copy of ledger.apply_position as of this migration, so later
+    # changes to the ledger cannot change what the migration computes
+    current_quantity, current_avg_price = position if position is not None else (0.0, 0.0)
+    if action == "Buy":
+        new_quantity = current_quantity + quantity
+        if current_quantity < 0:
+            new_avg_price = price if new_quantity > 0 else current_avg_price
+        elif new_quantity != 0:
+            new_avg_price = ((current_avg_price * current_quantity) + (price * quantity)) / new_quantity
+        else:
+            new_avg_price = current_avg_price
+    elif action == "Sell" and current_quantity > 0:
+        new_quantity = current_quantity - quantity
+        new_avg_price = price if new_quantity < 0 else current_avg_price
+    else:
+        new_quantity = current_quantity - quantity
+        size = abs(current_quantity) + quantity
+        new_avg_price = ((current_avg_price * abs(current_quantity)) + (price * quantity)) / size if size else current_avg_price
+    return new_quantity, new_avg_price
+
+
+def recompute_positions(cursor):
+    # Average prices were wrong for covered, flipped and added-to shorts, so
+    # every position is replayed with the corrected arithmetic
+    positions = {}
+    source = cursor.connection.cursor()
+    source.execute('SELECT asset, quantity, price, action FROM trades ORDER BY id')
+    for asset, quantity, price, action in source:
+        positions[asset] = _position_v10(positions.get(asset), quantity, price, action)
+    cursor.execute('DELETE FROM aggregated_trades')
+    cursor.executemany('''
+        INSERT INTO aggregated_trades (asset, quantity, average_price) VALUES (?, ?, ?)
+    ''', [(asset, quantity, avg_price) for asset, (quantity, avg_price) in positions.items()])
+    cursor.execute('UPDATE account SET version = version + 1')
+
+
+def clear_portfolio_history(cursor):
+    # Snapshots were materialized with the old short average prices; history.py
+    # rebuilds them from the ledger on its next run
+    cursor.execute('DELETE FROM portfolio_history')
+    cursor.execute('DELETE FROM portfolio_holdings')
+
+
+def create_leases(cursor):
+    # Jobs that one process at a time may run, such as order matching; the
+    # holder renews its row and another process takes over once it expires
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS leases (
+        name TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires REAL NOT NULL
+    )
+    ''')
+
+
+MIGRATIONS = [
+    (1, "base schema", create_base_schema),
+    (2, "epoch timestamps and action constraint on trades", add_trade_timestamps),
+    (3, "trades indexes on (asset, ts) and (ts)", add_trade_indexes),
+    (4, "portfolio_history table", create_portfolio_history),
+    (5, "historical bar store", create_bar_store),
+    (6, "portfolio_history market values and portfolio_holdings", add_portfolio_valuation),
+    (7, "resting limit and stop orders", create_orders),
+    (8, "trade types, currencies and instruments", add_trade_types),
+    (9, "portfolio version on the account row", add_portfolio_version),
+    (10, "recompute positions with short-aware average prices", recompute_positions),
+    (11, "rematerialize portfolio history with short-aware average prices", clear_portfolio_history),
+    (12, "leases for single-process background jobs", create_leases),
+]
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn, verbose=False):
+    """Apply every pending migration in order and return the resulting version."""
+    for version, description, step in MIGRATIONS:
+        if version <= schema_version(conn):
+            continue
+        # IMMEDIATE takes the write lock up front, so workers starting at the
+        # same time apply each migration once
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if schema_version(conn) < version:
+                step(conn.cursor())
+                conn.execute(f'PRAGMA user_version = {version}')
+                if verbose:
+                    print(f"Applied migration {version}: {description}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return schema_version(conn)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bring portfolio.db up to the latest schema version")
+    parser.add_argument('--db', default='portfolio.db')
+    args = parser.parse_args(argv)
+
+    conn = connect(args.db)
+    try:
+        before = schema_version(conn)
+        after = migrate(conn, verbose=True)
+        print(f"Schema version {before} -> {after}" if after != before else f"Schema is up to date (version {after})")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,180 @@
+import argparse
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+import numpy as np
+
+from risk import PERIODS_PER_YEAR, returns_matrix, last_prices, load_closes
+
+METHODS = ('cholesky', 'bootstrap')
+BAND_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+TERMINAL_PERCENTILES = (1, 5, 10, 25, 50, 75, 90, 95, 99)
+
+# Per-chunk working set: float32 asset growth and per-step book values. The
+# chunk size is derived from this budget, never from the worker count, so a
+# given seed gives the same paths however the chunks are spread out.
+MAX_CHUNK_BYTES = 64 * 1024 * 1024
+
+# Worker-side model, set once per process by _init_worker
+_model = {}
+
+
+def chunk_size(steps, assets, max_bytes=MAX_CHUNK_BYTES):
+    per_path = 4 * (steps + 3 * assets)
+    return max(1, max_bytes // per_path)
+
+
+def _init_worker(model):
+    _model.update(model)
+
+
+def _simulate_chunk(task):
+    """Simulate one chunk of paths and return its terminal values and per-step band quantiles."""
+    paths, seed = task
+    method = _model['method']
+    exposures = _model['exposures']
+    steps = _model['steps']
+    rng = np.random.default_rng(seed)
+
+    growth = np.ones((paths, len(exposures)), dtype=np.float32)
+    values = np.empty((paths, steps), dtype=np.float32)
+    weights = exposures.astype(np.float32)
+    for t in range(steps):
+        if method == 'bootstrap':
+            # Whole historical days are drawn, which keeps their cross-asset correlation
+            returns = _model['history'][rng.integers(0, len(_model['history']), paths)]
+        else:
+            returns = rng.standard_normal((paths, len(exposures)), dtype=np.float32) @ _model['factor_t']
+            returns += _model['mean']
+        growth *= 1 + returns
+        values[:, t] = growth @ weights
+
+    bands = np.quantile(values, BAND_QUANTILES, axis=0)
+    return values[:, -1].astype(np.float64), bands, paths
+
+
+def simulate(returns, exposures, paths=10000, steps=PERIODS_PER_YEAR, method='cholesky', seed=0,
+             confidence=0.95, workers=None, max_chunk_bytes=MAX_CHUNK_BYTES):
+    """
+    Project a book of dollar exposures forward over steps periods.
+
+    'cholesky' draws correlated normal returns with the mean and covariance
+    of the historical returns matrix; 'bootstrap' resamples whole historical
+    periods. Paths are generated in chunks sized to max_chunk_bytes, each
+    seeded from its own child of SeedSequence(seed), and spread over a
+    process pool when workers is more than 1. Terminal statistics use every
+    path; the per-step bands are the path-weighted average of each chunk's
+    quantiles.
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {', '.join(METHODS)}")
+    returns = np.asarray(returns, dtype=np.float64)
+    exposures = np.asarray(exposures, dtype=np.float64)
+    initial = float(exposures.sum())
+
+    model = {'method': method, 'exposures': exposures, 'steps': steps}
+    if method == 'bootstrap':
+        if len(returns) == 0:
+            raise ValueError("bootstrap needs at least one historical period")
+        model['history'] = returns.astype(np.float32)
+    else:
+        if len(returns) < 2:
+            raise ValueError("cholesky needs at least two historical periods")
+        covariance = np.atleast_2d(np.cov(returns, rowvar=False))
+        # A small ridge keeps the factorization stable for singular or nearly
+        # collinear histories
+        ridge = 1e-12 * max(float(np.trace(covariance)), 1e-12)
+        factor = np.linalg.cholesky(covariance + ridge * np.eye(len(covariance)))
+        model['factor_t'] = factor.T.astype(np.float32)
+        model['mean'] = returns.mean(axis=0).astype(np.float32)
+
+    size = chunk_size(steps, len(exposures), max_chunk_bytes)
+    counts = [size] * (paths // size) + ([paths % size] if paths % size else [])
+    seeds = np.random.SeedSequence(seed).spawn(len(counts))
+    tasks = list(zip(counts, seeds))
+
+    start = time.perf_counter()
+    if workers and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model,)) as pool:
+            results = list(pool.map(_simulate_chunk, tasks))
+    else:
+        _init_worker(model)
+        results = [_simulate_chunk(task) for task in tasks]
+    elapsed = time.perf_counter() - start
+
+    terminal = np.concatenate([result[0] for result in results])
+    bands = sum(result[1] * result[2] for result in results) / paths
+    pnl = terminal - initial
+    cutoff = np.quantile(pnl, 1 - confidence)
+    counts_hist, edges = np.histogram(terminal, bins=50)
+
+    return {
+        'method': method,
+        'seed': seed,
+        'paths': paths,
+        'steps': steps,
+        'chunks': len(tasks),
+        'seconds': elapsed,
+        'initial_value': initial,
+        'terminal': {
+            'mean': float(terminal.mean()),
+            'std': float(terminal.std()),
+            'percentiles': {str(p): float(v) for p, v in zip(TERMINAL_PERCENTILES, np.percentile(terminal, TERMINAL_PERCENTILES))},
+            'histogram': {'counts': counts_hist.tolist(), 'edges': edges.tolist()},
+        },
+        'confidence': confidence,
+        'var': float(-cutoff),
+        'cvar': float(-pnl[pnl <= cutoff].mean()),
+        'bands': {str(q): band.tolist() for q, band in zip(BAND_QUANTILES, bands.astype(np.float64))},
+    }
+
+
+def load_book(conn, as_of=None, lookback=PERIODS_PER_YEAR, provider=None):
+    """(symbols, historical returns, dollar exposures) of the current aggregated_trades book."""
+    cursor = conn.cursor()
+    cursor.execute('SELECT asset, quantity FROM aggregated_trades WHERE quantity != 0 ORDER BY asset')
+    holdings = cursor.fetchall()
+    symbols = [row[0] for row in holdings]
+    closes = load_closes(conn, symbols, as_of or date.today(), lookback, provider)
+    exposures = np.nan_to_num(np.array([row[1] for row in holdings], dtype=np.float64) * last_prices(closes))
+    return symbols, returns_matrix(closes), exposures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monte Carlo projection of the portfolio or a synthetic book")
+    parser.add_argument('--paths', type=int, default=100000)
+    parser.add_argument('--steps', type=int, default=PERIODS_PER_YEAR)
+    parser.add_argument('--method', choices=METHODS, default='cholesky')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--synthetic', type=int, metavar='N', help="simulate N synthetic assets instead of portfolio.db")
+    parser.add_argument('--db', default='portfolio.db')
+    args = parser.parse_args(argv)
+
+    if args.synthetic:
+        rng = np.random.default_rng(args.seed)
+        mixing = rng.normal(0, 0.01, (args.synthetic, args.synthetic)) / np.sqrt(args.synthetic)
+        returns = rng.normal(0.0003, 0.01, (PERIODS_PER_YEAR, 1)) + rng.standard_normal((PERIODS_PER_YEAR, args.synthetic)) @ mixing
+        exposures = np.full(args.synthetic, 10000.0)
+    else:
+        from db import connect
+        conn = connect(args.db)
+        try:
+            _, returns, exposures = load_book(conn)
+        finally:
+            conn.close()
+
+    result = simulate(returns, exposures, args.paths, args.steps, args.method, args.seed, workers=args.workers)
+    terminal = result['terminal']['percentiles']
+    print(f"{args.paths:,} paths x {args.steps} steps x {len(exposures)} assets in {result['seconds']:.2f}s "
+          f"({result['chunks']} chunks)")
+    print(f"initial {result['initial_value']:,.2f}, median terminal {terminal['50']:,.2f}, "
+          f"5th-95th {terminal['5']:,.2f} to {terminal['95']:,.2f}")
+    print(f"VaR({result['confidence']:.0%}) {result['var']:,.2f}, CVaR {result['cvar']:,.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
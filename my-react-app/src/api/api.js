@@ -144,6 +144,26 @@ export const getChange = async (ticker) => {
     }
 }
 
+export const getQuotes = async (tickers) => {
+    try {
+        const response = await fetch('http://127.0.0.1:5000/api/quotes', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ Tickers: tickers }),
+        });
+        if (!response.ok) {
+            throw new Error(`HTTP error! Status: ${response.status}`);
+        }
+        const data = await response.json();
+        return data;
+    } catch (error) {
+        console.error('Error fetching quotes:', error);
+        throw error;
+    }
+}
+
 export const fetchAcctBalance = async () => {
     try {
         const response = await fetch('http://127.0.0.1:5000/api/getbalance');
@@ -168,24 +188,37 @@ export const fetchAggData = async (setRows, setAcctBalance, setPNL) => {
         const acctBalance = await fetchAcctBalance();
         let pnl = 0;
 
-        // Use Promise.all to wait for all async getCurrPrice calls
-        const formattedRows = await Promise.all(
-            data.map(async (trade) => {
-                const currPrice = await getCurrPrice(trade['Asset']);
-                const changes = await getChange(trade['Asset']);
-                const asset_pnl = trade['Quantity'] * (currPrice - trade['Average_Price']);
-                pnl += asset_pnl;
+        // Fetch every quote in a single batched request; an empty portfolio needs none
+        const assets = data.map((trade) => trade['Asset']);
+        const quotes = assets.length > 0 ? await getQuotes(assets) : {};
+        const formattedRows = data.map((trade) => {
+            const quote = quotes[trade['Asset']];
+            if (!quote || quote.error) {
+                // Without a quote the position is valued at its average price
+                console.error(`Error fetching quote for ${trade['Asset']}: ${quote ? quote.error : 'not in response'}`);
                 return [
                     trade['Asset'],
                     trade['Quantity'],
                     formatPrice(trade['Average_Price']),
-                    formatPrice(currPrice),
-                    formatPercent(changes["Day"]),
-                    formatPercent(changes["Year"]),
-                    formatPrice(asset_pnl)
+                    formatPrice(trade['Average_Price']),
+                    '-',
+                    '-',
+                    formatPrice(0)
                 ];
-            })
-        );
+            }
+            const currPrice = quote["Price"];
+            const asset_pnl = trade['Quantity'] * (currPrice - trade['Average_Price']);
+            pnl += asset_pnl;
+            return [
+                trade['Asset'],
+                trade['Quantity'],
+                formatPrice(trade['Average_Price']),
+                formatPrice(currPrice),
+                formatPercent(quote["Day"]),
+                formatPercent(quote["Year"]),
+                formatPrice(asset_pnl)
+            ];
+        });
 
         setRows(formattedRows);
         setAcctBalance(acctBalance);
@@ -225,4 +258,28 @@ export const fetchStockData = async (ticker) => {
     } catch (error) {
         console.error('Error fetching aggregate stats:', error);
     }
-}
\ No newline at end of file
+}
+export const subscribePrices = (tickers, onUpdate) => {
+    // Server-pushed quote updates; call the returned function to unsubscribe
+    const source = new EventSource(`http://127.0.0.1:5000/api/stream?tickers=${encodeURIComponent(tickers.join(','))}`);
+    source.addEventListener('quotes', (event) => {
+        onUpdate(JSON.parse(event.data));
+    });
+    source.onerror = (error) => {
+        console.error('Price stream error:', error);
+    };
+    return () => source.close();
+};
+
+export const searchSymbols = async (query) => {
+    try {
+        const response = await fetch(`http://127.0.0.1:5000/api/symbols?q=${encodeURIComponent(query)}&limit=10`);
+        if (!response.ok) {
+            throw new Error(`HTTP error! Status: ${response.status}`);
+        }
+        return await response.json();
+    } catch (error) {
+        console.error('Error searching symbols:', error);
+        return [];
+    }
+};
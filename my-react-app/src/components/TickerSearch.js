@@ -1,10 +1,15 @@
 import React, { useState } from 'react';
+import { searchSymbols } from '../api/api';
 
 function TickerSearch({ onTickerChange }) {
     const [inputValue, setInputValue] = useState(''); 
+    const [suggestions, setSuggestions] = useState([]);
 
-    const handleInputChange = (event) => {
-        setInputValue(event.target.value); 
+    const handleInputChange = async (event) => {
+        const value = event.target.value;
+        setInputValue(value); 
+        // Suggest listed symbols and companies as the user types
+        setSuggestions(value.trim() ? await searchSymbols(value) : []);
     };
 
     const handleKeyDown = (event) => {
@@ -17,6 +22,7 @@ function TickerSearch({ onTickerChange }) {
         onTickerChange(inputValue.toUpperCase());
         console.log(`Selected Ticker: ${inputValue.toUpperCase()}`);
         setInputValue(''); 
+        setSuggestions([]);
     };
 
     return (
@@ -28,7 +34,13 @@ function TickerSearch({ onTickerChange }) {
                 onChange={handleInputChange}
                 onKeyDown={handleKeyDown}
                 placeholder="Ticker"
+                list="tickerSuggestions"
             />
+            <datalist id="tickerSuggestions">
+                {suggestions.map((suggestion) => (
+                    <option key={suggestion.Symbol} value={suggestion.Symbol}>{suggestion.Name}</option>
+                ))}
+            </datalist>
         </div>
     );
 }
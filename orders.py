@@ -0,0 +1,384 @@
+import heapq
+import logging
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from db import acquire_lease, release_lease
+from ledger import record_trade
+
+ORDER_TYPES = ('limit', 'stop', 'stop_limit')
+ACTIONS = ('Buy', 'Sell', 'Short')
+WORKING = ('open', 'triggered')
+LEASE = 'order-watcher'
+
+
+class Order:
+    __slots__ = ('id', 'asset', 'action', 'quantity', 'order_type', 'limit_price', 'stop_price', 'status')
+
+    def __init__(self, id, asset, action, quantity, order_type, limit_price=None, stop_price=None, status='open'):
+        self.id = id
+        self.asset = asset
+        self.action = action
+        self.quantity = quantity
+        self.order_type = order_type
+        self.limit_price = limit_price
+        self.stop_price = stop_price
+        self.status = status
+
+    @property
+    def is_buy(self):
+        return self.action == 'Buy'
+
+    @property
+    def resting_as_limit(self):
+        # Stop-limit orders join the limit book once their stop has triggered
+        return self.order_type == 'limit' or self.status == 'triggered'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'Asset': self.asset,
+            'Action': self.action,
+            'Quantity': self.quantity,
+            'Type': self.order_type,
+            'Limit Price': self.limit_price,
+            'Stop Price': self.stop_price,
+            'Status': self.status
+        }
+
+
+class _Side:
+    """
+    One kind of resting order on one symbol, as price levels in a heap with a
+    FIFO queue per level. The heap is ordered so that its top is the level a
+    moving price reaches first; emptied levels leave stale heap entries that
+    are skipped when they surface.
+    """
+
+    def __init__(self, descending):
+        self.sign = -1 if descending else 1
+        self.heap = []
+        self.levels = {}
+        self.count = 0
+
+    def add(self, price, order):
+        level = self.levels.get(price)
+        if level is None:
+            level = self.levels[price] = OrderedDict()
+            heapq.heappush(self.heap, self.sign * price)
+        level[order.id] = order
+        self.count += 1
+
+    def remove(self, price, order_id):
+        level = self.levels.get(price)
+        if level is None or level.pop(order_id, None) is None:
+            return False
+        if not level:
+            del self.levels[price]
+        self.count -= 1
+        return True
+
+    def pop_reached(self, price):
+        """Remove and return every order whose level price has reached, best level first, FIFO within a level."""
+        reached = []
+        while self.heap:
+            best = self.sign * self.heap[0]
+            if best not in self.levels:
+                heapq.heappop(self.heap)
+                continue
+            if self.sign * best > self.sign * price:
+                break
+            heapq.heappop(self.heap)
+            reached.extend(self.levels.pop(best).values())
+        self.count -= len(reached)
+        return reached
+
+
+class OrderBook:
+    """
+    Resting orders of one symbol. Buy limits fill once the price falls to
+    their limit and sell limits once it rises to it; buy stops trigger once
+    the price rises to their stop and sell stops once it falls to it.
+    """
+
+    def __init__(self):
+        self.buy_limits = _Side(descending=True)
+        self.sell_limits = _Side(descending=False)
+        self.buy_stops = _Side(descending=False)
+        self.sell_stops = _Side(descending=True)
+
+    def __len__(self):
+        return self.buy_limits.count + self.sell_limits.count + self.buy_stops.count + self.sell_stops.count
+
+    def _side(self, order):
+        if order.resting_as_limit:
+            return (self.buy_limits if order.is_buy else self.sell_limits), order.limit_price
+        return (self.buy_stops if order.is_buy else self.sell_stops), order.stop_price
+
+    def add(self, order):
+        side, price = self._side(order)
+        side.add(price, order)
+
+    def remove(self, order):
+        side, price = self._side(order)
+        return side.remove(price, order.id)
+
+    def match(self, price):
+        """
+        Apply one price tick and return the resulting (event, order, price)
+        tuples. Stops are evaluated first so a stop-limit that triggers can
+        fill on the same tick; every fill is at the tick price.
+        """
+        events = []
+        for order in self.buy_stops.pop_reached(price) + self.sell_stops.pop_reached(price):
+            if order.order_type == 'stop':
+                order.status = 'filled'
+                events.append(('fill', order, price))
+            else:
+                order.status = 'triggered'
+                events.append(('trigger', order, price))
+                self.add(order)
+        for order in self.buy_limits.pop_reached(price) + self.sell_limits.pop_reached(price):
+            order.status = 'filled'
+            events.append(('fill', order, price))
+        return events
+
+
+class MatchingEngine:
+    """Per-symbol order books behind one lock, evaluated against incoming price ticks."""
+
+    def __init__(self):
+        self.books = {}
+        self.orders = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.orders)
+
+    def submit(self, order):
+        with self._lock:
+            self.orders[order.id] = order
+            self.books.setdefault(order.asset, OrderBook()).add(order)
+
+    def load(self, orders):
+        """Replace every book with the given working orders."""
+        books = {}
+        for order in orders:
+            books.setdefault(order.asset, OrderBook()).add(order)
+        with self._lock:
+            self.books = books
+            self.orders = {order.id: order for order in orders}
+
+    def cancel(self, order_id):
+        """Take a working order off its book; returns it, or None if it is not working."""
+        with self._lock:
+            order = self.orders.pop(order_id, None)
+            if order is not None:
+                self.books[order.asset].remove(order)
+                order.status = 'cancelled'
+            return order
+
+    def on_tick(self, symbol, price):
+        with self._lock:
+            book = self.books.get(symbol)
+            if book is None:
+                return []
+            events = book.match(price)
+            for event, order, _ in events:
+                if event == 'fill':
+                    del self.orders[order.id]
+            if not len(book):
+                del self.books[symbol]
+            return events
+
+    def restore(self, events):
+        """
+        Undo the ticks that produced events whose fills could not be saved:
+        every order goes back on its book with the status it had before.
+        """
+        triggered = {order.id for event, order, _ in events if event == 'trigger'}
+        with self._lock:
+            for order in {order.id: order for _, order, _ in events}.values():
+                if order.status == 'cancelled':
+                    continue
+                if order.id in self.orders:
+                    # Triggered but not filled: it rests on the limit book
+                    self.books[order.asset].remove(order)
+                order.status = 'triggered' if order.order_type == 'stop_limit' and order.id not in triggered else 'open'
+                self.orders[order.id] = order
+                self.books.setdefault(order.asset, OrderBook()).add(order)
+
+    def symbols(self):
+        with self._lock:
+            return sorted(self.books)
+
+
+def _validate(asset, action, quantity, order_type, limit_price, stop_price):
+    if action not in ACTIONS:
+        raise ValueError(f"action must be one of {', '.join(ACTIONS)}")
+    if order_type not in ORDER_TYPES:
+        raise ValueError(f"type must be one of {', '.join(ORDER_TYPES)}")
+    if not asset:
+        raise ValueError("asset is required")
+    if not quantity > 0:
+        raise ValueError("quantity must be positive")
+    if order_type in ('limit', 'stop_limit') and not (limit_price and limit_price > 0):
+        raise ValueError(f"{order_type} orders need a positive limit price")
+    if order_type in ('stop', 'stop_limit') and not (stop_price and stop_price > 0):
+        raise ValueError(f"{order_type} orders need a positive stop price")
+
+
+def create_order(cursor, asset, action, quantity, order_type, limit_price=None, stop_price=None):
+    """Validate and insert a new working order on the caller's cursor and return it."""
+    _validate(asset, action, quantity, order_type, limit_price, stop_price)
+    if order_type == 'limit':
+        stop_price = None
+    if order_type == 'stop':
+        limit_price = None
+    now = time.time()
+    cursor.execute('''
+        INSERT INTO orders (asset, action, quantity, order_type, limit_price, stop_price, status, created_ts, updated_ts)
+        VALUES (?, ?, ?, ?, ?, ?, 'open', ?, ?)
+    ''', (asset, action, quantity, order_type, limit_price, stop_price, now, now))
+    return Order(cursor.lastrowid, asset, action, quantity, order_type, limit_price, stop_price)
+
+
+def cancel_order(cursor, order_id):
+    cursor.execute('''
+        UPDATE orders SET status = 'cancelled', updated_ts = ? WHERE id = ? AND status IN ('open', 'triggered')
+    ''', (time.time(), order_id))
+    return cursor.rowcount > 0
+
+
+def load_working_orders(conn, engine):
+    """Replace the engine's books with every open or triggered order in the database."""
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT id, asset, action, quantity, order_type, limit_price, stop_price, status
+        FROM orders WHERE status IN ('open', 'triggered') ORDER BY id
+    ''')
+    engine.load([Order(*row) for row in cursor.fetchall()])
+    return len(engine)
+
+
+def apply_events(conn, events):
+    """
+    Persist matching events: every fill becomes a trade through the ledger
+    and the order is marked filled in the same transaction. An order is only
+    filled or triggered while it is still working in the database, so an
+    order that was already filled or cancelled elsewhere is skipped. Returns
+    the events that were applied. If this fails the orders stay working in
+    the database, and the caller puts them back on the engine with
+    MatchingEngine.restore.
+    """
+    if not events:
+        return []
+    cursor = conn.cursor()
+    now = time.time()
+    fill_time = datetime.fromtimestamp(now).isoformat()
+    applied = []
+    try:
+        for event, order, price in events:
+            if event == 'fill':
+                # Claim the order before recording its trade
+                cursor.execute(f'''
+                    UPDATE orders SET status = 'filled', fill_price = ?, updated_ts = ?
+                    WHERE id = ? AND status IN ({', '.join('?' * len(WORKING))})
+                ''', (price, now, order.id, *WORKING))
+                if cursor.rowcount == 0:
+                    logging.info(f"Order {order.id} is no longer working; fill skipped")
+                    continue
+                trade_id = record_trade(cursor, order.asset, order.quantity, fill_time, price, order.action)
+                cursor.execute('UPDATE orders SET trade_id = ? WHERE id = ?', (trade_id, order.id))
+            else:
+                cursor.execute(f'''
+                    UPDATE orders SET status = ?, updated_ts = ?
+                    WHERE id = ? AND status IN ({', '.join('?' * len(WORKING))})
+                ''', (order.status, now, order.id, *WORKING))
+                if cursor.rowcount == 0:
+                    continue
+            applied.append((event, order, price))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return applied
+
+
+class OrderWatcher:
+    """
+    Feeds the engine live prices. Every process runs one background thread,
+    but only the process holding the order-watcher lease matches orders:
+    each interval it renews the lease, reloads the working orders placed or
+    cancelled through any process, fetches a batched quote for their symbols,
+    runs the ticks through the engine and persists the resulting fills. The
+    others keep an empty engine and take over once the lease expires.
+    """
+
+    def __init__(self, engine, provider, connect, interval=15, lease_ttl=None):
+        self.engine = engine
+        self.provider = provider
+        self.connect = connect
+        self.interval = interval
+        self.lease_ttl = lease_ttl or 4 * interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def wake(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='order-watcher', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def poll_once(self, conn):
+        symbols = self.engine.symbols()
+        if not symbols:
+            return []
+        quotes, errors = self.provider.quotes(symbols)
+        for symbol, error in errors.items():
+            logging.warning(f"No price for working orders on {symbol}: {error}")
+        events = []
+        for symbol, quote in quotes.items():
+            events.extend(self.engine.on_tick(symbol, quote['Price']))
+        try:
+            return apply_events(conn, events)
+        except Exception:
+            self.engine.restore(events)
+            raise
+
+    def _run(self):
+        conn = self.connect()
+        owner = f"{socket.gethostname()}:{os.getpid()}"
+        leading = False
+        try:
+            while not self._stop.is_set():
+                try:
+                    if acquire_lease(conn, LEASE, owner, self.lease_ttl):
+                        if not leading:
+                            logging.info(f"Matching working orders in process {os.getpid()}")
+                            leading = True
+                        load_working_orders(conn, self.engine)
+                        self.poll_once(conn)
+                    elif leading:
+                        leading = False
+                        self.engine.load([])
+                except Exception as e:
+                    logging.error(f"Error matching working orders: {e}")
+                self._wake.wait(self.interval)
+                self._wake.clear()
+        finally:
+            if leading:
+                release_lease(conn, LEASE, owner)
+            conn.close()
@@ -1,8 +1,7 @@
 import numpy as np
-import pandas as pd
 from enum import Enum
 from datetime import datetime
-import yfinance as yf
+from market_data import get_provider
 
 class ActionType(Enum):
     BUY = "Buy"
@@ -14,108 +13,283 @@ class TradeType(Enum):
     CURRENCY = "Currency"
     COMMODITY = "Commodity"
 
+# Actions are stored as small integer codes in the trade columns
+ACTIONS = list(ActionType)
+ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+
+# Instrument details of an asset traded without any: a stock in the account currency
+STOCK = (TradeType.STOCK, None, None, None)
+
+def _grow(array, size):
+    # Double the capacity until size fits, keeping the filled prefix
+    capacity = len(array)
+    while capacity < size:
+        capacity *= 2
+    if capacity == len(array):
+        return array
+    grown = np.zeros(capacity, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
 class Portfolio:
-    def __init__(self):
+    """
+    Columnar portfolio engine.
+
+    Trades are appended to preallocated NumPy columns that double in size when
+    full, and positions live in per-slot arrays indexed through a dict from
+    asset to slot, so adding a trade is O(1) amortized and unrealized PnL is a
+    single vectorized expression over all positions.
+    """
+
+    def __init__(self, capacity=1024):
         self.total_trades = 0
-        all_trades_columns = ['Asset', 'Quantity', 'Time', 'Price', 'Trade Type', 'Action', 
-                              'Short Date', 'Base Currency', 'Quote Currency', 'Unit']
-        self.all_trades = pd.DataFrame(columns=all_trades_columns)
         self.unrealized_pnl = 0
         self.realized_pnl = 0
-        agg_columns = ['Asset', 'Quantity', 'Average Price', 'Trade Type']
-        self.aggregated_trades = pd.DataFrame(columns=agg_columns)
-
-    def add_trade(self, asset, time, quantity, action):
-        # Add trade to the list of all trades
-        stock = yf.Ticker(asset)
-        price = stock.info["currentPrice"]
-        new_trade_row = {
-            'Asset': asset, 'Quantity': quantity, 'Time': time, 'Price': price, 
-            'Trade Type': TradeType.STOCK, 'Action': action, 'Short Date': None, 
-            'Base Currency': None, 'Quote Currency': None, 'Unit': None
-        }
-        self.all_trades = pd.concat([self.all_trades, pd.DataFrame([new_trade_row])], ignore_index=True)
-        self.total_trades += 1
-        
-        # Update aggregated trades
-        existing_row = self.aggregated_trades[self.aggregated_trades['Asset'] == asset]
-
-        if existing_row.empty:
-            # Add a new asset entry
-            new_agg_row = {
-                'Asset': asset, 
-                'Quantity': quantity, 
-                'Average Price': price, 
-                'Trade Type': TradeType.STOCK
-            }
-            self.aggregated_trades = pd.concat([self.aggregated_trades, pd.DataFrame([new_agg_row])], ignore_index=True)
-        else:
-            # Update existing asset entry
-            index = existing_row.index[0]
-            current_quantity = self.aggregated_trades.at[index, 'Quantity']
-            current_avg_price = self.aggregated_trades.at[index, 'Average Price']
-
-            if action == ActionType.BUY:
-                if current_quantity < 0:  # Covering a short position
-                    # Quantity to close out short
-                    close_quantity = min(abs(current_quantity), quantity)
-                    self.realized_pnl += close_quantity * (current_avg_price - price)
-
-                    # Update remaining quantity
-                    new_quantity = current_quantity + quantity
-
-                    if new_quantity > 0:  # Flipping to a long position
-                        new_avg_price = price
-                    else:  # Short not fully covered
-                        new_avg_price = current_avg_price
-
-                    self.aggregated_trades.at[index, 'Quantity'] = new_quantity
-                    self.aggregated_trades.at[index, 'Average Price'] = new_avg_price
-                else:  # Adding to a long position
-                    new_avg_price = ((current_avg_price * current_quantity) + (price * quantity)) / (current_quantity + quantity)
-                    self.aggregated_trades.at[index, 'Average Price'] = new_avg_price
-                    self.aggregated_trades.at[index, 'Quantity'] = current_quantity + quantity
-
-            elif action == ActionType.SELL:
-                if current_quantity > 0:  # Reducing a long position
-                    close_quantity = min(current_quantity, quantity)
-                    self.realized_pnl += close_quantity * (price - current_avg_price)
-
-                    new_quantity = current_quantity - quantity
-
-                    if new_quantity < 0:  # Flipping to a short position
-                        new_avg_price = price
-                    else:  # Long not fully closed
-                        new_avg_price = current_avg_price
-
-                    self.aggregated_trades.at[index, 'Quantity'] = new_quantity
-                    self.aggregated_trades.at[index, 'Average Price'] = new_avg_price
-                else:  # Adding to a short position
-                    new_avg_price = ((current_avg_price * abs(current_quantity)) + (price * quantity)) / (abs(current_quantity) + quantity)
-                    self.aggregated_trades.at[index, 'Average Price'] = new_avg_price
-                    self.aggregated_trades.at[index, 'Quantity'] = current_quantity - quantity
-
-            elif action == ActionType.SHORT:
-                # Adding to or maintaining a short position
+
+        # Trade columns
+        self._trade_slot = np.zeros(capacity, dtype=np.int32)
+        self._trade_quantity = np.zeros(capacity, dtype=np.float64)
+        self._trade_price = np.zeros(capacity, dtype=np.float64)
+        self._trade_action = np.zeros(capacity, dtype=np.int8)
+        self._trade_time = np.empty(capacity, dtype=object)
+
+        # Position columns, one slot per asset, with each asset's instrument
+        # details as (trade type, base currency, quote currency, unit)
+        self.assets = []
+        self.slots = {}
+        self.instruments = []
+        self._quantity = np.zeros(capacity, dtype=np.float64)
+        self._avg_price = np.zeros(capacity, dtype=np.float64)
+
+    def _slot(self, asset):
+        slot = self.slots.get(asset)
+        if slot is None:
+            slot = len(self.assets)
+            self.slots[asset] = slot
+            self.assets.append(asset)
+            self.instruments.append(STOCK)
+            if slot >= len(self._quantity):
+                self._quantity = _grow(self._quantity, slot + 1)
+                self._avg_price = _grow(self._avg_price, slot + 1)
+        return slot
+
+    def _append_trade(self, slot, time, quantity, price, action):
+        n = self.total_trades
+        if n >= len(self._trade_slot):
+            self._trade_slot = _grow(self._trade_slot, n + 1)
+            self._trade_quantity = _grow(self._trade_quantity, n + 1)
+            self._trade_price = _grow(self._trade_price, n + 1)
+            self._trade_action = _grow(self._trade_action, n + 1)
+            grown = np.empty(len(self._trade_slot), dtype=object)
+            grown[:n] = self._trade_time[:n]
+            self._trade_time = grown
+        self._trade_slot[n] = slot
+        self._trade_quantity[n] = quantity
+        self._trade_price[n] = price
+        self._trade_action[n] = ACTION_CODES[action]
+        self._trade_time[n] = time
+        self.total_trades = n + 1
+
+    def add_trade(self, asset, time, quantity, action, price=None, trade_type=TradeType.STOCK,
+                  base_currency=None, quote_currency=None, unit=None):
+        # Use the live price unless the caller supplies one (e.g. a simulation)
+        if price is None:
+            price = get_provider().field(asset, "currentPrice")
+        slot = self._slot(asset)
+        if trade_type != TradeType.STOCK or quote_currency is not None:
+            self.instruments[slot] = (trade_type, base_currency, quote_currency, unit)
+        self._append_trade(slot, time, quantity, price, action)
+
+        # A new asset starts as a flat position, so its first trade goes
+        # through the same branches as every other trade
+        current_quantity = float(self._quantity[slot])
+        current_avg_price = float(self._avg_price[slot])
+
+        if action == ActionType.BUY:
+            if current_quantity < 0:  # Covering a short position
+                # Quantity to close out short
+                close_quantity = min(abs(current_quantity), quantity)
+                self.realized_pnl += close_quantity * (current_avg_price - price)
+
+                # Update remaining quantity
+                new_quantity = current_quantity + quantity
+
+                if new_quantity > 0:  # Flipping to a long position
+                    new_avg_price = price
+                else:  # Short not fully covered
+                    new_avg_price = current_avg_price
+            else:  # Adding to a long position
+                new_quantity = current_quantity + quantity
+                new_avg_price = ((current_avg_price * current_quantity) + (price * quantity)) / new_quantity
+
+        elif action == ActionType.SELL:
+            if current_quantity > 0:  # Reducing a long position
+                close_quantity = min(current_quantity, quantity)
+                self.realized_pnl += close_quantity * (price - current_avg_price)
+
+                new_quantity = current_quantity - quantity
+
+                if new_quantity < 0:  # Flipping to a short position
+                    new_avg_price = price
+                else:  # Long not fully closed
+                    new_avg_price = current_avg_price
+            else:  # Adding to a short position
                 new_avg_price = ((current_avg_price * abs(current_quantity)) + (price * quantity)) / (abs(current_quantity) + quantity)
-                self.aggregated_trades.at[index, 'Average Price'] = new_avg_price
-                self.aggregated_trades.at[index, 'Quantity'] = current_quantity - quantity
+                new_quantity = current_quantity - quantity
 
+        elif action == ActionType.SHORT:
+            # Adding to or maintaining a short position
+            new_avg_price = ((current_avg_price * abs(current_quantity)) + (price * quantity)) / (abs(current_quantity) + quantity)
+            new_quantity = current_quantity - quantity
 
-    def update_agg_trades(self, market_prices):
-        self.unrealized_pnl = 0
-        for _, row in self.aggregated_trades.iterrows():
-            asset = row['Asset']
-            quantity = row['Quantity']
-            avg_price = row['Average Price']
-            current_price = market_prices.get(asset, avg_price)  # Use avg_price if market price is unavailable
-
-            # Calculate unrealized PnL for long and short positions
-            if quantity > 0:  # Long position
-                self.unrealized_pnl += quantity * (current_price - avg_price)
-            elif quantity < 0:  # Short position
-                self.unrealized_pnl += abs(quantity) * (avg_price - current_price)
+        self._quantity[slot] = new_quantity
+        self._avg_price[slot] = new_avg_price
+
+    def register(self, assets):
+        """Make sure every asset has a slot and return their slots as an array."""
+        return np.array([self._slot(asset) for asset in assets], dtype=np.int32)
+
+    def add_trades(self, slots, time, quantities, actions, prices):
+        """
+        Apply a batch of trades on distinct slots at once, e.g. one bar of a
+        backtest. actions are codes from ACTION_CODES; the branches mirror
+        add_trade exactly, evaluated as array expressions.
+        """
+        slots = np.asarray(slots, dtype=np.int32)
+        quantities = np.asarray(quantities, dtype=np.float64)
+        actions = np.asarray(actions, dtype=np.int8)
+        prices = np.asarray(prices, dtype=np.float64)
+        if len(np.unique(slots)) != len(slots):
+            raise ValueError("add_trades needs distinct slots; apply repeated assets in separate batches")
+
+        n = self.total_trades
+        m = len(slots)
+        if n + m > len(self._trade_slot):
+            self._trade_slot = _grow(self._trade_slot, n + m)
+            self._trade_quantity = _grow(self._trade_quantity, n + m)
+            self._trade_price = _grow(self._trade_price, n + m)
+            self._trade_action = _grow(self._trade_action, n + m)
+            grown = np.empty(len(self._trade_slot), dtype=object)
+            grown[:n] = self._trade_time[:n]
+            self._trade_time = grown
+        self._trade_slot[n:n + m] = slots
+        self._trade_quantity[n:n + m] = quantities
+        self._trade_price[n:n + m] = prices
+        self._trade_action[n:n + m] = actions
+        self._trade_time[n:n + m] = time
+        self.total_trades = n + m
+
+        q = self._quantity[slots]
+        avg = self._avg_price[slots]
+        buy = actions == ACTION_CODES[ActionType.BUY]
+        sell = actions == ACTION_CODES[ActionType.SELL]
+        short = actions == ACTION_CODES[ActionType.SHORT]
+
+        covering = buy & (q < 0)
+        reducing = sell & (q > 0)
+        adding_long = buy & ~covering
+        adding_short = (sell & ~reducing) | short
+
+        realized = np.where(covering, np.minimum(-q, quantities) * (avg - prices), 0.0)
+        realized += np.where(reducing, np.minimum(q, quantities) * (prices - avg), 0.0)
+        self.realized_pnl += float(realized.sum())
+
+        new_q = np.where(buy, q + quantities, q - quantities)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            long_avg = (avg * q + prices * quantities) / (q + quantities)
+            short_avg = (avg * np.abs(q) + prices * quantities) / (np.abs(q) + quantities)
+        new_avg = avg.copy()
+        new_avg = np.where(covering & (new_q > 0), prices, new_avg)
+        new_avg = np.where(reducing & (new_q < 0), prices, new_avg)
+        new_avg = np.where(adding_long, long_avg, new_avg)
+        new_avg = np.where(adding_short, short_avg, new_avg)
+
+        self._quantity[slots] = new_q
+        self._avg_price[slots] = new_avg
+        return realized
+
+    def price_vector(self, market_prices):
+        """
+        Align market prices with the position slots. market_prices is either a
+        dict keyed by asset or an array already in slot order; assets without a
+        price fall back to their average price.
+        """
+        n = len(self.assets)
+        if isinstance(market_prices, dict):
+            prices = self._avg_price[:n].copy()
+            for asset, price in market_prices.items():
+                slot = self.slots.get(asset)
+                if slot is not None:
+                    prices[slot] = price
+            return prices
+        prices = np.asarray(market_prices, dtype=np.float64)[:n]
+        return np.where(np.isnan(prices), self._avg_price[:n], prices)
+
+    def rate_vector(self, fx_rates):
+        """
+        Conversion rate of every slot into the account currency. fx_rates is a
+        dict keyed by quote currency or an array in slot order; assets quoted
+        in the account currency (or without a rate) get 1.
+        """
+        n = len(self.assets)
+        if fx_rates is None:
+            return np.ones(n)
+        if isinstance(fx_rates, dict):
+            return np.array([fx_rates.get(instrument[2], 1.0) if instrument[2] else 1.0
+                             for instrument in self.instruments], dtype=np.float64)
+        return np.asarray(fx_rates, dtype=np.float64)[:n]
+
+    def update_agg_trades(self, market_prices, fx_rates=None):
+        # quantity * (price - avg) covers longs and shorts, since a short's
+        # quantity is negative; each slot is converted at its own rate
+        n = len(self.assets)
+        prices = self.price_vector(market_prices)
+        rates = self.rate_vector(fx_rates)
+        self.unrealized_pnl = float(np.dot(self._quantity[:n] * rates, prices - self._avg_price[:n]))
+
+    @property
+    def quantities(self):
+        return self._quantity[:len(self.assets)]
+
+    @property
+    def average_prices(self):
+        return self._avg_price[:len(self.assets)]
+
+    def _instrument_column(self, field, slots):
+        column = np.empty(len(self.instruments), dtype=object)
+        column[:] = [instrument[field] for instrument in self.instruments]
+        return column[slots]
+
+    @property
+    def all_trades(self):
+        # pandas is only needed for these DataFrame views
+        import pandas as pd
+        n = self.total_trades
+        slots = self._trade_slot[:n]
+        return pd.DataFrame({
+            'Asset': np.array(self.assets, dtype=object)[slots] if n else [],
+            'Quantity': self._trade_quantity[:n],
+            'Time': self._trade_time[:n],
+            'Price': self._trade_price[:n],
+            'Trade Type': self._instrument_column(0, slots) if n else [],
+            'Action': np.array(ACTIONS, dtype=object)[self._trade_action[:n]] if n else [],
+            'Short Date': [None] * n,
+            'Base Currency': self._instrument_column(1, slots) if n else [],
+            'Quote Currency': self._instrument_column(2, slots) if n else [],
+            'Unit': self._instrument_column(3, slots) if n else []
+        })
 
+    @property
+    def aggregated_trades(self):
+        import pandas as pd
+        n = len(self.assets)
+        return pd.DataFrame({
+            'Asset': list(self.assets),
+            'Quantity': self._quantity[:n],
+            'Average Price': self._avg_price[:n],
+            'Trade Type': [instrument[0] for instrument in self.instruments],
+            'Quote Currency': [instrument[2] for instrument in self.instruments]
+        })
 
     def to_dataframe(self):
         return self.all_trades
@@ -0,0 +1,218 @@
+import threading
+import time
+from collections import OrderedDict
+
+from market_data import MarketDataProvider
+
+# Seconds a cached info snapshot stays fresh, per field. Prices go stale fast,
+# company metadata almost never changes.
+DEFAULT_FIELD_TTLS = {
+    'currentPrice': 15,
+    'regularMarketPrice': 15,
+    'bid': 15,
+    'ask': 15,
+    'regularMarketPreviousClose': 300,
+    'previousClose': 300,
+    '52WeekChange': 900,
+    'fiftyTwoWeekHigh': 900,
+    'fiftyTwoWeekLow': 900,
+    'sector': 86400,
+    'industry': 86400,
+    'longName': 86400,
+    'shortName': 86400,
+}
+DEFAULT_TTL = 60
+
+
+class LRUCache:
+    """Thread-safe mapping that evicts the least recently used key past max_entries."""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def get_fresh(self, key, is_fresh):
+        """Return the value for key if is_fresh(value), else None, counting a hit or a miss."""
+        with self._lock:
+            value = self._data.get(key)
+            if value is None or not is_fresh(value):
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the
+    function, everyone else arriving while it is in flight waits for its result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class _Snapshot:
+    __slots__ = ('info', 'fetched_at')
+
+    def __init__(self, info, fetched_at):
+        self.info = info
+        self.fetched_at = fetched_at
+
+
+class CachedProvider(MarketDataProvider):
+    """
+    Wraps a backend with an in-process info cache.
+
+    A symbol's info dict is fetched as one snapshot; whether it is still fresh
+    depends on the fields the caller asks for, so a sector lookup can reuse a
+    snapshot that is too old to serve a price. Concurrent misses for the same
+    symbol share a single upstream fetch.
+    """
+
+    def __init__(self, backend, field_ttls=None, default_ttl=DEFAULT_TTL, max_entries=512, clock=time.monotonic):
+        self.backend = backend
+        self.field_ttls = dict(DEFAULT_FIELD_TTLS)
+        self.field_ttls.update(field_ttls or {})
+        self.default_ttl = default_ttl
+        self.clock = clock
+        self._snapshots = LRUCache(max_entries)
+        self._quotes = LRUCache(max_entries)
+        self._flight = SingleFlight()
+
+    # Counted by the caches under their own locks
+    @property
+    def hits(self):
+        return self._snapshots.hits + self._quotes.hits
+
+    @property
+    def misses(self):
+        return self._snapshots.misses + self._quotes.misses
+
+    def _ttl(self, names):
+        if not names:
+            return self.default_ttl
+        return min(self.field_ttls.get(name, self.default_ttl) for name in names)
+
+    def _fetch_info(self, symbol):
+        snapshot = _Snapshot(self.backend.info(symbol), self.clock())
+        self._snapshots.set(symbol, snapshot)
+        return snapshot
+
+    def info(self, symbol, names=None):
+        ttl = self._ttl(names)
+        snapshot = self._snapshots.get_fresh(symbol, lambda snapshot: self.clock() - snapshot.fetched_at < ttl)
+        if snapshot is not None:
+            return snapshot.info
+        return self._flight.do(('info', symbol), lambda: self._fetch_info(symbol)).info
+
+    def field(self, symbol, name):
+        return self.info(symbol, (name,))[name]
+
+    def fields(self, symbol, *names):
+        info = self.info(symbol, names)
+        return [info[name] for name in names]
+
+    def _fetch_quotes(self, symbols):
+        quotes, errors = self.backend.quotes(symbols)
+        now = self.clock()
+        for symbol, quote in quotes.items():
+            self._quotes.set(symbol, _Snapshot(quote, now))
+        return quotes, errors
+
+    def quotes(self, symbols):
+        # Serve fresh quotes from the cache and fetch every miss in one batched call
+        ttl = self.field_ttls.get('currentPrice', self.default_ttl)
+        now = self.clock()
+        quotes, errors, missing = {}, {}, []
+        for symbol in dict.fromkeys(symbols):
+            snapshot = self._quotes.get_fresh(symbol, lambda snapshot: now - snapshot.fetched_at < ttl)
+            if snapshot is not None:
+                quotes[symbol] = snapshot.info
+            else:
+                missing.append(symbol)
+
+        if missing:
+            key = ('quotes', tuple(sorted(missing)))
+            fetched, failed = self._flight.do(key, lambda: self._fetch_quotes(missing))
+            quotes.update(fetched)
+            errors.update(failed)
+        return quotes, errors
+
+    def history(self, symbol, period, interval, start=None):
+        return self.backend.history(symbol, period, interval, start)
+
+    def recommendations(self, symbol):
+        return self.backend.recommendations(symbol)
+
+    def invalidate(self, symbol=None):
+        if symbol is None:
+            self._snapshots.clear()
+            self._quotes.clear()
+        else:
+            self._snapshots.pop(symbol)
+            self._quotes.pop(symbol)
@@ -0,0 +1,58 @@
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+# Serialized response bodies for read endpoints whose payload only changes
+# with the portfolio. Entries are keyed on the portfolio version, so a trade
+# makes every older entry unreachable and they age out of the LRU order.
+RESPONSE_CACHE_BYTES = int(os.environ.get('RESPONSE_CACHE_BYTES', 64 * 1024 * 1024))
+
+
+def etag(key):
+    """A strong entity tag for a cache key that starts with the portfolio version."""
+    return f"v{key[0]}-{zlib.crc32(repr(key[1:]).encode()):08x}"
+
+
+class ResponseCache:
+    """Thread-safe LRU of (body, mimetype, headers) entries bounded by the total size of the bodies."""
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, body, mimetype, headers=()):
+        # Bodies bigger than a quarter of the budget would flush everything else
+        if len(body) > self.max_bytes // 4:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0])
+            self._data[key] = (body, mimetype, tuple(headers))
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, (evicted, _, _) = self._data.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,261 @@
+import logging
+import time
+from datetime import date, datetime
+from statistics import NormalDist
+
+import numpy as np
+
+from backtest import BarStorePriceSource
+from fx import quote_pairs, trade_rates
+from ledger import portfolio_version
+from quote_cache import LRUCache, SingleFlight
+
+PERIODS_PER_YEAR = 252
+DEFAULT_BENCHMARK = 'SPY'
+
+# Results keyed by (portfolio version, as-of date, parameters). Every trade
+# bumps the portfolio version in its own transaction, so a new trade
+# naturally misses the cache.
+_cache = LRUCache(max_entries=64)
+_flight = SingleFlight()
+
+
+def _ffill(closes):
+    # Forward fill gaps down each column by carrying the index of the last
+    # finite row, without a Python loop over rows
+    rows = np.where(np.isfinite(closes), np.arange(len(closes))[:, None], 0)
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return closes[rows, np.arange(closes.shape[1])]
+
+
+def returns_matrix(closes):
+    """
+    Simple returns of a (bars x assets) closes matrix in one pass. Gaps are
+    forward filled first, assets with no prices at all get zero returns, and
+    rows before every other asset has a price are dropped so the covariance
+    is computed over a common window.
+    """
+    closes = np.asarray(closes, dtype=np.float64)
+    if len(closes) < 2:
+        return np.empty((0, closes.shape[1] if closes.ndim == 2 else 0))
+    filled = _ffill(closes)
+    filled[:, ~np.isfinite(closes).any(axis=0)] = 1.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = filled[1:] / filled[:-1] - 1
+    return returns[np.isfinite(returns).all(axis=1)]
+
+
+def last_prices(closes):
+    """The latest finite close of every column, NaN for columns without one."""
+    closes = np.asarray(closes, dtype=np.float64)
+    if len(closes) == 0:
+        return np.full(closes.shape[1] if closes.ndim == 2 else 0, np.nan)
+    return _ffill(closes)[-1]
+
+
+def rolling_volatility(returns, window, periods=PERIODS_PER_YEAR):
+    """Annualized rolling standard deviation of every column, NaN until window rows are in."""
+    returns = np.asarray(returns, dtype=np.float64)
+    out = np.full(returns.shape, np.nan)
+    if len(returns) < window or window < 2:
+        return out
+    sums = np.cumsum(np.vstack([np.zeros(returns.shape[1]), returns]), axis=0)
+    squares = np.cumsum(np.vstack([np.zeros(returns.shape[1]), returns ** 2]), axis=0)
+    total = sums[window:] - sums[:-window]
+    total_sq = squares[window:] - squares[:-window]
+    variance = np.maximum(total_sq - total ** 2 / window, 0.0) / (window - 1)
+    out[window - 1:] = np.sqrt(variance * periods)
+    return out
+
+
+def betas(returns, benchmark_returns):
+    """Beta of every column against the benchmark return series."""
+    asset = returns - returns.mean(axis=0)
+    bench = benchmark_returns - benchmark_returns.mean()
+    variance = float(np.dot(bench, bench))
+    if variance == 0:
+        return np.full(returns.shape[1], np.nan)
+    return bench @ asset / variance
+
+
+def max_drawdown(values):
+    """Largest peak-to-trough fall of every column, as a positive fraction."""
+    values = np.asarray(values, dtype=np.float64)
+    peaks = np.maximum.accumulate(values, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdowns = np.where(peaks > 0, (peaks - values) / peaks, 0.0)
+    return np.nanmax(drawdowns, axis=0) if len(values) else np.zeros(values.shape[1:])
+
+
+def historical_var(pnl, confidence):
+    """(VaR, CVaR) of a P&L sample as positive losses."""
+    if len(pnl) == 0:
+        return 0.0, 0.0
+    cutoff = np.quantile(pnl, 1 - confidence)
+    tail = pnl[pnl <= cutoff]
+    return float(-cutoff), float(-tail.mean())
+
+
+def parametric_var(mean, std, confidence):
+    """(VaR, CVaR) of a normal P&L distribution as positive losses."""
+    normal = NormalDist()
+    z = normal.inv_cdf(1 - confidence)
+    var = -(mean + z * std)
+    cvar = -(mean - std * normal.pdf(z) / (1 - confidence))
+    return float(var), float(cvar)
+
+
+def compute_risk(closes, symbols, quantities, benchmark_closes=None, confidence=0.95, window=21,
+                 periods=PERIODS_PER_YEAR):
+    """
+    Risk metrics for fixed holdings over a closes history.
+
+    The P&L series revalues today's quantities over every historical return,
+    so VaR/CVaR are one-period dollar figures for the book as it stands now.
+    """
+    closes = np.asarray(closes, dtype=np.float64)
+    quantities = np.asarray(quantities, dtype=np.float64)
+    if benchmark_closes is not None:
+        closes = np.column_stack([closes, benchmark_closes])
+    returns = returns_matrix(closes)
+    if benchmark_closes is not None:
+        returns, benchmark_returns = returns[:, :-1], returns[:, -1]
+        closes = closes[:, :-1]
+
+    exposures = np.nan_to_num(quantities * last_prices(closes))
+    gross = float(np.abs(exposures).sum())
+    pnl = returns @ exposures
+
+    covariance = np.cov(returns, rowvar=False, ddof=1).reshape(len(symbols), len(symbols)) if len(returns) > 1 \
+        else np.full((len(symbols), len(symbols)), np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        std = np.sqrt(np.diag(covariance))
+        correlation = covariance / np.outer(std, std)
+
+    mean = float(pnl.mean()) if len(pnl) else 0.0
+    pnl_std = float(np.sqrt(max(exposures @ covariance @ exposures, 0.0))) if len(returns) > 1 else 0.0
+    hist_var, hist_cvar = historical_var(pnl, confidence)
+    param_var, param_cvar = parametric_var(mean, pnl_std, confidence)
+
+    filled = _ffill(closes) if len(closes) else closes
+    book = np.nan_to_num(filled) @ quantities
+    asset_volatility = rolling_volatility(returns, window, periods)
+    portfolio_volatility = rolling_volatility((pnl / gross)[:, None] if gross else pnl[:, None], window, periods)
+
+    result = {
+        'observations': int(len(returns)),
+        'confidence': confidence,
+        'window': window,
+        'gross_exposure': gross,
+        'assets': {
+            symbol: {
+                'exposure': float(exposures[i]),
+                'weight': float(exposures[i] / gross) if gross else 0.0,
+                'volatility': _finite(asset_volatility[-1, i]) if len(returns) else None,
+                'max_drawdown': _finite(max_drawdown(filled[:, i])) if len(filled) else None,
+            } for i, symbol in enumerate(symbols)
+        },
+        'portfolio': {
+            'volatility': _finite(portfolio_volatility[-1, 0]) if len(returns) else None,
+            'max_drawdown': _finite(max_drawdown(book)) if len(book) else None,
+            'historical_var': hist_var,
+            'historical_cvar': hist_cvar,
+            'parametric_var': param_var,
+            'parametric_cvar': param_cvar,
+        },
+        'covariance': _matrix(covariance * periods),
+        'correlation': _matrix(correlation),
+    }
+    if benchmark_closes is not None:
+        asset_betas = betas(returns, benchmark_returns) if len(returns) > 1 else np.full(len(symbols), np.nan)
+        for i, symbol in enumerate(symbols):
+            result['assets'][symbol]['beta'] = _finite(asset_betas[i])
+        result['portfolio']['beta'] = _finite(float(np.dot(asset_betas, exposures) / gross)) if gross else None
+    return result
+
+
+def _finite(value):
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+def _matrix(matrix):
+    return [[_finite(value) for value in row] for row in matrix]
+
+
+def load_closes(conn, symbols, as_of, lookback=PERIODS_PER_YEAR, provider=None):
+    """
+    Daily closes of symbols from the bar store, the last lookback + 1 bars up
+    to and including as_of. With a provider, the bars are synced first.
+    """
+    if provider is not None:
+        from bars import sync
+        now = time.time()
+        for symbol in symbols:
+            try:
+                sync(conn, provider, symbol, '1d', now)
+            except Exception as e:
+                logging.warning(f"Could not sync daily bars for {symbol}: {e}")
+
+    end = datetime(as_of.year, as_of.month, as_of.day).timestamp() + 86400
+    start = end - (lookback + 1) * 86400 * 7 / 5  # enough calendar days for lookback trading days
+    _, closes = BarStorePriceSource(conn).load(symbols, start, end)
+    return closes[-(lookback + 1):]
+
+
+def to_account_currency(closes, symbols, pairs, pair_closes, rates):
+    """
+    Convert the closes of the assets in pairs into the account currency at
+    the latest close of their currency pair on or before each bar, falling
+    back to the rate of their latest trade, as history.update_history does.
+    pair_closes maps a pair symbol to its column of closes.
+    """
+    closes = np.array(closes, dtype=np.float64)
+    for i, symbol in enumerate(symbols):
+        if symbol not in pairs:
+            continue
+        rate = _ffill(pair_closes[pairs[symbol]][:, None])[:, 0] if len(closes) else np.empty(0)
+        closes[:, i] *= np.where(np.isfinite(rate), rate, rates.get(symbol, 1.0))
+    return closes
+
+
+def portfolio_risk(conn, provider=None, as_of=None, benchmark=DEFAULT_BENCHMARK, confidence=0.95, window=21,
+                   lookback=PERIODS_PER_YEAR):
+    """
+    Risk metrics for the current aggregated_trades book from daily closes in
+    the bar store up to as_of (default today), cached per holdings version
+    and as-of date. With a provider, the daily bars are synced first.
+    """
+    as_of = as_of or date.today()
+    cursor = conn.cursor()
+    key = (portfolio_version(cursor), as_of.isoformat(), benchmark, confidence, window, lookback)
+    cached = _cache.get(key)
+    if cached is not None:
+        return cached
+
+    def compute():
+        cursor.execute('SELECT asset, quantity FROM aggregated_trades WHERE quantity != 0 ORDER BY asset')
+        holdings = cursor.fetchall()
+        symbols = [row[0] for row in holdings]
+        wanted = symbols + ([benchmark] if benchmark and benchmark not in symbols else [])
+        pairs = quote_pairs(cursor, symbols)
+        wanted += [pair for pair in dict.fromkeys(pairs.values()) if pair not in wanted]
+
+        closes = load_closes(conn, wanted, as_of, lookback, provider)
+        benchmark_closes = None
+        if benchmark:
+            column = wanted.index(benchmark)
+            benchmark_closes = closes[:, column]
+            if not np.isfinite(benchmark_closes).any():
+                benchmark_closes = None
+        # Positions are valued in the account currency, like the history
+        book = to_account_currency(closes[:, :len(symbols)], symbols, pairs,
+                                   {pair: closes[:, wanted.index(pair)] for pair in pairs.values()},
+                                   trade_rates(cursor, pairs))
+        result = compute_risk(book, symbols, [row[1] for row in holdings],
+                              benchmark_closes, confidence, window)
+        result.update({'as_of': as_of.isoformat(), 'benchmark': benchmark if benchmark_closes is not None else None})
+        _cache.set(key, result)
+        return result
+
+    return _flight.do(key, compute)
@@ -0,0 +1,54 @@
+import json
+
+from metrics import span
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is the fallback
+    orjson = None
+
+JSON_MIMETYPE = 'application/json'
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+
+def dumps(obj):
+    """
+    Encode obj as compact JSON bytes, with orjson when it is installed. Keys
+    are sorted, as jsonify sorts them.
+    """
+    with span('serialize'):
+        if orjson is not None:
+            return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_SORT_KEYS)
+        return json.dumps(obj, separators=(',', ':'), sort_keys=True).encode()
+
+
+def records(rows, keys):
+    """Zip plain row tuples with response keys, skipping sqlite3.Row lookups."""
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def encode_rows(rows, keys):
+    """
+    The rows as the comma separated body of a JSON array of objects, so a
+    streamed response can encode a whole batch in one call.
+    """
+    return dumps(records(rows, keys))[1:-1]
+
+
+def columnar(rows, keys):
+    """The rows as one list per key."""
+    columns = list(zip(*rows)) if rows else [()] * len(keys)
+    return {key: list(column) for key, column in zip(keys, columns)}
+
+
+def arrow_stream(columns):
+    """
+    Encode a columnar dict as an Arrow IPC stream. pyarrow is optional and
+    imported on first use; ImportError tells the caller it is unavailable.
+    """
+    import pyarrow as pa
+    table = pa.table(columns)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
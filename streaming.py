@@ -0,0 +1,127 @@
+import logging
+import os
+import threading
+from collections import Counter
+
+from market_data import quote_summary
+
+POLL_INTERVAL = float(os.environ.get('STREAM_POLL_INTERVAL', 15))
+
+
+class Subscription:
+    """
+    One client's view of the price stream. Updates that arrive before the
+    client reads them are merged per symbol, so a slow reader only ever holds
+    the latest quote for each of its symbols.
+    """
+
+    def __init__(self, symbols):
+        self.symbols = frozenset(symbols)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    def push(self, updates):
+        relevant = {symbol: quote for symbol, quote in updates.items() if symbol in self.symbols}
+        if relevant:
+            with self._lock:
+                self._pending.update(relevant)
+            self._ready.set()
+
+    def get(self, timeout=None):
+        """Wait up to timeout seconds and return the merged updates (possibly empty)."""
+        self._ready.wait(timeout)
+        with self._lock:
+            updates, self._pending = self._pending, {}
+            self._ready.clear()
+        return updates
+
+
+class PriceStreamer:
+    """
+    Shared polling scheduler behind the price stream.
+
+    Symbols are reference counted across subscriptions; one background thread
+    fetches every distinct subscribed symbol with a single batched quotes call
+    per interval and pushes only the quotes that changed. A symbol stops being
+    polled as soon as its last subscriber leaves.
+    """
+
+    def __init__(self, provider, interval=POLL_INTERVAL):
+        self.provider = provider
+        self.interval = interval
+        self.polls = 0
+        self._refcounts = Counter()
+        self._subscriptions = set()
+        self._last = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, symbols):
+        subscription = Subscription(symbols)
+        with self._lock:
+            self._subscriptions.add(subscription)
+            self._refcounts.update(subscription.symbols)
+            # Start new subscribers off with whatever is already known
+            subscription.push({symbol: self._last[symbol] for symbol in subscription.symbols if symbol in self._last})
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='price-streamer', daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription not in self._subscriptions:
+                return
+            self._subscriptions.discard(subscription)
+            self._refcounts.subtract(subscription.symbols)
+            for symbol in subscription.symbols:
+                if self._refcounts[symbol] <= 0:
+                    del self._refcounts[symbol]
+                    self._last.pop(symbol, None)
+
+    def symbols(self):
+        with self._lock:
+            return sorted(self._refcounts)
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def poll_once(self):
+        symbols = self.symbols()
+        if not symbols:
+            return {}
+        quotes, errors = self.provider.quotes(symbols)
+        self.polls += 1
+
+        current = {symbol: quote_summary(quote) for symbol, quote in quotes.items()}
+        current.update({symbol: {"error": error} for symbol, error in errors.items()})
+        with self._lock:
+            changed = {
+                symbol: quote for symbol, quote in current.items()
+                if symbol in self._refcounts and self._last.get(symbol) != quote
+            }
+            self._last.update(changed)
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.push(changed)
+        return changed
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self.symbols():
+                # Nothing to poll; sleep until someone subscribes
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            try:
+                self.poll_once()
+            except Exception as e:
+                logging.error(f"Error polling streamed quotes: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
@@ -0,0 +1,208 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from backtest import ArrayPriceSource, MovingAverageCross, run_backtest
+
+# Worker-side state, set once per process by _init_worker
+_worker = {}
+
+
+def _init_worker(shm_name, shape, dtype, timestamps, symbols):
+    # Attach to the parent's shared closes matrix; nothing is copied
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker['shm'] = shm
+    _worker['closes'] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    _worker['timestamps'] = timestamps
+    _worker['symbols'] = symbols
+
+
+def data_digest(timestamps, closes):
+    """Hash of the bars a task runs on, so checkpoints never outlive their input data."""
+    digest = hashlib.sha1(np.ascontiguousarray(timestamps, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(closes, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def task_id(params, symbols, data, strategy='', initial_cash=None):
+    key = json.dumps({'params': params, 'symbols': symbols, 'data': data, 'strategy': strategy,
+                      'initial_cash': initial_cash}, sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def summarize(result, initial_cash):
+    equity = result.equity
+    if len(equity) == 0:
+        return {'final_equity': initial_cash, 'total_return': 0.0, 'max_drawdown': 0.0,
+                'sharpe': 0.0, 'realized_pnl': 0.0, 'unrealized_pnl': 0.0, 'fills': 0}
+    peaks = np.maximum.accumulate(equity)
+    returns = np.diff(equity) / equity[:-1] if len(equity) > 1 else np.zeros(1)
+    volatility = returns.std()
+    return {
+        'final_equity': float(equity[-1]),
+        'total_return': float(equity[-1] / initial_cash - 1),
+        'max_drawdown': float(((peaks - equity) / peaks).max()),
+        'sharpe': float(returns.mean() / volatility * np.sqrt(252)) if volatility > 0 else 0.0,
+        'realized_pnl': float(result.realized_pnl[-1]),
+        'unrealized_pnl': float(result.unrealized_pnl[-1]),
+        'fills': int(len(result.fills['quantity']))
+    }
+
+
+def _run_task(task):
+    tid, strategy_cls, params, columns, initial_cash = task
+    closes = _worker['closes']
+    symbols = [_worker['symbols'][column] for column in columns]
+    # Only the task's own columns are gathered out of shared memory
+    source = ArrayPriceSource(_worker['timestamps'], closes[:, columns], symbols)
+    start = time.perf_counter()
+    result = run_backtest(strategy_cls(**params), source, symbols, initial_cash=initial_cash)
+    metrics = summarize(result, initial_cash)
+    metrics['seconds'] = time.perf_counter() - start
+    return {'task_id': tid, 'params': params, 'symbols': symbols, 'worker': os.getpid(), 'metrics': metrics}
+
+
+def load_checkpoint(path):
+    done = {}
+    if path and os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    record = json.loads(line)
+                    done[record['task_id']] = record
+    return done
+
+
+def to_table(records):
+    """Flatten result records into one column-oriented dict of lists."""
+    rows = []
+    for record in records:
+        row = {'task_id': record['task_id'], 'symbols': ','.join(record['symbols']), 'worker': record['worker']}
+        row.update({f"param_{name}": value for name, value in record['params'].items()})
+        row.update(record['metrics'])
+        rows.append(row)
+    columns = list(dict.fromkeys(name for row in rows for name in row))
+    return {name: [row.get(name) for row in rows] for name in columns}
+
+
+def run_sweep(strategy_cls, param_grid, timestamps, closes, symbols, symbols_per_task=None,
+              workers=None, checkpoint=None, initial_cash=100000.0, progress=None):
+    """
+    Run strategy_cls(**params) for every params in param_grid over every group
+    of symbols_per_task symbols (all symbols together by default), sharded
+    across a process pool.
+
+    The closes matrix is placed in shared memory once and mapped by every
+    worker. Finished tasks are appended to the checkpoint file (JSON lines) as
+    they complete, and tasks already in it are skipped, so an interrupted
+    sweep resumes where it stopped. Tasks are keyed by their params, symbols
+    and a hash of their price data. progress(completed, total, per_worker) is
+    called after every task. Returns the results as a columnar table.
+    """
+    closes = np.ascontiguousarray(closes, dtype=np.float64)
+    symbols = list(symbols)
+    size = symbols_per_task or len(symbols)
+    groups = [list(range(i, min(i + size, len(symbols)))) for i in range(0, len(symbols), size)]
+
+    # A checkpoint written for other bars, another strategy or another
+    # starting balance has different task ids, so none of it is reused
+    digests = [data_digest(timestamps, closes[:, columns]) for columns in groups]
+    done = load_checkpoint(checkpoint)
+    tasks = []
+    records = []
+    for params, (columns, digest) in itertools.product(param_grid, zip(groups, digests)):
+        tid = task_id(params, [symbols[c] for c in columns], digest, strategy_cls.__name__, initial_cash)
+        if tid in done:
+            records.append(done[tid])
+        else:
+            tasks.append((tid, strategy_cls, params, columns, initial_cash))
+    total = len(records) + len(tasks)
+    per_worker = {}
+
+    if tasks:
+        shm = shared_memory.SharedMemory(create=True, size=max(closes.nbytes, 1))
+        try:
+            np.ndarray(closes.shape, dtype=closes.dtype, buffer=shm.buf)[:] = closes
+            initargs = (shm.name, closes.shape, closes.dtype.str, np.asarray(timestamps, dtype=np.float64), symbols)
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool, \
+                    open(checkpoint or os.devnull, 'a') as log:
+                futures = [pool.submit(_run_task, task) for task in tasks]
+                for future in as_completed(futures):
+                    record = future.result()
+                    records.append(record)
+                    log.write(json.dumps(record) + '\n')
+                    log.flush()
+                    per_worker[record['worker']] = per_worker.get(record['worker'], 0) + 1
+                    if progress:
+                        progress(len(records), total, per_worker)
+        finally:
+            shm.close()
+            shm.unlink()
+
+    return to_table(records)
+
+
+def _print_progress(completed, total, per_worker):
+    workers = ', '.join(f"{pid}: {count}" for pid, count in sorted(per_worker.items()))
+    print(f"\r{completed}/{total} tasks ({workers})", end='', file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep moving-average crossover parameters across symbols in parallel")
+    parser.add_argument('--fast', default='10,20', help="comma separated fast windows")
+    parser.add_argument('--slow', default='50,100', help="comma separated slow windows")
+    parser.add_argument('--symbols', help="comma separated symbols from the bar store (default: all daily bars)")
+    parser.add_argument('--synthetic', type=int, metavar='N', help="use N synthetic random-walk symbols instead of the bar store")
+    parser.add_argument('--years', type=int, default=10, help="years of synthetic data")
+    parser.add_argument('--symbols-per-task', type=int, default=1)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--checkpoint', default='sweep_checkpoint.jsonl')
+    parser.add_argument('--out', default='sweep_results.csv')
+    parser.add_argument('--db', default='portfolio.db')
+    args = parser.parse_args(argv)
+
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        bars = args.years * 252
+        closes = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.02, (bars, args.synthetic)), axis=0))
+        timestamps = 1262304000 + np.arange(bars) * 86400.0
+        symbols = [f"SYM{i}" for i in range(args.synthetic)]
+    else:
+        from backtest import BarStorePriceSource
+        from db import connect
+        conn = connect(args.db)
+        try:
+            if args.symbols:
+                symbols = args.symbols.split(',')
+            else:
+                symbols = [row[0] for row in conn.execute("SELECT DISTINCT symbol FROM bars WHERE interval = '1d' ORDER BY symbol")]
+            timestamps, closes = BarStorePriceSource(conn).load(symbols)
+        finally:
+            conn.close()
+
+    grid = [{'fast': fast, 'slow': slow}
+            for fast in map(int, args.fast.split(',')) for slow in map(int, args.slow.split(','))
+            if fast < slow]
+    start = time.perf_counter()
+    table = run_sweep(MovingAverageCross, grid, timestamps, closes, symbols, args.symbols_per_task,
+                      args.workers, args.checkpoint, progress=_print_progress)
+    print(file=sys.stderr)
+
+    import pandas as pd
+    frame = pd.DataFrame(table)
+    frame.to_csv(args.out, index=False)
+    print(f"{len(frame)} simulations in {time.perf_counter() - start:.2f}s, results written to {args.out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    import db
+    import app as webapp
+    from market_data import create_provider
+    monkeypatch.setattr(db, 'DB_PATH', str(tmp_path / 'portfolio.db'))
+    monkeypatch.setattr(webapp, '_schema_ready', False)
+    monkeypatch.setattr(webapp, '_history_key', None)
+    # No background threads in tests
+    monkeypatch.setattr(webapp, '_background_pid', os.getpid())
+    flask_app = webapp.create_app(provider=create_provider('fixture'))
+    yield flask_app.test_client()
+    db.pool.close_all()
@@ -0,0 +1,80 @@
+import math
+import os
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from db import connect
+from history import update_history
+from ledger import init_ledger, record_trade, replay
+from migrations import migrate
+
+# Positions that close on one day and reopen on a later one, so the snapshots
+# carry them across day boundaries and across incremental runs
+TRADES = [
+    ('2025-01-02T15:00:00', 'AAA', 10, 100, 'Buy'),
+    ('2025-01-03T15:00:00', 'AAA', 10, 120, 'Sell'),
+    ('2025-01-06T15:00:00', 'AAA', 5, 50, 'Buy'),
+    ('2025-01-02T15:00:00', 'BBB', 10, 100, 'Short'),
+    ('2025-01-03T15:00:00', 'BBB', 10, 90, 'Buy'),
+    ('2025-01-06T15:00:00', 'BBB', 4, 80, 'Short'),
+    ('2025-01-07T15:00:00', 'BBB', 10, 70, 'Buy'),
+    ('2025-01-02T15:00:00', 'CCC', 10, 100, 'Short'),
+    ('2025-01-03T15:00:00', 'CCC', 5, 90, 'Buy'),
+    ('2025-01-06T15:00:00', 'CCC', 5, 60, 'Short'),
+]
+LAST_DAY = date(2025, 1, 7)
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = connect(str(tmp_path / 'portfolio.db'))
+    migrate(conn)
+    init_ledger(conn)
+    cursor = conn.cursor()
+    for time, asset, quantity, price, action in TRADES:
+        record_trade(cursor, asset, quantity, time, price, action)
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def holdings(conn, day):
+    cursor = conn.execute('SELECT asset, quantity, average_price FROM portfolio_holdings WHERE date = ?', (day,))
+    return {asset: (quantity, avg_price) for asset, quantity, avg_price in cursor.fetchall()}
+
+
+def assert_matches_ledger(conn):
+    _, _, positions = replay(conn.cursor())
+    expected = {asset: position for asset, position in positions.items() if position[0] != 0}
+    stored = holdings(conn, LAST_DAY.isoformat())
+    assert stored.keys() == expected.keys()
+    for asset, (quantity, avg_price) in expected.items():
+        assert math.isclose(stored[asset][0], quantity) and math.isclose(stored[asset][1], avg_price), asset
+
+
+def test_reopened_positions_match_ledger(conn):
+    update_history(conn, until=LAST_DAY)
+    assert_matches_ledger(conn)
+    assert holdings(conn, '2025-01-06')['AAA'] == (5, 50)
+
+
+def test_incremental_runs_match_ledger(conn):
+    update_history(conn, until=date(2025, 1, 3))
+    assert 'AAA' not in holdings(conn, '2025-01-03')
+    update_history(conn, until=LAST_DAY)
+    assert_matches_ledger(conn)
+
+
+def test_history_route_catches_up(client):
+    conn = connect()
+    yesterday = date.today() - timedelta(days=1)
+    record_trade(conn.cursor(), 'AAA', 10, f'{yesterday.isoformat()}T15:00:00', 100, 'Buy')
+    conn.commit()
+    conn.close()
+
+    snapshots = client.get('/api/portfoliohistory?holdings=1').json
+    assert [snapshot['Date'] for snapshot in snapshots] == [yesterday.isoformat()]
+    assert snapshots[0]['Holdings'][0]['Quantity'] == 10
@@ -0,0 +1,54 @@
+import math
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from ledger import apply_position
+from portfolio import Portfolio, ActionType
+
+# Each case is a sequence of (quantity, price, action) trades on one asset;
+# the ledger's position arithmetic must agree with Portfolio.add_trade
+CASES = {
+    'open long': [(10, 100, 'Buy')],
+    'add to long': [(10, 100, 'Buy'), (10, 80, 'Buy')],
+    'reduce long': [(10, 100, 'Buy'), (4, 120, 'Sell')],
+    'close long': [(10, 100, 'Buy'), (10, 120, 'Sell')],
+    'reopen long': [(10, 100, 'Buy'), (10, 120, 'Sell'), (5, 50, 'Buy')],
+    'flip long to short': [(10, 100, 'Buy'), (15, 120, 'Sell')],
+    'open short': [(10, 100, 'Short')],
+    'sell from flat': [(10, 100, 'Sell')],
+    'add to short': [(10, 100, 'Short'), (10, 80, 'Short')],
+    'cover short': [(10, 100, 'Short'), (5, 90, 'Buy')],
+    'close short': [(10, 100, 'Short'), (10, 90, 'Buy')],
+    'reopen short': [(10, 100, 'Short'), (10, 90, 'Buy'), (5, 50, 'Short')],
+    'flip short to long': [(10, 100, 'Short'), (5, 90, 'Buy'), (15, 90, 'Buy')],
+    'short a long': [(10, 100, 'Buy'), (5, 120, 'Short')],
+}
+
+
+def portfolio_position(trades):
+    portfolio = Portfolio()
+    for i, (quantity, price, action) in enumerate(trades):
+        portfolio.add_trade('SYM', i, quantity, ActionType(action), price=price)
+    return float(portfolio.quantities[0]), float(portfolio.average_prices[0])
+
+
+@pytest.mark.parametrize('name', sorted(CASES))
+def test_apply_position_matches_portfolio(name):
+    position = None
+    for quantity, price, action in CASES[name]:
+        position = apply_position(position, quantity, price, action)
+    expected = portfolio_position(CASES[name])
+    assert all(math.isclose(a, b) for a, b in zip(position, expected)), (position, expected)
+
+
+def test_cover_keeps_short_average():
+    position = apply_position(apply_position(None, 10, 100, 'Short'), 5, 90, 'Buy')
+    assert position == (-5, 100)
+
+
+def test_flip_starts_new_average():
+    position = apply_position((-5, 100), 15, 90, 'Buy')
+    assert position == (10, 90)
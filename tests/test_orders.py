@@ -0,0 +1,83 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from db import connect
+from ledger import init_ledger, verify
+from migrations import migrate
+from orders import MatchingEngine, apply_events, create_order, load_working_orders
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = connect(str(tmp_path / 'portfolio.db'))
+    migrate(conn)
+    init_ledger(conn)
+    yield conn
+    conn.close()
+
+
+def place(conn, *args, **kwargs):
+    order = create_order(conn.cursor(), *args, **kwargs)
+    conn.commit()
+    return order
+
+
+def trade_count(conn):
+    return conn.execute('SELECT COUNT(*) FROM trades').fetchone()[0]
+
+
+def test_fill_is_recorded_once(conn):
+    order = place(conn, 'AAA', 'Buy', 10, 'limit', limit_price=100)
+    # Two processes matching the same working order on the same tick
+    engines = [MatchingEngine(), MatchingEngine()]
+    events = []
+    for engine in engines:
+        load_working_orders(conn, engine)
+        events.append(engine.on_tick('AAA', 95))
+
+    assert len(apply_events(conn, events[0])) == 1
+    assert apply_events(conn, events[1]) == []
+    assert trade_count(conn) == 1
+    row = conn.execute('SELECT status, fill_price, trade_id FROM orders WHERE id = ?', (order.id,)).fetchone()
+    assert tuple(row) == ('filled', 95, 1)
+    assert verify(conn) == []
+
+
+def test_cancelled_order_is_not_filled(conn):
+    order = place(conn, 'AAA', 'Sell', 5, 'stop', stop_price=90)
+    engine = MatchingEngine()
+    load_working_orders(conn, engine)
+    conn.execute("UPDATE orders SET status = 'cancelled' WHERE id = ?", (order.id,))
+    conn.commit()
+
+    assert apply_events(conn, engine.on_tick('AAA', 85)) == []
+    assert trade_count(conn) == 0
+    assert conn.execute('SELECT status FROM orders WHERE id = ?', (order.id,)).fetchone()[0] == 'cancelled'
+
+
+def test_cancel_order_this_process_does_not_hold(client):
+    # Placed by another worker: in the database but not on this engine
+    conn = connect()
+    order = place(conn, 'AAA', 'Buy', 10, 'limit', limit_price=100)
+    conn.close()
+
+    response = client.delete(f'/api/orders/{order.id}')
+    assert response.status_code == 200, response.json
+    assert client.delete(f'/api/orders/{order.id}').status_code == 409
+    statuses = [row['Status'] for row in client.get('/api/orders').json]
+    assert statuses == ['cancelled']
+
+
+def test_lease_has_one_holder(conn):
+    from db import acquire_lease, release_lease
+    assert acquire_lease(conn, 'job', 'a', ttl=60, now=1000)
+    assert not acquire_lease(conn, 'job', 'b', ttl=60, now=1030)
+    assert acquire_lease(conn, 'job', 'a', ttl=60, now=1030)
+    # Taken over only after the holder stops renewing
+    assert acquire_lease(conn, 'job', 'b', ttl=60, now=1100)
+    assert not acquire_lease(conn, 'job', 'a', ttl=60, now=1110)
+    release_lease(conn, 'job', 'b')
+    assert acquire_lease(conn, 'job', 'a', ttl=60, now=1120)
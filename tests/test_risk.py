@@ -0,0 +1,47 @@
+import math
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from db import connect
+from history import update_history
+from ledger import init_ledger, record_trade
+from migrations import migrate
+from risk import portfolio_risk
+
+FIRST_DAY = date(2025, 1, 2)
+DAYS = 30
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = connect(str(tmp_path / 'portfolio.db'))
+    migrate(conn)
+    init_ledger(conn)
+    cursor = conn.cursor()
+    record_trade(cursor, 'AAA', 10, '2025-01-02T15:00:00', 100, 'Buy')
+    record_trade(cursor, 'EEE', 20, '2025-01-02T15:00:00', 50, 'Buy', quote_currency='EUR', fx_rate=1.1)
+    bars = []
+    for i in range(DAYS):
+        day = FIRST_DAY + timedelta(days=i)
+        ts = datetime(day.year, day.month, day.day).timestamp()
+        for symbol, close in (('AAA', 100 + i), ('EEE', 50 + i / 2), ('EURUSD=X', 1.1 + i / 100)):
+            bars.append((symbol, '1d', ts, day.isoformat(), close, close, close, close, 0))
+    cursor.executemany('INSERT INTO bars VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', bars)
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_risk_values_positions_like_history(conn):
+    last_day = FIRST_DAY + timedelta(days=DAYS - 1)
+    update_history(conn, until=last_day)
+    risk = portfolio_risk(conn, as_of=last_day, benchmark=None)
+    cursor = conn.execute('SELECT asset, market_value FROM portfolio_holdings WHERE date = ?', (last_day.isoformat(),))
+    for asset, market_value in cursor.fetchall():
+        assert math.isclose(risk['assets'][asset]['exposure'], market_value), asset
+    # The euro position is converted at the last EURUSD close
+    assert math.isclose(risk['assets']['EEE']['exposure'], 20 * (50 + 29 / 2) * (1.1 + 29 / 100))
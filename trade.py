@@ -13,7 +13,9 @@ class TradeType(Enum):
     COMMODITY = "Commodity"
 
 class Trade:
-    
+    __slots__ = ('asset', 'time', 'quantity', 'price', 'trade_type', 'action', 'short_date',
+                 'base_currency', 'quote_currency', 'unit')
+
     def __init__(self, asset: str, time: datetime, quantity: int, price: float, trade_type: TradeType, 
                  action: ActionType, short_date: Optional[datetime] = None,
                  base_currency: Optional[str] = None, quote_currency: Optional[str] = None, 
@@ -40,15 +42,20 @@ class Trade:
         return details
     
     def to_dict(self):
-        return {
+        # Type-specific fields are only included when they apply
+        trade = {
             "Asset": self.asset,
             "Quantity": self.quantity,
             "Price": self.price,
             "Trade Type": self.trade_type.value,
             "Action": self.action.value,
-            "Time": self.time,
-            "Short Date": self.short_date,
-            "Base Currency": self.base_currency,
-            "Quote Currency": self.quote_currency,
-            "Unit": self.unit
+            "Time": self.time
         }
+        if self.action == ActionType.SHORT:
+            trade["Short Date"] = self.short_date
+        if self.trade_type == TradeType.CURRENCY:
+            trade["Base Currency"] = self.base_currency
+            trade["Quote Currency"] = self.quote_currency
+        if self.trade_type == TradeType.COMMODITY:
+            trade["Unit"] = self.unit
+        return trade
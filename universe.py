@@ -0,0 +1,278 @@
+import argparse
+import csv
+import logging
+import os
+import sys
+import threading
+import time
+from itertools import islice
+
+from market_data import UnknownSymbolError
+from quote_cache import LRUCache, SingleFlight
+
+# The tradable symbols, read from local listing files: CSV with symbol and
+# name columns, or the pipe-delimited symbol directories published by NASDAQ
+# (nasdaqlisted.txt, otherlisted.txt). Several files are joined with the path
+# separator. Files are re-read in the background when they change.
+SYMBOL_LISTINGS = os.environ.get('SYMBOL_LISTINGS',
+                                 os.path.join(os.path.dirname(__file__), 'fixtures', 'symbols.csv'))
+SYMBOL_REFRESH_INTERVAL = float(os.environ.get('SYMBOL_REFRESH_INTERVAL', 3600))
+
+# Seconds a ticker check is remembered. Tickers rarely stop existing, and
+# misspelt ones are rechecked sooner in case they were just listed.
+VALID_TTL = float(os.environ.get('SYMBOL_VALID_TTL', 86400))
+INVALID_TTL = float(os.environ.get('SYMBOL_INVALID_TTL', 600))
+
+SYMBOL_COLUMNS = ('symbol', 'act symbol', 'ticker')
+NAME_COLUMNS = ('security name', 'name', 'company name')
+
+
+def read_listing(path):
+    """Return [(symbol, name)] from one listing file."""
+    with open(path, newline='') as f:
+        header = f.readline()
+        delimiter = '|' if header.count('|') > header.count(',') else ','
+        columns = [column.strip().lower() for column in next(csv.reader([header], delimiter=delimiter))]
+        symbol_index = next((columns.index(name) for name in SYMBOL_COLUMNS if name in columns), None)
+        if symbol_index is None:
+            raise ValueError(f"{path} has no symbol column")
+        name_index = next((columns.index(name) for name in NAME_COLUMNS if name in columns), None)
+        test_index = columns.index('test issue') if 'test issue' in columns else None
+
+        listings = []
+        for row in csv.reader(f, delimiter=delimiter):
+            # NASDAQ files end with a "File Creation Time" footer line
+            if len(row) <= symbol_index or row[0].startswith('File Creation Time'):
+                continue
+            if test_index is not None and len(row) > test_index and row[test_index] == 'Y':
+                continue
+            symbol = row[symbol_index].strip().upper()
+            if symbol:
+                listings.append((symbol, row[name_index].strip() if name_index is not None else ''))
+        return listings
+
+
+class _Node:
+    __slots__ = ('children', 'values')
+
+    def __init__(self):
+        self.children = {}
+        self.values = None
+
+
+class PrefixTrie:
+    """Maps string keys to values and lists the values of every key under a prefix in key order."""
+
+    def __init__(self):
+        self.root = _Node()
+
+    def insert(self, key, value):
+        node = self.root
+        for char in key:
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = _Node()
+            node = child
+        if node.values is None:
+            node.values = {}
+        # A dict keeps insertion order and makes duplicates free to skip
+        node.values[value] = None
+
+    def search(self, prefix, limit):
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        # Depth first in key order, so shorter and alphabetically earlier keys come first
+        found = []
+        stack = [node]
+        while stack and len(found) < limit:
+            node = stack.pop()
+            if node.values:
+                found.extend(islice(node.values, limit - len(found)))
+            stack.extend(node.children[char] for char in sorted(node.children, reverse=True))
+        return found
+
+
+class SymbolUniverse:
+    """
+    The symbol listings held in memory, with one prefix trie over symbols and
+    one over the words of company names. A reload builds new tries and swaps
+    them in whole, so lookups never see a half-built index.
+    """
+
+    def __init__(self, paths=SYMBOL_LISTINGS, refresh_interval=SYMBOL_REFRESH_INTERVAL):
+        self.paths = [path for path in paths.split(os.pathsep) if path] if isinstance(paths, str) else list(paths)
+        self.refresh_interval = refresh_interval
+        self.loaded_at = None
+        self._index = ({}, PrefixTrie(), PrefixTrie())
+        self._mtimes = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def names(self):
+        """{symbol: name} for every listed symbol."""
+        return self._index[0]
+
+    def __contains__(self, symbol):
+        return symbol in self.names
+
+    def __len__(self):
+        return len(self.names)
+
+    def _stat(self):
+        mtimes = {}
+        for path in self.paths:
+            try:
+                mtimes[path] = os.stat(path).st_mtime
+            except OSError:
+                mtimes[path] = None
+        return mtimes
+
+    def load(self):
+        """Read every listing file and rebuild the index; returns the number of symbols."""
+        with self._lock:
+            mtimes = self._stat()
+            names = {}
+            for path, mtime in mtimes.items():
+                if mtime is None:
+                    logging.warning(f"Symbol listing {path} not found")
+                    continue
+                try:
+                    for symbol, name in read_listing(path):
+                        names.setdefault(symbol, name)
+                except (OSError, ValueError) as e:
+                    logging.error(f"Could not read symbol listing {path}: {e}")
+
+            symbols, words = PrefixTrie(), PrefixTrie()
+            for symbol in sorted(names):
+                symbols.insert(symbol, symbol)
+                for word in names[symbol].upper().split():
+                    words.insert(word, symbol)
+            self._index = (names, symbols, words)
+            self._mtimes = mtimes
+            self.loaded_at = time.time()
+            return len(names)
+
+    def refresh(self):
+        """Reload if any listing file changed since the last load."""
+        if self._stat() != self._mtimes:
+            count = self.load()
+            logging.info(f"Reloaded symbol universe: {count} symbols")
+            return True
+        return False
+
+    def search(self, query, limit=10):
+        """
+        Return up to limit (symbol, name) pairs: symbols starting with the
+        query first, then companies with a name word starting with it.
+        """
+        query = query.strip().upper()
+        if not query:
+            return []
+        names, symbols, words = self._index
+        matches = symbols.search(query, limit)
+        if len(matches) < limit:
+            # One company can have several matching words, so over-fetch
+            matches = list(dict.fromkeys(matches + words.search(query, limit * 4)))
+        return [(symbol, names[symbol]) for symbol in matches[:limit]]
+
+    def start(self):
+        """Load unless already loaded and keep re-reading changed listing files every refresh_interval seconds."""
+        if self.loaded_at is None:
+            self.load()
+        if self._thread is None and self.refresh_interval > 0:
+            self._thread = threading.Thread(target=self._run, name='symbol-universe', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.error(f"Error refreshing symbol universe: {e}")
+
+
+class TickerValidator:
+    """
+    Decides whether a ticker exists. Listed symbols are valid without any
+    call; anything else is checked upstream once. A symbol with history is
+    remembered as valid for VALID_TTL seconds, and one the provider reports as
+    unknown is remembered as invalid for INVALID_TTL seconds. An empty history
+    or any other failure is not remembered.
+    """
+
+    def __init__(self, universe, provider, valid_ttl=VALID_TTL, invalid_ttl=INVALID_TTL, max_entries=4096,
+                 clock=time.monotonic):
+        self.universe = universe
+        self.provider = provider
+        self.valid_ttl = valid_ttl
+        self.invalid_ttl = invalid_ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._valid = LRUCache(max_entries)
+        self._invalid = LRUCache(max_entries)
+        self._flight = SingleFlight()
+
+    def _check(self, symbol):
+        try:
+            bars = self.provider.history(symbol, "1d", "1d")
+        except UnknownSymbolError:
+            self._invalid.set(symbol, self.clock())
+            return False
+        except Exception as e:
+            logging.warning(f"Could not validate {symbol}: {e}")
+            return False
+        if not bars:
+            # yfinance answers a network failure with an empty history too
+            logging.warning(f"Could not validate {symbol}: no history")
+            return False
+        self._valid.set(symbol, self.clock())
+        return True
+
+    def is_valid(self, symbol):
+        symbol = (symbol or '').strip().upper()
+        if not symbol:
+            return False
+        if symbol in self.universe:
+            self.hits += 1
+            return True
+        now = self.clock()
+        for cache, ttl, valid in ((self._valid, self.valid_ttl, True), (self._invalid, self.invalid_ttl, False)):
+            checked_at = cache.get(symbol)
+            if checked_at is not None and now - checked_at < ttl:
+                self.hits += 1
+                return valid
+        self.misses += 1
+        return self._flight.do(symbol, lambda: self._check(symbol))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search the symbol universe")
+    parser.add_argument('query')
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--listings', default=SYMBOL_LISTINGS, help="listing files, separated by the path separator")
+    args = parser.parse_args(argv)
+
+    universe = SymbolUniverse(args.listings, refresh_interval=0)
+    start = time.perf_counter()
+    count = universe.load()
+    loaded = time.perf_counter() - start
+    start = time.perf_counter()
+    matches = universe.search(args.query, args.limit)
+    elapsed = time.perf_counter() - start
+    for symbol, name in matches:
+        print(f"{symbol:<10} {name}")
+    print(f"{count} symbols loaded in {loaded * 1000:.1f} ms, search took {elapsed * 1e6:.0f} us")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())